@@ -1,7 +1,31 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import Profile, Post, Comment, Like, Notification, Hashtag
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.shortcuts import redirect
+from django.urls import reverse
+from django.utils.http import urlencode
+from .deletion import delete_account, delete_post
+from .models import (
+    Profile, Post, Comment, Like, Notification, ArchivedNotification, Hashtag, Task, FollowSuggestion, Deletion
+)
+from .pagination import EstimatedCountPaginator
+
+
+def count_of(queryset, field):
+    """``COUNT(*)`` of ``queryset`` rows whose ``field`` is the outer row, run only for the rows shown."""
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+        n=Count('pk')
+    ).values('n')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist of a table with millions of rows: estimated page count, no second full count."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 
 # Inline admin for Profile
 class ProfileInline(admin.StackedInline):
@@ -15,52 +39,97 @@ class UserAdmin(BaseUserAdmin):
     inlines = (ProfileInline,)
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff', 'date_joined')
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'date_joined')
+    actions = ['export_data', 'delete_in_background']
+
+    @admin.action(description='Export all data of the selected user')
+    def export_data(self, request, queryset):
+        usernames = list(queryset.values_list('username', flat=True)[:2])
+        if len(usernames) != 1:
+            self.message_user(request, 'Select exactly one user to export.', messages.WARNING)
+            return None
+        query = urlencode({'username': usernames[0], 'format': 'zip'})
+        return redirect(f"{reverse('export_data')}?{query}")
+
+    @admin.action(description='Delete selected accounts in the background', permissions=['delete'])
+    def delete_in_background(self, request, queryset):
+        users = list(queryset.filter(is_active=True))
+        for user in users:
+            delete_account(user)
+        self.message_user(request, f"{len(users)} account(s) deactivated; their data is being purged.")
 
 # Re-register UserAdmin
 admin.site.unregister(User)
 admin.site.register(User, UserAdmin)
 
 @admin.register(Profile)
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(LargeTableAdmin):
     list_display = ('user', 'location', 'is_verified', 'followers_count', 'following_count', 'created_at')
     list_filter = ('is_verified', 'created_at')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'user__email', 'bio', 'location')
     readonly_fields = ('created_at', 'followers_count', 'following_count')
-    
+    raw_id_fields = ('user', 'follows')
+
+    def get_queryset(self, request):
+        follows = Profile.follows.through.objects
+        return super().get_queryset(request).annotate(
+            followers_total=count_of(follows, 'to_profile'),
+            following_total=count_of(follows, 'from_profile'),
+        )
+
+    @admin.display(description='Followers', ordering='followers_total')
     def followers_count(self, obj):
-        return obj.followers_count
-    followers_count.short_description = 'Followers'
-    
+        return obj.followers_total
+
+    @admin.display(description='Following', ordering='following_total')
     def following_count(self, obj):
-        return obj.following_count
-    following_count.short_description = 'Following'
+        return obj.following_total
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(LargeTableAdmin):
     list_display = ('user', 'content_preview', 'likes_count', 'comments_count', 'is_pinned', 'created_at')
     list_filter = ('is_pinned', 'created_at', 'updated_at')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'content')
     readonly_fields = ('created_at', 'updated_at', 'likes_count', 'comments_count')
+    raw_id_fields = ('user',)
     date_hierarchy = 'created_at'
+    actions = ['delete_in_background']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            likes_total=count_of(Like.objects, 'post'),
+            comments_total=count_of(Comment.objects, 'post'),
+        )
     
     def content_preview(self, obj):
         return obj.content[:50] + '...' if len(obj.content) > 50 else obj.content
     content_preview.short_description = 'Content'
-    
+
+    @admin.display(description='Likes', ordering='likes_total')
     def likes_count(self, obj):
-        return obj.likes_count
-    likes_count.short_description = 'Likes'
-    
+        return obj.likes_total
+
+    @admin.display(description='Comments', ordering='comments_total')
     def comments_count(self, obj):
-        return obj.comments_count
-    comments_count.short_description = 'Comments'
+        return obj.comments_total
+
+    @admin.action(description='Delete selected posts in the background', permissions=['delete'])
+    def delete_in_background(self, request, queryset):
+        posts = list(queryset.only('pk', 'user_id', 'content'))
+        for post in posts:
+            delete_post(post)
+        self.message_user(request, f"{len(posts)} post(s) hidden; they are being purged.")
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = ('user', 'post_preview', 'text_preview', 'is_reply', 'created_at')
-    list_filter = ('created_at', 'parent')
+    # A plain 'parent' filter would list every comment as a choice
+    list_filter = ('created_at', ('parent', admin.EmptyFieldListFilter))
+    list_select_related = ('user', 'post__user')
     search_fields = ('user__username', 'text', 'post__content')
     readonly_fields = ('created_at',)
+    raw_id_fields = ('post', 'user', 'parent')
     date_hierarchy = 'created_at'
     
     def post_preview(self, obj):
@@ -72,11 +141,13 @@ class CommentAdmin(admin.ModelAdmin):
     text_preview.short_description = 'Comment'
 
 @admin.register(Like)
-class LikeAdmin(admin.ModelAdmin):
+class LikeAdmin(LargeTableAdmin):
     list_display = ('user', 'post_preview', 'created_at')
     list_filter = ('created_at',)
+    list_select_related = ('user', 'post__user')
     search_fields = ('user__username', 'post__content')
     readonly_fields = ('created_at',)
+    raw_id_fields = ('user', 'post')
     date_hierarchy = 'created_at'
     
     def post_preview(self, obj):
@@ -84,27 +155,66 @@ class LikeAdmin(admin.ModelAdmin):
     post_preview.short_description = 'Post'
 
 @admin.register(Notification)
-class NotificationAdmin(admin.ModelAdmin):
+class NotificationAdmin(LargeTableAdmin):
     list_display = ('recipient', 'sender', 'notification_type', 'message_preview', 'is_read', 'created_at')
     list_filter = ('notification_type', 'is_read', 'created_at')
+    list_select_related = ('recipient', 'sender')
     search_fields = ('recipient__username', 'sender__username', 'message')
     readonly_fields = ('created_at',)
+    raw_id_fields = ('recipient', 'sender', 'post', 'comment')
     date_hierarchy = 'created_at'
     
     def message_preview(self, obj):
         return obj.message[:40] + '...' if len(obj.message) > 40 else obj.message
     message_preview.short_description = 'Message'
 
+@admin.register(ArchivedNotification)
+class ArchivedNotificationAdmin(NotificationAdmin):
+    list_display = ('recipient', 'sender', 'notification_type', 'message_preview', 'is_read', 'created_at', 'archived_at')
+    readonly_fields = ('created_at', 'archived_at')
+
 @admin.register(Hashtag)
-class HashtagAdmin(admin.ModelAdmin):
+class HashtagAdmin(LargeTableAdmin):
     list_display = ('name', 'posts_count', 'created_at')
     search_fields = ('name',)
     readonly_fields = ('created_at', 'posts_count')
+    raw_id_fields = ('posts',)
     date_hierarchy = 'created_at'
-    
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            posts_total=count_of(Hashtag.posts.through.objects, 'hashtag')
+        )
+
+    @admin.display(description='Posts Count', ordering='posts_total')
     def posts_count(self, obj):
-        return obj.posts_count
-    posts_count.short_description = 'Posts Count'
+        return obj.posts_total
+
+@admin.register(Task)
+class TaskAdmin(LargeTableAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_at', 'wait_ms', 'duration_ms', 'locked_by')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'wait_ms', 'duration_ms')
+    date_hierarchy = 'created_at'
+
+@admin.register(FollowSuggestion)
+class FollowSuggestionAdmin(LargeTableAdmin):
+    list_display = ('user', 'rank', 'suggested', 'score', 'mutual_count', 'shared_hashtags', 'computed_at')
+    search_fields = ('user__username', 'suggested__username')
+    list_select_related = ('user', 'suggested')
+    raw_id_fields = ('user', 'suggested')
+
+@admin.register(Deletion)
+class DeletionAdmin(admin.ModelAdmin):
+    list_display = ('kind', 'label', 'object_id', 'status', 'step', 'rows_deleted', 'files_deleted',
+                    'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    search_fields = ('label',)
+    readonly_fields = [field.name for field in Deletion._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
 
 # Customize admin site
 admin.site.site_header = "SocialHub Administration"
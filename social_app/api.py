@@ -0,0 +1,480 @@
+"""
+Read-only JSON API, version 1 (``/api/v1/``).
+
+Rows are read with ``values()`` projections of just the requested columns,
+never as model instances. Clients can narrow a response with
+``?fields=id,content,author``; computed fields (like counts, the viewer's
+liked/following flags, hashtags) cost nothing unless they are asked for.
+Lists are cursor paginated newest first: pass back ``next`` as ``?cursor=``
+to get the following page. With ``orjson`` installed responses are encoded
+by it, otherwise by the standard library encoder with compact separators.
+"""
+
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Exists, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
+
+from .graph import follow_graph
+from .likes import like_counts
+from .models import ArchivedNotification, Comment, Hashtag, Like, Notification, Post, Profile
+from .threads import decode_cursor, make_cursor
+from .versions import get_versions, post_scope, user_scope
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class APIResponse(HttpResponse):
+    def __init__(self, data, status=200):
+        if orjson is not None:
+            content = orjson.dumps(data, option=orjson.OPT_UTC_Z)
+        else:
+            content = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+        super().__init__(content, content_type='application/json', status=status)
+
+
+def api_view(view):
+    """GET-only, session-authenticated, with ``APIError`` turned into a JSON error body."""
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if request.method != 'GET':
+            return APIResponse({'error': 'Method not allowed'}, status=405)
+        if not request.user.is_authenticated:
+            return APIResponse({'error': 'Authentication required'}, status=401)
+        try:
+            return view(request, *args, **kwargs)
+        except APIError as e:
+            return APIResponse({'error': str(e)}, status=e.status)
+    return inner
+
+
+def requested_fields(request, available):
+    """Fields named in ``?fields=``, in the resource's order; all of them by default."""
+    raw = request.GET.get('fields')
+    if not raw:
+        return list(available)
+    wanted = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = wanted - set(available)
+    if unknown:
+        raise APIError(f"Unknown field(s): {', '.join(sorted(unknown))}")
+    return [name for name in available if name in wanted]
+
+
+def page_size(request):
+    default = getattr(settings, 'API_PAGE_SIZE', 20)
+    try:
+        size = int(request.GET.get('limit', default))
+    except ValueError:
+        raise APIError('limit must be an integer')
+    return max(1, min(size, getattr(settings, 'API_MAX_PAGE_SIZE', 100)))
+
+
+def project(queryset, columns, fields, extra=('id', 'created_at')):
+    """``values()`` of the columns behind the requested ``fields``, plus ``extra`` names."""
+    return queryset.values(*{columns[name] for name in fields if name in columns}, *extra)
+
+
+def shape(row, columns, fields):
+    """Rename a ``values()`` row's column paths to the requested API field names."""
+    return {name: row[columns[name]] for name in fields if name in columns}
+
+
+def newest_first(queryset, cursor):
+    position = decode_cursor(cursor)
+    if position is not None:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    return queryset.order_by('-created_at', '-pk')
+
+
+def cursor_page(rows, limit):
+    """Split a fetch of ``limit + 1`` rows into the page and the next cursor."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, make_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    return rows, None
+
+
+def _file_url(field, name):
+    return field.storage.url(name) if name else None
+
+
+def _hashtags_by_post(post_ids):
+    tags = {}
+    for post_id, name in Hashtag.posts.through.objects.filter(post_id__in=post_ids).order_by(
+        'hashtag__name'
+    ).values_list('post_id', 'hashtag__name'):
+        tags.setdefault(post_id, []).append(name)
+    return tags
+
+
+# --- Posts ---
+
+POST_COLUMNS = {
+    'id': 'id',
+    'content': 'content',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'is_pinned': 'is_pinned',
+    'image': 'image',
+    'video': 'video',
+    'author': 'user__username',
+    'author_avatar': 'user__profile__avatar',
+}
+POST_FIELDS = list(POST_COLUMNS) + ['liked', 'likes_count', 'comments_count', 'hashtags']
+FILE_FIELDS = {
+    'image': Post._meta.get_field('image'),
+    'video': Post._meta.get_field('video'),
+    'author_avatar': Profile._meta.get_field('avatar'),
+    'avatar': Profile._meta.get_field('avatar'),
+}
+
+
+def post_rows(queryset, viewer, fields, cursor=None, limit=None):
+    """Serialized posts; a page with its next cursor when ``limit`` is given."""
+    annotations = [name for name in ('liked', 'comments_count') if name in fields]
+    if 'liked' in fields:
+        queryset = queryset.annotate(liked=Exists(Like.objects.filter(user=viewer, post=OuterRef('pk'))))
+    if 'comments_count' in fields:
+        comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+            n=Count('pk')
+        ).values('n')
+        queryset = queryset.annotate(
+            comments_count=Coalesce(Subquery(comments, output_field=IntegerField()), 0)
+        )
+    values = project(queryset, POST_COLUMNS, fields, ('id', 'created_at', *annotations))
+
+    next_cursor = None
+    if limit is None:
+        rows = list(values)
+    else:
+        rows, next_cursor = cursor_page(list(newest_first(values, cursor)[:limit + 1]), limit)
+
+    ids = [row['id'] for row in rows]
+    counts = like_counts(ids) if 'likes_count' in fields else {}
+    tags = _hashtags_by_post(ids) if 'hashtags' in fields else {}
+
+    results = []
+    for row in rows:
+        item = shape(row, POST_COLUMNS, fields)
+        for name in annotations:
+            item[name] = row[name]
+        if 'likes_count' in fields:
+            item['likes_count'] = counts[row['id']]
+        if 'hashtags' in fields:
+            item['hashtags'] = tags.get(row['id'], [])
+        for name in ('image', 'video', 'author_avatar'):
+            if name in item:
+                item[name] = _file_url(FILE_FIELDS[name], item[name])
+        results.append({name: item[name] for name in fields})
+    return results, next_cursor
+
+
+def post_list(request, queryset):
+    fields = requested_fields(request, POST_FIELDS)
+    rows, next_cursor = post_rows(
+        queryset, request.user, fields, request.GET.get('cursor'), page_size(request)
+    )
+    return APIResponse({'results': rows, 'next': next_cursor})
+
+
+@api_view
+def feed(request):
+    """The global feed."""
+    return post_list(request, Post.objects.all())
+
+
+@api_view
+def following_feed(request):
+    """Posts by the accounts the viewer follows."""
+    return post_list(request, Post.objects.filter(user_id__in=follow_graph.following_ids(request.user.id)))
+
+
+@api_view
+def post_detail(request, post_id):
+    fields = requested_fields(request, POST_FIELDS)
+    rows, _ = post_rows(Post.objects.filter(pk=post_id), request.user, fields)
+    if not rows:
+        raise APIError('Post not found', status=404)
+    return APIResponse(rows[0])
+
+
+@api_view
+def hashtag_posts(request, hashtag_name):
+    hashtag_id = Hashtag.objects.filter(name=hashtag_name.lower()).values_list('pk', flat=True).first()
+    if hashtag_id is None:
+        raise APIError('Hashtag not found', status=404)
+    return post_list(request, Post.objects.filter(hashtags=hashtag_id))
+
+
+# --- Users ---
+
+USER_COLUMNS = {
+    'id': 'id',
+    'username': 'username',
+    'bio': 'profile__bio',
+    'location': 'profile__location',
+    'website': 'profile__website',
+    'avatar': 'profile__avatar',
+    'is_verified': 'profile__is_verified',
+    'joined': 'date_joined',
+}
+USER_FIELDS = list(USER_COLUMNS) + [
+    'followers_count', 'following_count', 'posts_count', 'is_following', 'follows_you',
+]
+
+
+@api_view
+def user_detail(request, username):
+    fields = requested_fields(request, USER_FIELDS)
+    queryset = User.objects.filter(username=username, is_active=True)
+    extra = ('id',)
+    if 'posts_count' in fields:
+        queryset = queryset.annotate(posts_count=Count('posts'))
+        extra += ('posts_count',)
+    row = project(queryset, USER_COLUMNS, fields, extra).first()
+    if row is None:
+        raise APIError('User not found', status=404)
+
+    user_id = row['id']
+    item = shape(row, USER_COLUMNS, fields)
+    if 'avatar' in item:
+        item['avatar'] = _file_url(FILE_FIELDS['avatar'], item['avatar'])
+    if 'posts_count' in fields:
+        item['posts_count'] = row['posts_count']
+    if 'followers_count' in fields:
+        item['followers_count'] = follow_graph.follower_count(user_id)
+    if 'following_count' in fields:
+        item['following_count'] = follow_graph.following_count(user_id)
+    relationship = follow_graph.relationships(request.user.id, [user_id])[user_id]
+    item['is_following'] = relationship['following']
+    item['follows_you'] = relationship['followed_by']
+    return APIResponse({name: item[name] for name in fields})
+
+
+@api_view
+def user_posts(request, username):
+    user_id = User.objects.filter(username=username, is_active=True).values_list('pk', flat=True).first()
+    if user_id is None:
+        raise APIError('User not found', status=404)
+    return post_list(request, Post.objects.filter(user_id=user_id))
+
+
+# --- Notifications ---
+
+NOTIFICATION_COLUMNS = {
+    'id': 'id',
+    'type': 'notification_type',
+    'message': 'message',
+    'created_at': 'created_at',
+    'is_read': 'is_read',
+    'sender': 'sender__username',
+    'post': 'post_id',
+    'comment': 'comment_id',
+    'actor_count': 'actor_count',
+}
+NOTIFICATION_FIELDS = list(NOTIFICATION_COLUMNS) + ['unread', 'archived']
+
+
+@api_view
+def notifications(request):
+    """The viewer's notifications, running on into the archive table."""
+    fields = requested_fields(request, NOTIFICATION_FIELDS)
+    limit = page_size(request)
+    cursor = request.GET.get('cursor')
+    seen_at = Profile.objects.filter(user=request.user).values_list('notifications_seen_at', flat=True).first()
+
+    rows = []
+    # Every archived row is older than every live one, so one cursor spans both
+    for model, archived in ((Notification, False), (ArchivedNotification, True)):
+        queryset = newest_first(model.objects.filter(recipient=request.user), cursor)
+        batch = list(project(queryset, NOTIFICATION_COLUMNS, fields, ('id', 'created_at', 'is_read'))[
+            :limit + 1 - len(rows)
+        ])
+        for row in batch:
+            row['archived'] = archived
+        rows += batch
+        if len(rows) > limit:
+            break
+    rows, next_cursor = cursor_page(rows, limit)
+
+    results = []
+    for row in rows:
+        item = shape(row, NOTIFICATION_COLUMNS, fields)
+        item['archived'] = row['archived']
+        item['unread'] = not row['archived'] and not row['is_read'] and (
+            seen_at is None or row['created_at'] > seen_at
+        )
+        results.append({name: item[name] for name in fields})
+    return APIResponse({'results': results, 'next': next_cursor})
+
+
+# --- Batch ---
+
+def _batch_param(request, name, convert=str):
+    """Distinct comma-separated values of ``?<name>=``, in the order given."""
+    values = []
+    for raw in request.GET.get(name, '').split(','):
+        if raw.strip():
+            try:
+                values.append(convert(raw.strip()))
+            except ValueError:
+                raise APIError(f"Invalid value in {name}: {raw.strip()}")
+    return list(dict.fromkeys(values))
+
+
+def _cached_items(kind, keys, load):
+    """
+    ``{key: item}`` from per-item cache entries, loading the rest with ``load``.
+
+    ``load(missing_keys)`` returns ``{key: (item, scopes)}`` for the keys that
+    exist, ``scopes`` being the version counters the item is built from: a
+    post's own and its author's, so a rename or new avatar shows up too.
+    Entries are read with one ``get_many`` and checked against those counters
+    (one more ``get_many``), so an item is reloaded once any of them is bumped.
+    """
+    cache_keys = {f"api:batch:{kind}:{key}": key for key in keys}
+    entries = cache.get_many(list(cache_keys))
+    # Entries written before scopes were stored name none and are reloaded
+    scopes = list({scope for entry in entries.values() for scope in entry.get('scopes', ())})
+    current = dict(zip(scopes, get_versions(*scopes)))
+    items = {
+        cache_keys[cache_key]: entry['item'] for cache_key, entry in entries.items()
+        if entry.get('versions') == [current[scope] for scope in entry.get('scopes', ())]
+    }
+
+    missing = [key for key in keys if key not in items]
+    loaded = load(missing) if missing else {}
+    if loaded:
+        scopes = list({scope for _, item_scopes in loaded.values() for scope in item_scopes})
+        current = dict(zip(scopes, get_versions(*scopes)))
+        cache.set_many({
+            f"api:batch:{kind}:{key}": {
+                'scopes': item_scopes, 'versions': [current[scope] for scope in item_scopes], 'item': item,
+            }
+            for key, (item, item_scopes) in loaded.items()
+        }, getattr(settings, 'API_BATCH_CACHE_SECONDS', 300))
+    items.update((key, item) for key, (item, _) in loaded.items())
+    return items
+
+
+def _avatar_url(user):
+    profile = getattr(user, 'profile', None)
+    return _file_url(FILE_FIELDS['avatar'], profile.avatar.name) if profile else None
+
+
+def _load_posts(post_ids):
+    posts = Post.objects.select_related('user__profile').in_bulk(post_ids)
+    comments = dict(
+        Comment.objects.filter(post_id__in=posts).values('post_id').annotate(n=Count('pk'))
+        .values_list('post_id', 'n')
+    )
+    tags = _hashtags_by_post(list(posts))
+    return {
+        post_id: ({
+            'id': post.pk,
+            'content': post.content,
+            'created_at': post.created_at,
+            'updated_at': post.updated_at,
+            'is_pinned': post.is_pinned,
+            'image': _file_url(FILE_FIELDS['image'], post.image.name),
+            'video': _file_url(FILE_FIELDS['video'], post.video.name),
+            'author': post.user.username,
+            'author_avatar': _avatar_url(post.user),
+            'comments_count': comments.get(post_id, 0),
+            'hashtags': tags.get(post_id, []),
+        }, [post_scope(post.pk), user_scope(post.user_id)])
+        for post_id, post in posts.items()
+    }
+
+
+def _load_users(usernames):
+    users = User.objects.filter(is_active=True).select_related('profile').in_bulk(
+        usernames, field_name='username'
+    )
+    posts_counts = dict(
+        Post.objects.filter(user_id__in=[user.pk for user in users.values()]).values('user_id')
+        .annotate(n=Count('pk')).values_list('user_id', 'n')
+    )
+    items = {}
+    for username, user in users.items():
+        profile = getattr(user, 'profile', None)
+        items[username] = ({
+            'id': user.pk,
+            'username': user.username,
+            'bio': profile.bio if profile else '',
+            'location': profile.location if profile else '',
+            'website': profile.website if profile else '',
+            'avatar': _avatar_url(user),
+            'is_verified': profile.is_verified if profile else False,
+            'joined': user.date_joined,
+            'posts_count': posts_counts.get(user.pk, 0),
+        }, [user_scope(user.pk)])
+    return items
+
+
+@api_view
+def batch(request):
+    """
+    Many posts and profiles in one response: ``?posts=1,2,3&users=alice,bob``.
+
+    Results keep the requested order; ids and usernames that do not exist are
+    listed under ``missing``. At most API_BATCH_MAX_ITEMS items per request.
+    """
+    post_ids = _batch_param(request, 'posts', int)
+    usernames = _batch_param(request, 'users')
+    limit = getattr(settings, 'API_BATCH_MAX_ITEMS', 100)
+    if len(post_ids) + len(usernames) > limit:
+        raise APIError(f"At most {limit} posts and users per batch")
+
+    posts = _cached_items('post', post_ids, _load_posts)
+    users = _cached_items('user', usernames, _load_users)
+
+    # Viewer state for the whole batch: one query for likes, the follow graph for follows
+    found_post_ids = [post_id for post_id in post_ids if post_id in posts]
+    counts = like_counts(found_post_ids)
+    liked = set(
+        Like.objects.filter(user=request.user, post_id__in=found_post_ids).values_list('post_id', flat=True)
+    ) if found_post_ids else set()
+    relationships = follow_graph.relationships(
+        request.user.id, [users[username]['id'] for username in usernames if username in users]
+    )
+
+    post_results = []
+    for post_id in found_post_ids:
+        item = dict(posts[post_id], liked=post_id in liked, likes_count=counts[post_id])
+        post_results.append({name: item[name] for name in POST_FIELDS})
+    user_results = []
+    for username in usernames:
+        if username in users:
+            item = dict(users[username])
+            relationship = relationships[item['id']]
+            item['followers_count'] = follow_graph.follower_count(item['id'])
+            item['following_count'] = follow_graph.following_count(item['id'])
+            item['is_following'] = relationship['following']
+            item['follows_you'] = relationship['followed_by']
+            user_results.append({name: item[name] for name in USER_FIELDS})
+
+    return APIResponse({
+        'posts': post_results,
+        'users': user_results,
+        'missing': {
+            'posts': [post_id for post_id in post_ids if post_id not in posts],
+            'users': [username for username in usernames if username not in users],
+        },
+    })
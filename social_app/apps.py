@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class SocialAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'social_app'
+
+    def ready(self):
+        # Register signal receivers and background tasks
+        from . import db_metrics, graph, likes, tasks, versions  # noqa: F401
+
+        # Logging in saves last_login, which must not pin the request's reads to the primary
+        from django.contrib.auth.signals import user_logged_in
+        from .routers import update_last_login
+        if user_logged_in.disconnect(dispatch_uid='update_last_login'):
+            user_logged_in.connect(update_last_login, dispatch_uid='update_last_login')
@@ -0,0 +1,135 @@
+"""
+Time-partitioned notification storage.
+
+Recent notifications live in ``Notification``; rows older than
+NOTIFICATION_HOT_DAYS are moved to ``ArchivedNotification`` by
+``manage.py archive_notifications``. ``TieredNotifications`` presents both
+tables as one newest-first list so pagination runs over the hot table first
+and only queries the archive once a user pages past it. Until then the
+archive is not counted, only checked for a row, so the page count shown
+stops one page past the live rows.
+"""
+
+from .models import ArchivedNotification, Notification
+
+RELATED = ('sender', 'sender__profile', 'post', 'comment')
+
+
+class TieredNotifications:
+    """
+    A hot and an archived queryset, concatenated in ``-created_at`` order.
+
+    Supports ``count()``/``acount()``, ``len()`` and slicing, which is all
+    ``Paginator`` and ``apaginate`` need. Every archived row is older than
+    every hot row, so a page never interleaves the two tables.
+
+    ``reach`` is the number of rows up to the end of the requested page.
+    While it stays within the hot rows the archive counts as one row if it
+    has any, which is enough for ``has_next``; a page reaching past them
+    counts it in full.
+    """
+
+    def __init__(self, hot, cold, reach=None):
+        self.hot = hot.order_by('-created_at', '-pk')
+        self.cold = cold.order_by('-created_at', '-pk')
+        self.reach = reach
+        self._hot_count = None
+        self._cold_count = None
+
+    @classmethod
+    def for_user(cls, user, reach=None):
+        return cls(
+            Notification.objects.filter(recipient=user).select_related(*RELATED),
+            ArchivedNotification.objects.filter(recipient=user).select_related(*RELATED),
+            reach,
+        )
+
+    def _within_hot(self):
+        return self.reach is not None and self.reach <= self._hot_count
+
+    def count(self):
+        if self._hot_count is None:
+            self._hot_count = self.hot.count()
+        if self._cold_count is None:
+            self._cold_count = int(self.cold.exists()) if self._within_hot() else self.cold.count()
+        return self._hot_count + self._cold_count
+
+    async def acount(self):
+        if self._hot_count is None:
+            self._hot_count = await self.hot.acount()
+        if self._cold_count is None:
+            if self._within_hot():
+                self._cold_count = int(await self.cold.aexists())
+            else:
+                self._cold_count = await self.cold.acount()
+        return self._hot_count + self._cold_count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step is not None:
+            raise TypeError('TieredNotifications only supports slicing without a step')
+        return TieredSlice(self, key.start or 0, key.stop)
+
+    def _split(self, start, stop):
+        """Querysets covering ``[start:stop]``, skipping a tier the range does not reach."""
+        hot_count = self._hot_count
+        parts = []
+        if start < hot_count:
+            parts.append(self.hot[start:stop if stop is not None and stop <= hot_count else hot_count])
+        if stop is None or stop > hot_count:
+            cold_stop = stop - hot_count if stop is not None else None
+            parts.append(self.cold[max(start - hot_count, 0):cold_stop])
+        return parts
+
+
+def page_reach(page_number, per_page):
+    """Rows up to the end of the page ``Paginator.get_page(page_number)`` opens, or None if unknown."""
+    try:
+        number = int(page_number or 1)
+    except (TypeError, ValueError):
+        number = 1
+    # get_page() sends numbers below 1 to the last page
+    return number * per_page if number >= 1 else None
+
+
+class TieredSlice:
+    """Lazy page of a ``TieredNotifications``, iterable from sync or async code."""
+
+    def __init__(self, tiers, start, stop):
+        self.tiers = tiers
+        self.start = start
+        self.stop = stop
+        self._result = None
+
+    def _fetch(self):
+        if self._result is None:
+            if self.tiers._hot_count is None:
+                self.tiers._hot_count = self.tiers.hot.count()
+            self._result = [
+                obj for part in self.tiers._split(self.start, self.stop) for obj in part
+            ]
+        return self._result
+
+    async def _afetch(self):
+        if self._result is None:
+            if self.tiers._hot_count is None:
+                self.tiers._hot_count = await self.tiers.hot.acount()
+            self._result = [
+                obj for part in self.tiers._split(self.start, self.stop) async for obj in part
+            ]
+        return self._result
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    async def __aiter__(self):
+        for obj in await self._afetch():
+            yield obj
+
+    def __len__(self):
+        return len(self._fetch())
+
+    def __getitem__(self, index):
+        return self._fetch()[index]
@@ -0,0 +1,128 @@
+"""
+Native async versions of the hottest endpoints, served when ASYNC_VIEWS is enabled
+under ASGI (uvicorn/daphne). Queries use the async ORM directly instead of running
+the whole view through the sync-to-async thread shim; only template rendering,
+which may still touch lazy relations, is handed to a worker thread.
+"""
+
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, aget_object_or_404
+from django.contrib.auth.decorators import login_required
+from django.db.models import Exists, OuterRef
+from django.contrib import messages
+from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_protect
+from django.conf import settings
+import logging
+
+from .models import Post, Like, Profile
+from .archive import TieredNotifications, page_reach
+from .suggestions import asuggestions_for
+from .stampede import acached_page, aload_page_objects
+from .likes import atoggle_like
+from .versions import TIMELINE, aget_versions, etag_condition, feed_etag, unread_count_etag
+from .utils import unread_notifications, amark_notifications_seen
+
+logger = logging.getLogger(__name__)
+
+arender = sync_to_async(render)
+
+
+async def apaginate(queryset, per_page, page_number):
+    """Async equivalent of ``Paginator(queryset, per_page).get_page(page_number)``."""
+    paginator = Paginator(queryset, per_page)
+    paginator.count = await queryset.acount()
+    try:
+        number = paginator.validate_number(page_number)
+    except PageNotAnInteger:
+        number = 1
+    except EmptyPage:
+        number = paginator.num_pages
+    page = paginator.page(number)
+    page.object_list = [obj async for obj in page.object_list]
+    return page
+
+
+@login_required
+@etag_condition(feed_etag)
+async def feed_view(request):
+    """Displays a global feed with all posts from all users."""
+    user = await request.auser()
+
+    # The page's ids are cached for everyone; per-viewer annotations are added below
+    page_obj = await acached_page(
+        'feed', Post.objects.order_by('-is_pinned', '-created_at'),
+        getattr(settings, 'POSTS_PER_PAGE', 10), request.GET.get('page'),
+        version=(await aget_versions(TIMELINE))[0],
+    )
+    await aload_page_objects(page_obj, Post.objects.annotate(
+        is_liked_by_user=Exists(Like.objects.filter(user=user, post=OuterRef('pk')))
+    ).select_related('user', 'user__profile').prefetch_related(
+        'comments__user', 'likes', 'hashtags'
+    ))
+
+    context = {
+        'page_obj': page_obj,
+        'posts': page_obj.object_list,
+        'feed_type': 'global',
+        'suggestions': await asuggestions_for(user),
+    }
+    return await arender(request, 'social_app/feed.html', context)
+
+
+@login_required
+@csrf_protect
+async def like_post_toggle(request, post_id):
+    """AJAX endpoint for liking/unliking posts."""
+    user = await request.auser()
+    try:
+        post = await aget_object_or_404(Post.objects.select_related('user'), id=post_id)
+        liked, likes_count = await atoggle_like(user, post)
+
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({
+                'liked': liked,
+                'likes_count': likes_count
+            })
+
+        return redirect(request.META.get('HTTP_REFERER', 'feed'))
+
+    except Exception as e:
+        logger.error(f"Error in like_post_toggle for user {user.username}: {e}")
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'error': 'An error occurred'}, status=500)
+        messages.error(request, 'An error occurred while processing your request.')
+        return redirect('feed')
+
+
+@login_required
+async def notifications_view(request):
+    """Display user notifications."""
+    user = await request.auser()
+    # Recent rows first, then the archive once the user pages past them
+    page_number = request.GET.get('page')
+    notifications = TieredNotifications.for_user(user, page_reach(page_number, 20))
+
+    # Mark notifications as read
+    await amark_notifications_seen(user)
+
+    page_obj = await apaginate(notifications, 20, page_number)
+
+    context = {
+        'notifications': page_obj.object_list,
+        'page_obj': page_obj
+    }
+    return await arender(request, 'social_app/notifications.html', context)
+
+
+@login_required
+@etag_condition(unread_count_etag)
+async def unread_notifications_count(request):
+    """AJAX endpoint to get unread notifications count."""
+    user = await request.auser()
+    seen_at = await Profile.objects.filter(user=user).values_list(
+        'notifications_seen_at', flat=True
+    ).afirst()
+    count = await unread_notifications(user, seen_at).acount()
+    return JsonResponse({'count': count})
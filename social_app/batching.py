@@ -0,0 +1,227 @@
+"""
+Chunked deletion and archiving engine for maintenance jobs.
+
+Large deletes and moves are split into primary-key ordered batches so each statement
+holds its locks briefly and never loads a whole table into Django's deletion
+collector. Progress is checkpointed to a JSON file so an interrupted run can
+resume where it stopped instead of rescanning rows it already passed.
+"""
+
+import json
+import os
+import threading
+import time
+from django.db import transaction
+from django.db.models.deletion import Collector
+
+
+class BatchStats:
+    """Rows, batches and timings for one maintenance job."""
+
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.batches = 0
+        self.batch_seconds = 0.0
+        self.max_batch_ms = 0.0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def record(self, rows, seconds):
+        self.rows += rows
+        self.batches += 1
+        self.batch_seconds += seconds
+        self.max_batch_ms = max(self.max_batch_ms, seconds * 1000)
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        avg = self.batch_seconds * 1000 / self.batches if self.batches else 0.0
+        return (
+            f"{self.name}: {self.rows} in {self.batches} batch(es), {self.elapsed:.2f}s "
+            f"({self.rows_per_second:.0f}/s, avg {avg:.1f} ms, max {self.max_batch_ms:.1f} ms per batch)"
+        )
+
+
+class Checkpoint:
+    """Last processed primary key per job, persisted to a JSON file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+
+    def get(self, job):
+        return self.state.get(job)
+
+    def set(self, job, value):
+        with self.lock:
+            self.state[job] = value
+            self._write()
+
+    def clear(self, job):
+        with self.lock:
+            self.state.pop(job, None)
+            self._write()
+
+    def _write(self):
+        if not self.state:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+        os.replace(tmp, self.path)
+
+
+def delete_in_batches(queryset, name, batch_size=1000, sleep=0, checkpoint=None, on_batch=None):
+    """
+    Delete every row of ``queryset`` in primary-key ordered batches.
+
+    Models with no cascades, signals or generic relations are removed with a
+    raw DELETE per batch; anything else goes through ``QuerySet.delete()`` one
+    batch at a time. The DELETE repeats the queryset's conditions, so a row
+    that stopped matching after its batch was selected is kept. ``sleep`` seconds are waited between batches to leave
+    room for live traffic. ``on_batch(rows)`` is called after each batch.
+    """
+    stats = BatchStats(name)
+    model = queryset.model
+    using = queryset.db
+    last_pk = checkpoint.get(name) if checkpoint else None
+
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        ids = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+
+        start = time.perf_counter()
+        targets = queryset.filter(pk__in=ids).order_by()
+        if Collector(using=using, origin=targets).can_fast_delete(targets):
+            deleted = targets._raw_delete(using)
+        else:
+            deleted = targets.delete()[1].get(model._meta.label, 0)
+        stats.record(deleted, time.perf_counter() - start)
+
+        last_pk = ids[-1]
+        if checkpoint:
+            checkpoint.set(name, last_pk)
+        if on_batch:
+            on_batch(deleted)
+        if sleep:
+            time.sleep(sleep)
+
+    if checkpoint:
+        checkpoint.clear(name)
+    return stats.finish()
+
+
+def move_in_batches(queryset, to_model, name, batch_size=1000, sleep=0, checkpoint=None, on_batch=None):
+    """
+    Copy rows of ``queryset`` into ``to_model`` and delete the originals, a batch at a time.
+
+    Every concrete field is copied by attribute name, so ``to_model`` must
+    declare the same columns (it may add defaulted ones). Insert and delete
+    share one transaction per batch, so a row is never in both tables or
+    neither. Neither sends signals; ``on_batch(rows)`` is called with the
+    field values of each batch once it has committed.
+    """
+    stats = BatchStats(name)
+    model = queryset.model
+    using = queryset.db
+    fields = [f.attname for f in model._meta.concrete_fields if not f.primary_key]
+    last_pk = checkpoint.get(name) if checkpoint else None
+
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        rows = list(batch.values('pk', *fields)[:batch_size])
+        if not rows:
+            break
+
+        start = time.perf_counter()
+        ids = [row.pop('pk') for row in rows]
+        with transaction.atomic(using=using):
+            to_model._base_manager.using(using).bulk_create(
+                [to_model(**row) for row in rows], batch_size=batch_size
+            )
+            model._base_manager.using(using).filter(pk__in=ids)._raw_delete(using)
+        stats.record(len(ids), time.perf_counter() - start)
+
+        last_pk = ids[-1]
+        if checkpoint:
+            checkpoint.set(name, last_pk)
+        if on_batch:
+            on_batch(rows)
+        if sleep:
+            time.sleep(sleep)
+
+    if checkpoint:
+        checkpoint.clear(name)
+    return stats.finish()
+
+
+def iter_media_files(root, subdirs):
+    """Yield (relative name, absolute path) for files under MEDIA_ROOT subdirectories."""
+    for subdir in subdirs:
+        base = os.path.join(root, subdir)
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                yield os.path.relpath(path, root).replace(os.sep, '/'), path
+
+
+def prune_orphaned_files(files, find_referenced, name, batch_size=1000, sleep=0,
+                         older_than=None, keep=(), dry_run=False):
+    """
+    Remove files that no database row references, checking one batch at a time.
+
+    ``files`` yields (name, path) pairs and ``find_referenced(names)`` returns the
+    subset of ``names`` still in use. Files modified after ``older_than`` (a
+    timestamp) are kept so uploads whose row is not saved yet survive.
+    """
+    stats = BatchStats(name)
+
+    def flush(batch):
+        start = time.perf_counter()
+        referenced = find_referenced([file_name for file_name, _ in batch])
+        removed = 0
+        for file_name, path in batch:
+            if file_name in referenced or file_name in keep:
+                continue
+            try:
+                if older_than is not None and os.path.getmtime(path) > older_than:
+                    continue
+                if not dry_run:
+                    os.remove(path)
+                removed += 1
+            except OSError:
+                continue
+        stats.record(removed, time.perf_counter() - start)
+        if sleep:
+            time.sleep(sleep)
+
+    batch = []
+    for item in files:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return stats.finish()
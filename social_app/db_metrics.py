@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import defaultdict
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Per-process counters; each gunicorn/uvicorn worker reports its own numbers
+_lock = threading.Lock()
+_opened = defaultdict(int)
+_last_opened = {}
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    """Count physical connections opened per database alias."""
+    with _lock:
+        _opened[connection.alias] += 1
+        _last_opened[connection.alias] = time.time()
+
+
+def connection_stats():
+    """
+    Return connection management metrics for every configured database.
+
+    Persistent connections show up as a flat ``connections_opened`` count.
+    Pooled PostgreSQL databases additionally report psycopg_pool's checkout,
+    wait and error counters.
+    """
+    stats = {}
+    for alias in connections:
+        settings_dict = connections.settings[alias]
+        pool = None
+        if settings_dict.get('OPTIONS', {}).get('pool'):
+            pool = getattr(connections[alias], 'pool', None)
+
+        with _lock:
+            entry = {
+                'connections_opened': _opened[alias],
+                'last_opened_at': _last_opened.get(alias),
+                'conn_max_age': settings_dict.get('CONN_MAX_AGE'),
+                'conn_health_checks': settings_dict.get('CONN_HEALTH_CHECKS'),
+                'pool': None,
+            }
+
+        if pool is not None:
+            raw = pool.get_stats()
+            entry['pool'] = {
+                'size': raw.get('pool_size', 0),
+                'available': raw.get('pool_available', 0),
+                'checkouts': raw.get('requests_num', 0),
+                'waits': raw.get('requests_queued', 0),
+                'wait_ms': raw.get('requests_wait_ms', 0),
+                'errors': raw.get('requests_errors', 0) + raw.get('connections_errors', 0),
+                'raw': raw,
+            }
+        stats[alias] = entry
+    return stats
@@ -0,0 +1,243 @@
+"""
+Two-phase deletion of posts and accounts.
+
+``delete_post`` and ``delete_account`` only soft-delete: a few UPDATEs set
+``deleted_at`` on the post (or on every post and comment of the account) and
+deactivate the account. Post and comment default managers leave those rows
+out, so they disappear from feeds, pages and the API at once. Then a
+``Deletion`` row is queued for the ``purge_deletion`` task.
+
+``purge`` removes the rest step by step: notifications, likes, comments
+(deepest replies first), hashtag links, follows, media files, then the posts
+and the account themselves. Each step deletes in primary-key ordered batches
+with ``delete_in_batches``, so Django's collector never loads a whole account
+into memory. Rows deleted per step and the last key reached are saved on the
+``Deletion`` after every batch. That is the progress shown in the admin, and
+a retried task resumes from it.
+
+Until the purge has finished, follows by a deleted account still count
+towards other users' totals. Like counters catch up within
+``LIKES_COUNT_TIMEOUT``, as for any like removed outside the like button.
+"""
+
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .batching import delete_in_batches
+from .graph import follow_graph
+from .models import (
+    ArchivedNotification, Comment, Deletion, FollowSuggestion, Hashtag, Like, Notification, Post, Profile,
+)
+from .versions import (
+    HASHTAGS, POSTS, SUGGESTIONS, TIMELINE, bump, hashtag_scope, post_scope, user_scope,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _batch_size():
+    return getattr(settings, 'DELETION_BATCH_SIZE', 500)
+
+
+def _queue(deletion):
+    from .tasks import purge_deletion
+    transaction.on_commit(lambda: purge_deletion.delay(deletion_id=deletion.pk))
+
+
+# --- Soft deletion ---
+
+def delete_post(post):
+    """Hide ``post`` and its comments now; purge them in the background."""
+    now = timezone.now()
+    hashtag_ids = list(Hashtag.posts.through.objects.filter(post_id=post.pk).values_list('hashtag_id', flat=True))
+    with transaction.atomic():
+        Post.all_objects.filter(pk=post.pk).update(deleted_at=now)
+        Comment.all_objects.filter(post_id=post.pk, deleted_at=None).update(deleted_at=now)
+        deletion = Deletion.objects.create(
+            kind=Deletion.KIND_POST, object_id=post.pk, label=post.content[:150]
+        )
+        _queue(deletion)
+    # UPDATE sends no post_save, so the caches are told here
+    bump(POSTS, TIMELINE, user_scope(post.user_id), post_scope(post.pk),
+         *[hashtag_scope(hashtag_id) for hashtag_id in hashtag_ids])
+    return deletion
+
+
+def delete_account(user):
+    """Deactivate ``user`` and hide their posts and comments now; purge everything in the background."""
+    now = timezone.now()
+    with transaction.atomic():
+        # Inactive users cannot log in, and their sessions stop authenticating
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        Post.all_objects.filter(user_id=user.pk, deleted_at=None).update(deleted_at=now)
+        Comment.all_objects.filter(user_id=user.pk, deleted_at=None).update(deleted_at=now)
+        deletion = Deletion.objects.create(kind=Deletion.KIND_USER, object_id=user.pk, label=user.username)
+        _queue(deletion)
+    bump(POSTS, TIMELINE, SUGGESTIONS, HASHTAGS, user_scope(user.pk))
+    # Their posts, and other posts whose comment counts drop, are cached per post
+    hidden = Post.all_objects.filter(user_id=user.pk, deleted_at=now).values_list('pk', flat=True)
+    commented = Comment.all_objects.filter(user_id=user.pk, deleted_at=now).values_list(
+        'post_id', flat=True
+    ).distinct()
+    for post_ids in (hidden, commented):
+        for post_id in post_ids.order_by().iterator(chunk_size=_batch_size()):
+            bump(post_scope(post_id))
+    return deletion
+
+
+# --- Purge ---
+
+class _Progress:
+    """``delete_in_batches`` checkpoint stored on the ``Deletion``, saved with each batch's row count."""
+
+    def __init__(self, deletion):
+        self.deletion = deletion
+
+    def get(self, name):
+        return self.deletion.checkpoint.get(name)
+
+    def set(self, name, value):
+        self.deletion.checkpoint[name] = value  # saved by batch_done()
+
+    def clear(self, name):
+        self.deletion.checkpoint.pop(name, None)
+        self.deletion.save(update_fields=['checkpoint'])
+
+    def batch_done(self, rows):
+        deletion = self.deletion
+        deletion.progress[deletion.step] = deletion.progress.get(deletion.step, 0) + rows
+        deletion.rows_deleted += rows
+        deletion.save(update_fields=['progress', 'checkpoint', 'rows_deleted'])
+
+
+def _by_depth(queryset):
+    """Comment steps from the deepest replies up, so no batch cascades into a thread below it."""
+    deepest = queryset.aggregate(deepest=Max('depth'))['deepest']
+    if deepest is None:
+        return []
+    return [(depth, queryset.filter(depth=depth)) for depth in range(deepest, -1, -1)]
+
+
+def _post_steps(post_id):
+    posts = Post.all_objects.filter(pk=post_id)
+    comments = Comment.all_objects.filter(post_id=post_id)
+    steps = []
+    for model in (Notification, ArchivedNotification):
+        name = model._meta.model_name
+        steps.append((f'{name}s on comments', model.objects.filter(comment__post_id=post_id)))
+        steps.append((f'{name}s', model.objects.filter(post_id=post_id)))
+    steps.append(('likes', Like.objects.filter(post_id=post_id)))
+    steps += [(f'comments at depth {depth}', queryset) for depth, queryset in _by_depth(comments)]
+    steps.append(('hashtag links', Hashtag.posts.through.objects.filter(post_id=post_id)))
+    return steps, posts
+
+
+def _user_steps(user_id):
+    posts = Post.all_objects.filter(user_id=user_id)
+    steps = []
+    for model in (Notification, ArchivedNotification):
+        name = model._meta.model_name
+        steps += [
+            (f'{name}s received', model.objects.filter(recipient_id=user_id)),
+            (f'{name}s sent', model.objects.filter(sender_id=user_id)),
+            (f'{name}s on posts', model.objects.filter(post__user_id=user_id)),
+            (f'{name}s on comments', model.objects.filter(comment__user_id=user_id)),
+        ]
+    steps += [
+        ('likes given', Like.objects.filter(user_id=user_id)),
+        ('likes received', Like.objects.filter(post__user_id=user_id)),
+    ]
+    steps += [(f'comments on posts at depth {depth}', queryset)
+              for depth, queryset in _by_depth(Comment.all_objects.filter(post__user_id=user_id))]
+    steps += [(f'comments at depth {depth}', queryset)
+              for depth, queryset in _by_depth(Comment.all_objects.filter(user_id=user_id))]
+    Follow = Profile.follows.through
+    steps += [
+        ('hashtag links', Hashtag.posts.through.objects.filter(post__user_id=user_id)),
+        ('following', Follow.objects.filter(from_profile__user_id=user_id)),
+        ('followers', Follow.objects.filter(to_profile__user_id=user_id)),
+        ('suggestions', FollowSuggestion.objects.filter(user_id=user_id)),
+        ('suggested', FollowSuggestion.objects.filter(suggested_id=user_id)),
+    ]
+    return steps, posts
+
+
+def _media_files(deletion, posts):
+    if deletion.kind == Deletion.KIND_USER:
+        avatar = Profile._meta.get_field('avatar')
+        name = Profile.objects.filter(user_id=deletion.object_id).values_list('avatar', flat=True).first()
+        if name and name != avatar.default:
+            yield avatar.storage, name
+    for field_name in ('image', 'video'):
+        field = Post._meta.get_field(field_name)
+        names = posts.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True}).order_by(
+            'pk'
+        ).values_list(field_name, flat=True)
+        for name in names.iterator(chunk_size=_batch_size()):
+            yield field.storage, name
+
+
+def _delete_media(deletion, posts):
+    """Delete the uploaded files of ``posts`` (and the avatar, for an account)."""
+    deletion.step = 'media'
+    deletion.save(update_fields=['step'])
+    for storage, name in _media_files(deletion, posts):
+        try:
+            storage.delete(name)  # a file already gone is not an error
+        except OSError as e:
+            logger.warning(f"Purge of {deletion}: could not delete {name}: {e}")
+            continue
+        deletion.files_deleted += 1
+        if deletion.files_deleted % _batch_size() == 0:
+            deletion.save(update_fields=['files_deleted'])
+    deletion.save(update_fields=['files_deleted'])
+
+
+def purge(deletion_id):
+    """Run (or resume) the purge of a soft-deleted post or account."""
+    deletion = Deletion.objects.filter(pk=deletion_id).first()
+    if deletion is None or deletion.status == Deletion.STATUS_DONE:
+        return deletion
+    deletion.status = Deletion.STATUS_RUNNING
+    deletion.started_at = deletion.started_at or timezone.now()
+    deletion.save(update_fields=['status', 'started_at'])
+    progress = _Progress(deletion)
+    sleep = getattr(settings, 'DELETION_BATCH_SLEEP', 0)
+
+    def run(step, queryset):
+        deletion.step = step
+        deletion.save(update_fields=['step'])
+        delete_in_batches(queryset, step, _batch_size(), sleep, progress, on_batch=progress.batch_done)
+
+    try:
+        if deletion.kind == Deletion.KIND_POST:
+            steps, posts = _post_steps(deletion.object_id)
+        else:
+            steps, posts = _user_steps(deletion.object_id)
+        for step, queryset in steps:
+            run(step, queryset)
+        _delete_media(deletion, posts)
+        run('posts', posts)
+        if deletion.kind == Deletion.KIND_USER:
+            run('account', User.objects.filter(pk=deletion.object_id))
+    except Exception as e:
+        deletion.status = Deletion.STATUS_FAILED
+        deletion.last_error = str(e)
+        deletion.save(update_fields=['status', 'last_error'])
+        raise
+
+    if deletion.kind == Deletion.KIND_USER:
+        # Follows were removed in raw batches, without m2m_changed
+        follow_graph.invalidate()
+        bump(SUGGESTIONS)
+    deletion.status = Deletion.STATUS_DONE
+    deletion.step = ''
+    deletion.finished_at = timezone.now()
+    deletion.save(update_fields=['status', 'step', 'finished_at'])
+    logger.info(f"Purged {deletion}: {deletion.rows_deleted} rows, {deletion.files_deleted} files")
+    return deletion
@@ -0,0 +1,229 @@
+"""
+In-memory follow graph.
+
+``Profile.follows`` is stored as a through-table of profile ids, so every
+"does A follow B?" check used to be a join query. ``follow_graph`` keeps the
+whole graph per process as sorted ``array('q')`` adjacency lists keyed by
+user id: membership is a binary search, a page of relationships costs no
+queries, and mutual follows are a merge of two sorted arrays.
+
+The index loads lazily on first use and is kept current by an ``m2m_changed``
+receiver, which applies a change once its transaction commits, so a rolled
+back follow never reaches the index or other processes. Other processes notice a change through a version counter in the
+cache and reload on their next lookup. A missing counter starts from the
+current time in microseconds, so an evicted or flushed counter never repeats
+a version some process has already loaded.
+"""
+
+import logging
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+
+from .models import Profile
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = 'follow_graph:version'
+
+
+def _fresh_version():
+    return int(time.time() * 1_000_000)
+
+
+def _contains(ids, value):
+    i = bisect_left(ids, value)
+    return i < len(ids) and ids[i] == value
+
+
+def _insert(ids, value):
+    i = bisect_left(ids, value)
+    if i == len(ids) or ids[i] != value:
+        ids.insert(i, value)
+
+
+def _discard(ids, value):
+    i = bisect_left(ids, value)
+    if i < len(ids) and ids[i] == value:
+        del ids[i]
+
+
+class FollowGraph:
+    """Follows and followers per user id, as sorted integer arrays."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._following = {}
+        self._followers = {}
+        self._version = None
+        self._loaded = False
+
+    # --- Loading and invalidation ---
+
+    def _current_version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            cache.add(VERSION_KEY, _fresh_version(), timeout=None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def _ensure_loaded(self):
+        version = self._current_version()
+        if self._loaded and version == self._version:
+            return
+        with self._lock:
+            if not self._loaded or version != self._version:
+                self._load(version)
+
+    def _load(self, version):
+        following, followers = {}, {}
+        edges = Profile.follows.through.objects.values_list(
+            'from_profile__user_id', 'to_profile__user_id'
+        ).order_by('from_profile__user_id', 'to_profile__user_id')
+        for source, target in edges.iterator(chunk_size=10000):
+            following.setdefault(source, array('q')).append(target)
+            followers.setdefault(target, []).append(source)
+
+        self._following = following
+        self._followers = {user_id: array('q', sorted(ids)) for user_id, ids in followers.items()}
+        self._version = version
+        self._loaded = True
+        logger.debug(f"Loaded follow graph: {sum(map(len, following.values()))} edges")
+
+    def reset(self):
+        """Drop the in-memory index; the next lookup reloads it."""
+        with self._lock:
+            self._following = {}
+            self._followers = {}
+            self._loaded = False
+
+    def _bump_version(self):
+        cache.add(VERSION_KEY, _fresh_version(), timeout=None)
+        try:
+            version = cache.incr(VERSION_KEY)
+        except ValueError:
+            # Evicted between add() and incr(): everyone reloads
+            version = _fresh_version()
+            cache.set(VERSION_KEY, version, timeout=None)
+        with self._lock:
+            # Our own change is already applied; only reload if someone else wrote too
+            if self._loaded and self._version is not None and version == self._version + 1:
+                self._version = version
+            else:
+                self._loaded = False
+
+    def record(self, follower_id, followed_ids, following=True):
+        """Apply follow (or unfollow) edges locally and tell other processes, once the change commits."""
+        followed_ids = list(followed_ids)
+        transaction.on_commit(lambda: self._apply(follower_id, followed_ids, following))
+
+    def invalidate(self):
+        """Drop the index everywhere once the change commits."""
+        transaction.on_commit(self._invalidate)
+
+    def _apply(self, follower_id, followed_ids, following):
+        with self._lock:
+            if self._loaded:
+                mutate = _insert if following else _discard
+                for followed_id in followed_ids:
+                    mutate(self._following.setdefault(follower_id, array('q')), followed_id)
+                    mutate(self._followers.setdefault(followed_id, array('q')), follower_id)
+        self._bump_version()
+
+    def _invalidate(self):
+        self.reset()
+        self._bump_version()
+
+    # --- Lookups ---
+
+    def following_ids(self, user_id):
+        self._ensure_loaded()
+        return tuple(self._following.get(user_id, ()))
+
+    def follower_ids(self, user_id):
+        self._ensure_loaded()
+        return tuple(self._followers.get(user_id, ()))
+
+    def following_count(self, user_id):
+        self._ensure_loaded()
+        return len(self._following.get(user_id, ()))
+
+    def follower_count(self, user_id):
+        self._ensure_loaded()
+        return len(self._followers.get(user_id, ()))
+
+    def is_following(self, user_id, target_id):
+        self._ensure_loaded()
+        return _contains(self._following.get(user_id, ()), target_id)
+
+    def is_mutual(self, user_id, other_id):
+        self._ensure_loaded()
+        return (
+            _contains(self._following.get(user_id, ()), other_id)
+            and _contains(self._following.get(other_id, ()), user_id)
+        )
+
+    def relationships(self, user_id, target_ids):
+        """
+        Relationship flags between ``user_id`` and each of ``target_ids``.
+
+        Returns ``{target_id: {'following': bool, 'followed_by': bool}}`` for a
+        whole page of users with a single version check.
+        """
+        self._ensure_loaded()
+        following = self._following.get(user_id, ())
+        followers = self._followers.get(user_id, ())
+        return {
+            target_id: {
+                'following': _contains(following, target_id),
+                'followed_by': _contains(followers, target_id),
+            }
+            for target_id in target_ids
+        }
+
+    def mutual_ids(self, user_id):
+        """Users that ``user_id`` follows and who follow back, in id order."""
+        self._ensure_loaded()
+        following = self._following.get(user_id, ())
+        followers = self._followers.get(user_id, ())
+        mutual = []
+        i = j = 0
+        while i < len(following) and j < len(followers):
+            if following[i] == followers[j]:
+                mutual.append(following[i])
+                i += 1
+                j += 1
+            elif following[i] < followers[j]:
+                i += 1
+            else:
+                j += 1
+        return mutual
+
+
+follow_graph = FollowGraph()
+
+
+@receiver(m2m_changed, sender=Profile.follows.through)
+def update_follow_graph(sender, instance, action, reverse, pk_set, **kwargs):
+    """Keep ``follow_graph`` in step with ``Profile.follows`` changes."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear' or not pk_set:
+        if action == 'post_clear':
+            follow_graph.invalidate()
+        return
+
+    other_ids = list(Profile.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+    following = action == 'post_add'
+    if reverse:
+        # instance gained or lost followers
+        for follower_id in other_ids:
+            follow_graph.record(follower_id, [instance.user_id], following)
+    else:
+        follow_graph.record(instance.user_id, other_ids, following)
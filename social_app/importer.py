@@ -0,0 +1,425 @@
+"""
+Bulk import of users, follows, posts, comments and likes from another network.
+
+The dump is JSON lines, one object per row, tagged with its ``type``::
+
+    {"type": "user", "id": "u1", "username": "ada", "email": "", "bio": "", "date_joined": "..."}
+    {"type": "follow", "follower": "u1", "followed": "u2"}
+    {"type": "post", "id": "p1", "user": "u1", "content": "Hello #intro", "created_at": "..."}
+    {"type": "comment", "id": "c1", "post": "p1", "user": "u2", "text": "Hi", "parent": null}
+    {"type": "like", "user": "u2", "post": "p1", "created_at": "..."}
+
+``id``, ``user``, ``post`` and ``parent`` are ids of the source network. Each
+user, post and comment created is recorded in ``ImportedId``, so rows can
+refer to anything imported before them, in this run or an earlier one. A row
+whose references cannot be resolved is skipped and counted.
+
+Rows are buffered and written ``batch_size`` at a time in one transaction,
+with one bulk INSERT per model. Hashtags and mention notifications for the new
+posts are written in the same transaction, using the rules of
+``process_post_content``. After each commit the file offset is checkpointed.
+Rows already in ``ImportedId`` (or, for follows and likes, already present)
+are skipped, so a resumed or repeated run never creates duplicates.
+"""
+
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .batching import BatchStats
+from .graph import follow_graph
+from .likes import reset_counts
+from .models import (
+    COMMENT_MAX_DEPTH, COMMENT_PATH_STEP, Comment, Hashtag, ImportedId, Like, Notification, Post, Profile,
+    comment_path_segment,
+)
+from .text import tokenize
+from .versions import (
+    HASHTAGS, POSTS, SUGGESTIONS, TIMELINE, bump, following_scope, notifications_scope, post_scope,
+    user_scope,
+)
+
+# Flush order: every kind only refers to kinds before it
+KINDS = ('user', 'follow', 'post', 'comment', 'like')
+LOOKUP_CHUNK = 500  # ids per IN (...) list, below SQLite's variable limit
+
+
+def _chunks(items, size=LOOKUP_CHUNK):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _text(value, max_length):
+    return str(value or '')[:max_length]
+
+
+def _time(value):
+    """A source timestamp (ISO 8601 or Unix seconds) as an aware datetime; now if missing."""
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+    try:
+        parsed = parse_datetime(str(value)) if value else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        return timezone.now()
+    return timezone.make_aware(parsed, dt_timezone.utc) if timezone.is_naive(parsed) else parsed
+
+
+def _bulk_insert(model, objs, keep=()):
+    """
+    ``bulk_create`` that writes the ``keep`` timestamps as set on the objects.
+
+    ``auto_now``/``auto_now_add`` would stamp them with the insert time, and
+    writing the source's times back afterwards costs a large ``CASE`` update
+    per batch. So the rows go in as a raw insert, which takes every value from
+    the objects as they are; other automatic timestamps are filled in here.
+    The model's fields are not touched, so saves elsewhere in the process
+    keep their timestamps.
+    """
+    if not objs:
+        return objs
+    opts = model._meta
+    now = timezone.now()
+    for field in opts.concrete_fields:
+        if (getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)) and field.name not in keep:
+            for obj in objs:
+                setattr(obj, field.attname, now)
+
+    alias = router.db_for_write(model)
+    fields = [field for field in opts.concrete_fields if field is not opts.auto_field]
+    returning = opts.db_returning_fields
+    batch_size = connections[alias].ops.bulk_batch_size(fields, objs) or len(objs)
+    manager = model._base_manager.using(alias)
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        rows = manager._insert(batch, fields=fields, returning_fields=returning, raw=True, using=alias)
+        for obj, row in zip(batch, rows):
+            for field, value in zip(returning, row):
+                setattr(obj, field.attname, value)
+            obj._state.adding = False
+            obj._state.db = alias
+    return objs
+
+
+class Importer:
+    def __init__(self, source, batch_size=1000, checkpoint=None):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise RuntimeError('Bulk import needs a database that returns ids from bulk inserts')
+        self.source = source
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint
+        self.buffers = {kind: [] for kind in KINDS}
+        self.ids = {'user': {}, 'post': {}, 'comment': {}}  # source id -> local id
+        self.stats = {kind: BatchStats(kind) for kind in KINDS}
+        self.skipped = Counter()
+        self.hashtag_links = 0
+        self.mentions = 0
+        self._scopes = set()
+        self._liked_posts = set()
+
+    # --- Reading ---
+
+    def run(self, path, resume=False):
+        """Import the dump at ``path``, from its checkpoint if ``resume``; returns ``self.stats``."""
+        job = f"import:{self.source}:{os.path.abspath(path)}"
+        offset = (self.checkpoint.get(job) if self.checkpoint and resume else None) or 0
+        pending = 0
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    self.skipped['invalid'] += 1
+                    continue
+                if not isinstance(row, dict) or row.get('type') not in self.buffers:
+                    self.skipped['invalid'] += 1
+                    continue
+                self.buffers[row['type']].append(row)
+                pending += 1
+                if pending >= self.batch_size:
+                    self.flush(job, offset)
+                    pending = 0
+            self.flush(job, offset)
+
+        if self.checkpoint:
+            self.checkpoint.clear(job)
+        self._invalidate()
+        for stats in self.stats.values():
+            # Rate per kind over the time spent writing that kind, not the whole run
+            stats.elapsed = stats.batch_seconds
+        return self.stats
+
+    def flush(self, job, offset):
+        """Write every buffered row in one transaction, then checkpoint ``offset``."""
+        with transaction.atomic():
+            for kind in KINDS:
+                rows, self.buffers[kind] = self.buffers[kind], []
+                if rows:
+                    started = time.perf_counter()
+                    created = getattr(self, f'_import_{kind}s')(rows)
+                    self.stats[kind].record(created, time.perf_counter() - started)
+        if self.checkpoint:
+            self.checkpoint.set(job, offset)
+
+    # --- Id mapping ---
+
+    def _resolve(self, kind, source_ids):
+        """``{source_id: local_id}`` for ``kind``, loading unknown ids from ``ImportedId``."""
+        known = self.ids[kind]
+        missing = {str(i) for i in source_ids if i is not None} - known.keys()
+        for chunk in _chunks(missing):
+            known.update(ImportedId.objects.filter(
+                source=self.source, kind=kind, source_id__in=chunk
+            ).values_list('source_id', 'local_id'))
+        return known
+
+    def _new(self, kind, rows):
+        """Rows with an id not imported yet, the first of each id."""
+        known = self._resolve(kind, [row.get('id') for row in rows])
+        fresh = {}
+        for row in rows:
+            source_id = row.get('id')
+            if source_id is None or str(source_id) in known or str(source_id) in fresh:
+                self.skipped[kind] += 1
+                continue
+            fresh[str(source_id)] = row
+        return list(fresh.values())
+
+    def _record(self, kind, pairs):
+        ImportedId.objects.bulk_create([
+            ImportedId(source=self.source, kind=kind, source_id=source_id, local_id=local_id)
+            for source_id, local_id in pairs
+        ], batch_size=LOOKUP_CHUNK)
+        self.ids[kind].update(pairs)
+
+    # --- Rows ---
+
+    def _import_users(self, rows):
+        rows = self._new('user', rows)
+        usernames = {_text(row.get('username'), 150) for row in rows}
+        taken = set()
+        for chunk in _chunks(usernames):
+            taken.update(User.objects.filter(username__in=chunk).values_list('username', flat=True))
+
+        created = []
+        for row in rows:
+            username = _text(row.get('username'), 150)
+            if not username or username in taken:
+                self.skipped['user'] += 1
+                continue
+            taken.add(username)
+            created.append((row, User(
+                username=username,
+                email=_text(row.get('email'), 254),
+                first_name=_text(row.get('first_name'), 150),
+                last_name=_text(row.get('last_name'), 150),
+                password=make_password(None),
+                date_joined=_time(row.get('date_joined')),
+            )))
+        users = _bulk_insert(User, [user for _, user in created])
+        # bulk_create sends no post_save, so the profiles are created here
+        Profile.objects.bulk_create([
+            Profile(
+                user=user,
+                bio=_text(row.get('bio'), 500),
+                location=_text(row.get('location'), 30),
+                website=_text(row.get('website'), 200),
+            )
+            for (row, _), user in zip(created, users)
+        ])
+        self._record('user', [(str(row['id']), user.pk) for (row, _), user in zip(created, users)])
+        return len(users)
+
+    def _import_follows(self, rows):
+        users = self._resolve('user', [row.get(key) for row in rows for key in ('follower', 'followed')])
+        user_ids = {users[str(row[key])] for row in rows for key in ('follower', 'followed')
+                    if str(row.get(key)) in users}
+        profiles = {}
+        for chunk in _chunks(user_ids):
+            profiles.update(Profile.objects.filter(user_id__in=chunk).values_list('user_id', 'pk'))
+
+        Follow = Profile.follows.through
+        links = {}
+        for row in rows:
+            follower = users.get(str(row.get('follower')))
+            followed = users.get(str(row.get('followed')))
+            if follower is None or followed is None or follower == followed or not (
+                follower in profiles and followed in profiles
+            ):
+                self.skipped['follow'] += 1
+                continue
+            links[(follower, followed)] = Follow(
+                from_profile_id=profiles[follower], to_profile_id=profiles[followed]
+            )
+        Follow.objects.bulk_create(links.values(), ignore_conflicts=True, batch_size=LOOKUP_CHUNK)
+        for follower, followed in links:
+            self._scopes.update((user_scope(follower), user_scope(followed), following_scope(follower)))
+        return len(links)
+
+    def _import_posts(self, rows):
+        rows = self._new('post', rows)
+        users = self._resolve('user', [row.get('user') for row in rows])
+        created = []
+        for row in rows:
+            user_id = users.get(str(row.get('user')))
+            if user_id is None:
+                self.skipped['post'] += 1
+                continue
+            posted = _time(row.get('created_at'))
+            created.append((row, Post(
+                user_id=user_id, content=_text(row.get('content'), 2000),
+                created_at=posted, updated_at=_time(row.get('updated_at')) if row.get('updated_at') else posted,
+            )))
+        posts = _bulk_insert(Post, [post for _, post in created], keep=('created_at', 'updated_at'))
+        self._record('post', [(str(row['id']), post.pk) for (row, _), post in zip(created, posts)])
+        self._process_content(posts)
+        self._scopes.update(user_scope(post.user_id) for post in posts)
+        return len(posts)
+
+    def _process_content(self, posts):
+        """Hashtags and mention notifications for ``posts``, as ``process_post_content`` makes them."""
+        max_length = Hashtag._meta.get_field('name').max_length
+        tokens = {post.pk: tokenize(post.content, render=False) for post in posts}
+        tags = {post_id: {name for name in found.hashtags if len(name) <= max_length}
+                for post_id, found in tokens.items()}
+        names = set().union(*tags.values())
+        if names:
+            Hashtag.objects.bulk_create([Hashtag(name=name) for name in names], ignore_conflicts=True)
+            hashtag_ids = {}
+            for chunk in _chunks(names):
+                hashtag_ids.update(Hashtag.objects.filter(name__in=chunk).values_list('name', 'pk'))
+            Tagged = Hashtag.posts.through
+            links = [Tagged(hashtag_id=hashtag_ids[name], post_id=post_id)
+                     for post_id, post_names in tags.items() for name in post_names]
+            Tagged.objects.bulk_create(links, ignore_conflicts=True, batch_size=LOOKUP_CHUNK)
+            self.hashtag_links += len(links)
+
+        mentioned = {post_id: set(found.mentions) for post_id, found in tokens.items()}
+        usernames = set().union(*mentioned.values())
+        if not usernames:
+            return
+        user_ids = {}
+        for chunk in _chunks(usernames):
+            user_ids.update(User.objects.filter(username__in=chunk).values_list('username', 'pk'))
+        authors = dict(User.objects.filter(
+            pk__in={post.user_id for post in posts if mentioned[post.pk]}
+        ).values_list('pk', 'username'))
+        notifications = [
+            Notification(
+                recipient_id=user_ids[username], sender_id=post.user_id, notification_type='mention',
+                post_id=post.pk, message=f"{authors[post.user_id]} mentioned you in a post",
+                created_at=post.created_at,
+            )
+            for post in posts for username in mentioned[post.pk]
+            if username in user_ids and user_ids[username] != post.user_id  # Don't notify self
+        ]
+        _bulk_insert(Notification, notifications, keep=('created_at',))
+        self._scopes.update(notifications_scope(n.recipient_id) for n in notifications)
+        self.mentions += len(notifications)
+
+    def _import_comments(self, rows):
+        rows = self._new('comment', rows)
+        posts = self._resolve('post', [row.get('post') for row in rows])
+        users = self._resolve('user', [row.get('user') for row in rows])
+        comments = self._resolve('comment', [row.get('parent') for row in rows])
+        parents = {}  # local id -> (path, depth, parent_id, post_id)
+        for chunk in _chunks({comments[str(row['parent'])] for row in rows
+                              if str(row.get('parent')) in comments}):
+            for pk, *info in Comment.objects.filter(pk__in=chunk).values_list(
+                'pk', 'path', 'depth', 'parent_id', 'post_id'
+            ):
+                parents[pk] = tuple(info)
+
+        # Replies wait for their parent's id, so insert one level of the thread at a time
+        created = 0
+        pending = rows
+        while pending:
+            ready, waiting = [], []
+            for row in pending:
+                parent = row.get('parent')
+                (ready if parent is None or str(parent) in comments else waiting).append(row)
+            if not ready:
+                break  # the rest reply to comments that are not in the dump
+            created += self._insert_comments(ready, posts, users, comments, parents)
+            pending = waiting
+        self.skipped['comment'] += len(pending)
+        return created
+
+    def _insert_comments(self, rows, posts, users, comments, parents):
+        created = []
+        for row in rows:
+            post_id = posts.get(str(row.get('post')))
+            user_id = users.get(str(row.get('user')))
+            parent_id = comments[str(row['parent'])] if row.get('parent') is not None else None
+            parent = parents.get(parent_id)
+            if post_id is None or user_id is None or (parent_id is not None and parent is None):
+                self.skipped['comment'] += 1
+                continue
+            if parent is not None:
+                post_id = parent[3]  # a reply always belongs to its parent's post
+                if parent[1] >= COMMENT_MAX_DEPTH - 1:
+                    # Same rule as Comment.save: answer alongside the parent instead
+                    parent_id = parent[2]
+                    parent = (parent[0][:-COMMENT_PATH_STEP], parent[1] - 1, None, post_id)
+            created.append((row, parent, Comment(
+                post_id=post_id, user_id=user_id, parent_id=parent_id, text=_text(row.get('text'), 500),
+                depth=parent[1] + 1 if parent is not None else 0, created_at=_time(row.get('created_at')),
+            )))
+
+        objs = _bulk_insert(Comment, [comment for _, _, comment in created], keep=('created_at',))
+        # The path is made of ids, so it can only be written once they exist
+        for _, parent, comment in created:
+            comment.path = (parent[0] if parent is not None else '') + comment_path_segment(comment.pk)
+            parents[comment.pk] = (comment.path, comment.depth, comment.parent_id, comment.post_id)
+        Comment.objects.bulk_update(objs, ['path'], batch_size=LOOKUP_CHUNK)
+        self._scopes.update(post_scope(comment.post_id) for comment in objs)
+        self._record('comment', [(str(row['id']), comment.pk) for row, _, comment in created])
+        return len(objs)
+
+    def _import_likes(self, rows):
+        users = self._resolve('user', [row.get('user') for row in rows])
+        posts = self._resolve('post', [row.get('post') for row in rows])
+        likes = {}
+        for row in rows:
+            user_id = users.get(str(row.get('user')))
+            post_id = posts.get(str(row.get('post')))
+            if user_id is None or post_id is None:
+                self.skipped['like'] += 1
+                continue
+            likes[(user_id, post_id)] = Like(user_id=user_id, post_id=post_id, created_at=_time(row.get('created_at')))
+
+        post_ids = {post_id for _, post_id in likes}
+        for chunk in _chunks(post_ids):
+            for key in Like.objects.filter(
+                post_id__in=chunk, user_id__in={user_id for user_id, _ in likes}
+            ).values_list('user_id', 'post_id'):
+                if likes.pop(key, None) is not None:
+                    self.skipped['like'] += 1
+        _bulk_insert(Like, list(likes.values()), keep=('created_at',))
+        self._liked_posts.update(post_id for _, post_id in likes)
+        self._scopes.update(post_scope(post_id) for _, post_id in likes)
+        return len(likes)
+
+    # --- Caches ---
+
+    def _invalidate(self):
+        # bulk_create sends no signals, so caches are told about the new rows here
+        follow_graph.invalidate()
+        reset_counts(self._liked_posts)
+        bump(POSTS, TIMELINE, HASHTAGS, SUGGESTIONS, *self._scopes)
+        self._scopes.clear()
+        self._liked_posts.clear()
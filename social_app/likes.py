@@ -0,0 +1,298 @@
+"""
+Like toggling with a shared like counter and optional write-behind batching.
+
+``toggle_like`` changes the row with one ``INSERT ... ON CONFLICT DO NOTHING
+RETURNING``. If that inserts nothing, the like already existed and it is
+removed with one ``DELETE``. A double click can therefore never raise on the
+``(user, post)`` unique index. The new count comes from a counter in the
+shared cache (``cache.incr``) instead of ``COUNT(*)`` over the post's likes.
+
+With ``LIKES_WRITE_BEHIND`` enabled, a post toggled more than
+``LIKES_HOT_THRESHOLD`` times within ``LIKES_HOT_WINDOW`` seconds is "hot".
+Toggles on hot posts only update the counter and a pending state in the
+cache. They are buffered in the process and written in bulk, together with
+their notifications, every ``LIKES_FLUSH_INTERVAL`` seconds. Until a flush
+the like rows (and so the "liked" heart on reloaded pages) can lag by up to
+that interval; the returned count and state do not. Pending states are kept
+in the shared cache, which must not evict them before they are flushed. A
+toggle landing between a flush's last read of a state and its removal is
+lost; with several processes that window is a single cache round trip.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import Count
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Like, Post
+from .utils import create_notification, retract_notification
+from .versions import POSTS, bump, post_scope
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _count_key(post_id):
+    return f"likes:count:{post_id}"
+
+
+def _state_key(post_id, user_id):
+    return f"likes:pending:{post_id}:{user_id}"
+
+
+# --- Counter ---
+
+def like_count(post_id):
+    """Current number of likes on ``post_id``, counted once and then kept in the cache."""
+    count = cache.get(_count_key(post_id))
+    if count is None:
+        count = Like.objects.filter(post_id=post_id).count()
+        cache.add(_count_key(post_id), count, _setting('LIKES_COUNT_TIMEOUT', 600))
+    return count
+
+
+def like_counts(post_ids):
+    """``{post_id: count}`` for many posts: one ``get_many``, then one grouped query for misses."""
+    keys = {_count_key(post_id): post_id for post_id in post_ids}
+    counts = {keys[key]: count for key, count in cache.get_many(list(keys)).items()}
+    missing = [post_id for post_id in keys.values() if post_id not in counts]
+    if missing:
+        found = dict(
+            Like.objects.filter(post_id__in=missing).values('post_id').annotate(n=Count('pk'))
+            .values_list('post_id', 'n')
+        )
+        for post_id in missing:
+            counts[post_id] = found.get(post_id, 0)
+            cache.add(_count_key(post_id), counts[post_id], _setting('LIKES_COUNT_TIMEOUT', 600))
+    return counts
+
+
+def _adjust_count(post_id, delta, written=True):
+    try:
+        return cache.incr(_count_key(post_id), delta)
+    except ValueError:
+        # Not cached: recount, adding the change if it is only buffered so far
+        count = Like.objects.filter(post_id=post_id).count() + (0 if written else delta)
+        cache.add(_count_key(post_id), count, _setting('LIKES_COUNT_TIMEOUT', 600))
+        return count
+
+
+def reset_counts(post_ids):
+    """Drop the counters of ``post_ids``, after likes were written without ``toggle_like``."""
+    cache.delete_many([_count_key(post_id) for post_id in post_ids])
+
+
+@receiver(post_save, sender=Like)
+def like_saved(sender, instance, **kwargs):
+    # Likes created outside toggle_like (admin, seed data) reset the counter
+    cache.delete(_count_key(instance.post_id))
+
+
+# --- Row changes ---
+
+def _insert_like(user_id, post_id):
+    """Insert the like unless it exists; True when a row was inserted."""
+    alias = router.db_for_write(Like)
+    connection = connections[alias]
+    if not (connection.features.can_return_columns_from_insert
+            and connection.features.supports_update_conflicts_with_target):
+        # Backends without ON CONFLICT ... RETURNING (MySQL, SQLite < 3.35)
+        try:
+            with transaction.atomic(using=alias):
+                Like.objects.using(alias).create(user_id=user_id, post_id=post_id)
+        except IntegrityError:
+            return False
+        return True
+
+    qn = connection.ops.quote_name
+    fields = {f.name: qn(f.column) for f in Like._meta.concrete_fields}
+    sql = (
+        f"INSERT INTO {qn(Like._meta.db_table)} ({fields['user']}, {fields['post']}, {fields['created_at']}) "
+        f"VALUES (%s, %s, %s) ON CONFLICT ({fields['user']}, {fields['post']}) DO NOTHING "
+        f"RETURNING {fields['id']}"
+    )
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, post_id, now])
+        return cursor.fetchone() is not None
+
+
+def _delete_like(user_id, post_id):
+    # Like has no delete signals or dependants, so this is a single DELETE
+    deleted, _ = Like.objects.filter(user_id=user_id, post_id=post_id).delete()
+    return bool(deleted)
+
+
+def _notify(post, user, liked):
+    if liked:
+        create_notification(
+            recipient=post.user, sender=user, notification_type='like',
+            message=f"{user.username} liked your post", post=post,
+        )
+    else:
+        retract_notification(recipient=post.user, sender=user, notification_type='like', post=post)
+
+
+def toggle_like(user, post):
+    """
+    Like ``post`` for ``user``, or unlike it if already liked.
+
+    ``post`` must have its ``user`` loaded for the notification. Returns
+    ``(liked, likes_count)``.
+    """
+    if _setting('LIKES_WRITE_BEHIND', False) and (
+        _is_hot(post.pk) or cache.get(_state_key(post.pk, user.pk)) is not None
+    ):
+        # Hot post, or this user's last toggle on it is still buffered
+        return _buffer.toggle(user, post)
+
+    liked = _insert_like(user.pk, post.pk)
+    if not liked and not _delete_like(user.pk, post.pk):
+        # A concurrent unlike (double click) removed it first and counted it
+        return False, like_count(post.pk)
+    count = _adjust_count(post.pk, 1 if liked else -1)
+    bump(POSTS, post_scope(post.pk))
+    _notify(post, user, liked)
+    return liked, max(count, 0)
+
+
+atoggle_like = sync_to_async(toggle_like)
+
+
+# --- Write-behind ---
+
+def _is_hot(post_id):
+    window = _setting('LIKES_HOT_WINDOW', 10)
+    key = f"likes:rate:{post_id}:{int(time.time() // window)}"
+    cache.add(key, 0, window * 2)
+    try:
+        toggles = cache.incr(key)
+    except ValueError:
+        return False
+    return toggles > _setting('LIKES_HOT_THRESHOLD', 20)
+
+
+class LikeBuffer:
+    """
+    Pending like states for this process, written in bulk by ``flush``.
+
+    Only the latest state per (post, user) is kept, so a burst of toggles by
+    one user costs at most one write. The state lives in the shared cache so
+    toggles served by other processes see it; the local copy only records
+    which keys to flush. ``flush`` applies whatever the shared state is by
+    then and skips keys another process has already flushed.
+    """
+
+    def __init__(self):
+        self._pending = {}  # (post_id, user_id) -> liked
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def toggle(self, user, post):
+        key = _state_key(post.pk, user.pk)
+        liked = cache.get(key)
+        if liked is None:
+            liked = Like.objects.filter(user_id=user.pk, post_id=post.pk).exists()
+        liked = not liked
+        cache.set(key, liked, _setting('LIKES_FLUSH_INTERVAL', 2) * 10 + 60)
+
+        with self._lock:
+            self._pending[(post.pk, user.pk)] = liked
+            if self._timer is None:
+                self._timer = threading.Timer(_setting('LIKES_FLUSH_INTERVAL', 2), self._flush_in_thread)
+                self._timer.daemon = True
+                self._timer.start()
+
+        count = _adjust_count(post.pk, 1 if liked else -1, written=False)
+        bump(POSTS, post_scope(post.pk))
+        return liked, max(count, 0)
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Flushing buffered likes failed: {e}")
+        finally:
+            connections.close_all()
+
+    def flush(self):
+        """Write every pending like and unlike; returns the number of rows changed."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        # The shared state is authoritative: another process may have toggled
+        # since, and a key that is gone was already written by another flush
+        shared = cache.get_many([_state_key(*key) for key in pending])
+        wanted = {key: shared[_state_key(*key)] for key in pending if _state_key(*key) in shared}
+        if not wanted:
+            return 0
+
+        by_post = defaultdict(set)
+        for post_id, user_id in wanted:
+            by_post[post_id].add(user_id)
+        existing = set()
+        for post_id, user_ids in by_post.items():
+            existing.update(
+                (post_id, user_id) for user_id in
+                Like.objects.filter(post_id=post_id, user_id__in=user_ids).values_list('user_id', flat=True)
+            )
+
+        added = [key for key, liked in wanted.items() if liked and key not in existing]
+        removed = [key for key, liked in wanted.items() if not liked and key in existing]
+        removed_by_post = defaultdict(list)
+        for post_id, user_id in removed:
+            removed_by_post[post_id].append(user_id)
+        with transaction.atomic():
+            Like.objects.bulk_create(
+                [Like(post_id=post_id, user_id=user_id) for post_id, user_id in added],
+                ignore_conflicts=True, batch_size=500,
+            )
+            for post_id, user_ids in removed_by_post.items():
+                Like.objects.filter(post_id=post_id, user_id__in=user_ids).delete()
+        # The rows are authoritative again; later toggles can write through.
+        # States toggled meanwhile stay for the flush of the process that set them.
+        current = cache.get_many([_state_key(*key) for key in wanted])
+        cache.delete_many([
+            _state_key(*key) for key, liked in wanted.items() if current.get(_state_key(*key)) == liked
+        ])
+
+        changed = [(key, True) for key in added] + [(key, False) for key in removed]
+        if changed:
+            post_ids = {post_id for (post_id, _), _ in changed}
+            posts = Post.objects.select_related('user').in_bulk(post_ids)
+            users = User.objects.in_bulk({user_id for (_, user_id), _ in changed})
+            for (post_id, user_id), liked in changed:
+                if post_id in posts and user_id in users:
+                    _notify(posts[post_id], users[user_id], liked)
+            bump(POSTS, *[post_scope(post_id) for post_id in post_ids])
+        logger.info(f"Flushed buffered likes: {len(added)} added, {len(removed)} removed")
+        return len(changed)
+
+
+_buffer = LikeBuffer()
+flush_likes = _buffer.flush
+
+# Do not lose buffered likes when a worker shuts down cleanly
+atexit.register(lambda: _buffer.flush() if len(_buffer) else None)
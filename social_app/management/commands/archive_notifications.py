@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from datetime import timedelta
+from social_app.batching import Checkpoint, move_in_batches
+from social_app.models import ArchivedNotification, Notification
+from social_app.routers import use_primary
+from social_app.versions import bump, notifications_scope
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Move notifications older than the hot window into the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=getattr(settings, 'NOTIFICATION_HOT_DAYS', 30),
+            help='Keep this many days of notifications in the main table (default: NOTIFICATION_HOT_DAYS)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many notifications would be archived'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows moved per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between batches to throttle load (default: 0)'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted run from its last checkpoint'
+        )
+        parser.add_argument(
+            '--state-file',
+            default=str(settings.BASE_DIR / 'logs' / 'archive_notifications.state.json'),
+            help='Checkpoint file used by --resume'
+        )
+
+    # Batches are read and then moved; a lagging replica would hand back rows already moved
+    @use_primary()
+    def handle(self, *args, **options):
+        days = options['days']
+        cutoff_date = timezone.now() - timedelta(days=days)
+        old_notifications = Notification.objects.filter(created_at__lt=cutoff_date)
+
+        if options['dry_run']:
+            self.stdout.write(
+                f"Would archive {old_notifications.count()} notifications older than {days} days"
+            )
+            return
+
+        checkpoint = Checkpoint(options['state_file'])
+        if not options['resume']:
+            checkpoint.clear('archive')
+
+        stats = move_in_batches(
+            old_notifications, ArchivedNotification, 'archive',
+            options['batch_size'], options['sleep'], checkpoint,
+            # Rows move without signals; retire the recipients' notification ETags
+            on_batch=lambda rows: bump(*{notifications_scope(row['recipient_id']) for row in rows}),
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {stats.rows} notifications older than {days} days")
+        )
+        self.stdout.write(f"  {stats}")
+        logger.info(f"Archived {stats}")
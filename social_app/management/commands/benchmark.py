@@ -0,0 +1,316 @@
+import asyncio
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.template.defaultfilters import linebreaks
+from django.test import AsyncClient, Client, override_settings
+from django.urls import path, reverse
+from django.utils.html import urlize
+from social_app import async_views, views
+from social_app.models import Post
+from social_app.text import tokenize
+from social_project.database import SQLITE_PRAGMAS
+
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks for the database and request paths'
+
+    suites = ('sqlite', 'connections', 'asgi', 'text')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'suite',
+            choices=self.suites,
+            help='Benchmark suite to run'
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help='Number of concurrent workers (default: 8)'
+        )
+        parser.add_argument(
+            '--ops',
+            type=int,
+            default=500,
+            help='Operations per worker, or passes over the sample for the text suite (default: 500)'
+        )
+        parser.add_argument(
+            '--database',
+            default='default',
+            help='Database alias for the connections suite (default: default)'
+        )
+        parser.add_argument(
+            '--username',
+            help='User to log in as for request suites (default: first user)'
+        )
+        parser.add_argument(
+            '--write-ratio',
+            type=float,
+            default=0.2,
+            help='Fraction of operations that write (default: 0.2)'
+        )
+
+    def handle(self, *args, **options):
+        getattr(self, f"bench_{options['suite']}")(options)
+
+    def report(self, label, elapsed, ops, errors=0):
+        rate = ops / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{label:<28} {ops:>8} ops  {elapsed:>8.3f}s  {rate:>10.1f} ops/s  {errors:>6} errors"
+        )
+
+    # --- SQLite profile: stock settings vs WAL + pragmas + BEGIN IMMEDIATE ---
+
+    def bench_sqlite(self, options):
+        self.stdout.write(
+            f"Mixed read/write load: {options['threads']} threads x {options['ops']} ops, "
+            f"{options['write_ratio']:.0%} writes"
+        )
+        for label, tuned in (('stock', False), ('performance profile', True)):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'bench.sqlite3')
+                self._sqlite_seed(path)
+                elapsed, ops, errors = self._sqlite_run(path, tuned, options)
+                self.report(label, elapsed, ops, errors)
+
+    def _sqlite_connect(self, path, tuned):
+        # Stock Django connections use sqlite3's 5 second busy handler and deferred transactions
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        if tuned:
+            for name, value in SQLITE_PRAGMAS.items():
+                conn.execute(f'PRAGMA {name}={value}')
+        return conn
+
+    def _sqlite_seed(self, path, users=200, posts=1000):
+        conn = sqlite3.connect(path)
+        conn.executescript("""
+            CREATE TABLE post (id INTEGER PRIMARY KEY, user_id INTEGER, content TEXT, created_at REAL);
+            CREATE TABLE "like" (id INTEGER PRIMARY KEY, user_id INTEGER, post_id INTEGER,
+                                 created_at REAL, UNIQUE (user_id, post_id));
+            CREATE INDEX like_post ON "like" (post_id);
+            CREATE INDEX post_created ON post (created_at);
+        """)
+        now = time.time()
+        conn.executemany(
+            'INSERT INTO post (user_id, content, created_at) VALUES (?, ?, ?)',
+            [(random.randint(1, users), 'x' * 200, now - i) for i in range(posts)]
+        )
+        conn.commit()
+        conn.close()
+
+    def _sqlite_run(self, path, tuned, options):
+        begin = 'BEGIN IMMEDIATE' if tuned else 'BEGIN'
+        counters = {'ops': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            conn = self._sqlite_connect(path, tuned)
+            ops = errors = 0
+            for _ in range(options['ops']):
+                post_id = rng.randint(1, 1000)
+                try:
+                    if rng.random() < options['write_ratio']:
+                        # Like toggle: read-then-write inside one transaction
+                        conn.execute(begin)
+                        user_id = rng.randint(1, 200)
+                        row = conn.execute(
+                            'SELECT id FROM "like" WHERE user_id = ? AND post_id = ?',
+                            (user_id, post_id)
+                        ).fetchone()
+                        if row:
+                            conn.execute('DELETE FROM "like" WHERE id = ?', (row[0],))
+                        else:
+                            conn.execute(
+                                'INSERT INTO "like" (user_id, post_id, created_at) VALUES (?, ?, ?)',
+                                (user_id, post_id, time.time())
+                            )
+                        conn.execute('COMMIT')
+                    else:
+                        # Feed page: recent posts plus a like count
+                        conn.execute(
+                            'SELECT id, user_id, content FROM post ORDER BY created_at DESC LIMIT 10'
+                        ).fetchall()
+                        conn.execute(
+                            'SELECT COUNT(*) FROM "like" WHERE post_id = ?', (post_id,)
+                        ).fetchone()
+                    ops += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+            conn.close()
+            with lock:
+                counters['ops'] += ops
+                counters['errors'] += errors
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, counters['ops'], counters['errors']
+
+    # --- Connection setup: a new connection per request vs persistent/pooled ---
+
+    def bench_connections(self, options):
+        alias = options['database']
+        conn = connections[alias]
+        ops = options['ops']
+        pooled = bool(conn.settings_dict.get('OPTIONS', {}).get('pool'))
+        self.stdout.write(f"Connection reuse on '{alias}' ({conn.vendor}), {ops} queries each")
+
+        def query():
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                cursor.fetchone()
+
+        # CONN_MAX_AGE = 0: every request connects and disconnects
+        # (with a pool configured, close() only returns the connection to it)
+        conn.close()
+        start = time.perf_counter()
+        for _ in range(ops):
+            conn.ensure_connection()
+            query()
+            conn.close()
+        reconnect = time.perf_counter() - start
+        self.report('pool checkout' if pooled else 'connect per request', reconnect, ops)
+
+        # Persistent connection: connect once, reuse for every query
+        conn.ensure_connection()
+        start = time.perf_counter()
+        for _ in range(ops):
+            query()
+        persistent = time.perf_counter() - start
+        self.report('persistent connection', persistent, ops)
+        conn.close()
+
+        saved = (reconnect - persistent) / ops * 1000
+        self.stdout.write(f"Setup cost removed per request: {saved:.3f} ms")
+
+    # --- Request throughput: sync views on WSGI threads vs async views on ASGI ---
+
+    def bench_asgi(self, options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            user = User.objects.order_by('id').first()
+        if user is None or not Post.objects.exists():
+            raise CommandError('No users or posts found. Please run populate_db first.')
+
+        # Read-heavy mix; the like toggle is left out because one user toggling
+        # the same post from many workers only measures lock contention
+        paths = [
+            reverse('feed'),
+            reverse('unread_notifications_count'),
+            reverse('notifications'),
+        ]
+        concurrency, ops = options['threads'], options['ops']
+        self.stdout.write(
+            f"Concurrent requests as {user.username}: {concurrency} workers x {ops} requests"
+        )
+
+        allowed_hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ROOT_URLCONF=self._urlconf(views), ALLOWED_HOSTS=allowed_hosts):
+            elapsed, errors = self._run_wsgi(user, paths, concurrency, ops)
+            self.report('WSGI threads + sync views', elapsed, concurrency * ops, errors)
+
+        with override_settings(ROOT_URLCONF=self._urlconf(async_views), ALLOWED_HOSTS=allowed_hosts):
+            elapsed, errors = asyncio.run(self._run_asgi(user, paths, concurrency, ops))
+            self.report('ASGI tasks + async views', elapsed, concurrency * ops, errors)
+
+    def _urlconf(self, hot_views):
+        """URLconf routing the hot endpoints to ``hot_views``, like urls.py with ASYNC_VIEWS."""
+        module = types.ModuleType(f'benchmark_urls_{hot_views.__name__}')
+        module.urlpatterns = [
+            path('', hot_views.feed_view, name='feed'),
+            path('post/<int:post_id>/like/', hot_views.like_post_toggle, name='like_post_toggle'),
+            path('notifications/', hot_views.notifications_view, name='notifications'),
+            path('api/notifications/unread-count/', hot_views.unread_notifications_count,
+                 name='unread_notifications_count'),
+        ] + import_module(settings.ROOT_URLCONF).urlpatterns
+        return module
+
+    def _run_wsgi(self, user, paths, concurrency, ops):
+        # A gunicorn gthread worker: one thread per in-flight request
+        def worker(_):
+            client = Client()
+            client.force_login(user)
+            errors = 0
+            for i in range(ops):
+                if client.get(paths[i % len(paths)]).status_code >= 400:
+                    errors += 1
+            return errors
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            errors = sum(executor.map(worker, range(concurrency)))
+        return time.perf_counter() - start, errors
+
+    async def _run_asgi(self, user, paths, concurrency, ops):
+        # A uvicorn worker: one event loop task per in-flight request
+        async def worker():
+            client = AsyncClient()
+            await client.aforce_login(user)
+            errors = 0
+            for i in range(ops):
+                response = await client.get(paths[i % len(paths)])
+                if response.status_code >= 400:
+                    errors += 1
+            return errors
+
+        start = time.perf_counter()
+        errors = sum(await asyncio.gather(*(worker() for _ in range(concurrency))))
+        return time.perf_counter() - start, errors
+
+    # --- Post text: one tokenizer pass vs separate regex passes per use ---
+
+    def bench_text(self, options):
+        texts = list(Post.objects.order_by('-created_at').values_list('content', flat=True)[:200])
+        if not texts:
+            names = ['django', 'python', 'weekend', 'coffee']
+            texts = [
+                f"Day {i} of #{random.choice(names)}! Thanks @user{i % 50} for "
+                f"https://example.com/post/{i}.\nMore at www.example.org #{random.choice(names)}"
+                for i in range(200)
+            ]
+        passes = options['ops']
+        self.stdout.write(f"{len(texts)} post texts x {passes} passes: hashtags, mentions and HTML")
+
+        start = time.perf_counter()
+        for _ in range(passes):
+            for text in texts:
+                self._text_separate_passes(text)
+        separate = time.perf_counter() - start
+        self.report('separate regex passes', separate, passes * len(texts))
+
+        start = time.perf_counter()
+        for _ in range(passes):
+            for text in texts:
+                tokenize(text)
+        single = time.perf_counter() - start
+        self.report('one tokenizer pass', single, passes * len(texts))
+        if single:
+            self.stdout.write(f"Speedup: {separate / single:.2f}x")
+
+    def _text_separate_passes(self, text):
+        """Extraction and rendering as done before social_app/text.py, for comparison."""
+        hashtags = re.findall(r'#(\w+)', text.lower())
+        mentions = re.findall(r'@(\w+)', text.lower())
+        html = linebreaks(urlize(text))
+        html = re.sub(r'#(\w+)', r'<a href="/hashtag/\1/" class="hashtag-link">#\1</a>', html)
+        html = re.sub(r'@(\w+)', r'<a href="/profile/\1/" class="mention-link">@\1</a>', html)
+        return hashtags, mentions, html
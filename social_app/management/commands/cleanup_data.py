@@ -1,11 +1,23 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
 from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F, Q
 from django.utils import timezone
 from datetime import timedelta
-from social_app.models import Notification, Hashtag
+from social_app.batching import (
+    Checkpoint, delete_in_batches, iter_media_files, prune_orphaned_files
+)
+from social_app.models import ArchivedNotification, Notification, Hashtag, Post, Profile
+from social_app.routers import use_primary
+from social_app.versions import HASHTAGS, bump
 import logging
 
 logger = logging.getLogger(__name__)
 
+MEDIA_SUBDIRS = ('avatars', 'posts')
+DEFAULT_AVATAR = 'avatars/default.png'
+
 
 class Command(BaseCommand):
     help = 'Clean up old data and optimize database'
@@ -22,7 +34,48 @@ class Command(BaseCommand):
             action='store_true',
             help='Show what would be deleted without actually deleting'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows (or files) handled per batch (default: 1000)'
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between batches to throttle load (default: 0)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=1,
+            help='Number of cleanup jobs to run in parallel (default: 1)'
+        )
+        parser.add_argument(
+            '--prune-media',
+            action='store_true',
+            help='Also delete media files no post or profile references'
+        )
+        parser.add_argument(
+            '--media-grace-hours',
+            type=int,
+            default=24,
+            help='Keep unreferenced media newer than this many hours (default: 24)'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted run from its last checkpoint'
+        )
+        parser.add_argument(
+            '--state-file',
+            default=str(settings.BASE_DIR / 'logs' / 'cleanup_data.state.json'),
+            help='Checkpoint file used by --resume'
+        )
 
+    # Batches are read and then deleted; a lagging replica would hand back rows already gone
+    @use_primary()
     def handle(self, *args, **options):
         days = options['days']
         dry_run = options['dry_run']
@@ -30,48 +83,100 @@ class Command(BaseCommand):
 
         self.stdout.write(f"Cleaning up data older than {days} days...")
 
-        # Clean up old notifications
+        # Old notifications (opened, or older than the recipient's seen watermark)
         old_notifications = Notification.objects.filter(
-            created_at__lt=cutoff_date,
-            is_read=True
+            Q(is_read=True) | Q(created_at__lte=F('recipient__profile__notifications_seen_at')),
+            created_at__lt=cutoff_date
         )
-        notification_count = old_notifications.count()
+        old_archived = ArchivedNotification.objects.filter(
+            Q(is_read=True) | Q(created_at__lte=F('recipient__profile__notifications_seen_at')),
+            created_at__lt=cutoff_date
+        )
+        # Unused hashtags
+        unused_hashtags = Hashtag.objects.filter(posts__isnull=True)
 
         if dry_run:
             self.stdout.write(
-                f"Would delete {notification_count} old read notifications"
+                f"Would delete {old_notifications.count()} old read notifications"
             )
-        else:
-            deleted_count = old_notifications.delete()[0]
             self.stdout.write(
-                self.style.SUCCESS(
-                    f"Deleted {deleted_count} old read notifications"
-                )
+                f"Would delete {old_archived.count()} old read archived notifications"
             )
-            logger.info(f"Cleaned up {deleted_count} old notifications")
-
-        # Clean up unused hashtags
-        unused_hashtags = Hashtag.objects.filter(posts__isnull=True)
-        hashtag_count = unused_hashtags.count()
-
-        if dry_run:
             self.stdout.write(
-                f"Would delete {hashtag_count} unused hashtags"
+                f"Would delete {unused_hashtags.count()} unused hashtags"
             )
-        else:
-            deleted_count = unused_hashtags.delete()[0]
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f"Deleted {deleted_count} unused hashtags"
-                )
-            )
-            logger.info(f"Cleaned up {deleted_count} unused hashtags")
-
-        if dry_run:
+            if options['prune_media']:
+                stats = self.prune_media(options, dry_run=True)
+                self.stdout.write(f"Would delete {stats.rows} orphaned media files")
             self.stdout.write(
                 self.style.WARNING("This was a dry run. No data was actually deleted.")
             )
+            return
+
+        checkpoint = Checkpoint(options['state_file'])
+        if not options['resume']:
+            for job in ('notifications', 'archived_notifications', 'hashtags'):
+                checkpoint.clear(job)
+
+        jobs = [
+            ('old read notifications', lambda: delete_in_batches(
+                old_notifications, 'notifications', options['batch_size'],
+                options['sleep'], checkpoint)),
+            ('old read archived notifications', lambda: delete_in_batches(
+                old_archived, 'archived_notifications', options['batch_size'],
+                options['sleep'], checkpoint)),
+            ('unused hashtags', lambda: delete_in_batches(
+                unused_hashtags, 'hashtags', options['batch_size'],
+                options['sleep'], checkpoint)),
+        ]
+        if options['prune_media']:
+            jobs.append(('orphaned media files', lambda: self.prune_media(options)))
+
+        if options['concurrency'] > 1:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                futures = [(label, executor.submit(self.run_threaded, job)) for label, job in jobs]
+                results = [(label, future.result()) for label, future in futures]
         else:
+            results = [(label, job()) for label, job in jobs]
+
+        # Cached hashtag lookups may point at tags that were just deleted
+        bump(HASHTAGS)
+
+        for label, stats in results:
             self.stdout.write(
-                self.style.SUCCESS("Data cleanup completed successfully!")
-            )
\ No newline at end of file
+                self.style.SUCCESS(f"Deleted {stats.rows} {label}")
+            )
+            self.stdout.write(f"  {stats}")
+            logger.info(f"Cleaned up {stats}")
+
+        self.stdout.write(
+            self.style.SUCCESS("Data cleanup completed successfully!")
+        )
+
+    def run_threaded(self, job):
+        try:
+            # A worker thread does not inherit the handler's routing context
+            with use_primary():
+                return job()
+        finally:
+            connections.close_all()
+
+    def prune_media(self, options, dry_run=False):
+        def find_referenced(names):
+            # Soft-deleted posts keep their files until the purge task removes them
+            referenced = set(Post.all_objects.filter(image__in=names).values_list('image', flat=True))
+            referenced.update(Post.all_objects.filter(video__in=names).values_list('video', flat=True))
+            referenced.update(Profile.objects.filter(avatar__in=names).values_list('avatar', flat=True))
+            return referenced
+
+        grace = timezone.now() - timedelta(hours=options['media_grace_hours'])
+        return prune_orphaned_files(
+            iter_media_files(settings.MEDIA_ROOT, MEDIA_SUBDIRS),
+            find_referenced,
+            'media',
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            older_than=grace.timestamp(),
+            keep={DEFAULT_AVATAR},
+            dry_run=dry_run,
+        )
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from social_app import suggestions
+
+
+class Command(BaseCommand):
+    help = 'Precompute "who to follow" suggestions for every user'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=None,
+            help='Suggestions stored per user (default: SUGGESTIONS_TOP_K)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Users scored and stored per batch (default: 1000)'
+        )
+        parser.add_argument(
+            '--engine',
+            choices=['auto', 'scipy', 'python'],
+            default='auto',
+            help='Scoring engine; auto uses SciPy when it is installed (default: auto)'
+        )
+
+    def handle(self, *args, **options):
+        engine = options['engine']
+        if engine == 'scipy' and suggestions.sparse is None:
+            raise CommandError('NumPy and SciPy are not installed (pip install numpy scipy)')
+
+        stats = suggestions.compute_suggestions(
+            top_k=options['top_k'],
+            batch_size=options['batch_size'],
+            use_sparse=None if engine == 'auto' else engine == 'scipy',
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {stats['suggestions']} suggestions for {stats['users']} users"
+        ))
+        self.stdout.write(
+            f"  {stats['engine']}: {stats['edges']} follows, "
+            f"load {stats['load_seconds']:.2f}s, score {stats['score_seconds']:.2f}s"
+        )
@@ -0,0 +1,69 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from social_app.batching import Checkpoint
+from social_app.importer import KINDS, Importer
+from social_app.routers import use_primary
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Bulk import users, follows, posts, comments and likes from a JSON-lines dump of another network'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSON-lines dump, one {"type": ...} object per line')
+        parser.add_argument(
+            '--source',
+            required=True,
+            help='Name of the network the dump comes from; ids are mapped per source'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows written per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted run from its last checkpoint'
+        )
+        parser.add_argument(
+            '--state-file',
+            default=str(settings.BASE_DIR / 'logs' / 'import_network.state.json'),
+            help='Checkpoint file used by --resume'
+        )
+
+    # Looks up ids of rows it has just inserted, which a replica may not have yet
+    @use_primary()
+    def handle(self, *args, **options):
+        try:
+            importer = Importer(options['source'], options['batch_size'], Checkpoint(options['state_file']))
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        started = time.perf_counter()
+        try:
+            stats = importer.run(options['path'], resume=options['resume'])
+        except OSError as e:
+            raise CommandError(f"Cannot read {options['path']}: {e}")
+        elapsed = time.perf_counter() - started
+
+        total = sum(s.rows for s in stats.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {total} rows from {options['source']} in {elapsed:.2f}s "
+            f"({total / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
+        for kind in KINDS:
+            if stats[kind].batches:
+                self.stdout.write(f"  {stats[kind]}")
+        self.stdout.write(
+            f"  {importer.hashtag_links} hashtag link(s), {importer.mentions} mention notification(s)"
+        )
+        skipped = {kind: count for kind, count in sorted(importer.skipped.items()) if count}
+        if skipped:
+            details = ', '.join(f"{kind}: {count}" for kind, count in skipped.items())
+            self.stdout.write(self.style.WARNING(f"  Skipped {sum(skipped.values())} row(s) ({details})"))
+        logger.info(f"Imported {total} rows from {options['source']} in {elapsed:.2f}s")
@@ -0,0 +1,111 @@
+import os
+import signal
+import socket
+import threading
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from social_app.taskqueue import claim_tasks, run_tasks, task_stats
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Run background task workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Number of worker threads (default: 4)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1,
+            help='Tasks claimed per database round trip (default: 1)'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to sleep when the queue is empty (default: 1.0)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Drain the due tasks and exit instead of polling forever'
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print per-task timing statistics and exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.print_stats()
+            return
+
+        self.stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.shutdown)
+            signal.signal(signal.SIGTERM, self.shutdown)
+
+        base_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(
+            f"Starting {options['concurrency']} worker(s) on {base_id}"
+        )
+        self.processed = 0
+        self.lock = threading.Lock()
+
+        threads = [
+            threading.Thread(target=self.work, args=(f"{base_id}:{i}", options), daemon=True)
+            for i in range(options['concurrency'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {self.processed} task(s)"))
+        self.print_stats()
+
+    def shutdown(self, signum, frame):
+        self.stdout.write(self.style.WARNING('Shutting down after current tasks...'))
+        self.stop.set()
+
+    def work(self, worker_id, options):
+        try:
+            while not self.stop.is_set():
+                close_old_connections()
+                tasks = claim_tasks(worker_id, limit=options['batch_size'])
+                if not tasks:
+                    if options['once']:
+                        break
+                    self.stop.wait(options['poll_interval'])
+                    continue
+
+                run_tasks(tasks)
+                with self.lock:
+                    self.processed += len(tasks)
+        except Exception as e:
+            logger.exception(f"Worker {worker_id} crashed: {e}")
+        finally:
+            connections.close_all()
+
+    def print_stats(self):
+        stats = task_stats()
+        if not stats:
+            self.stdout.write('No tasks recorded.')
+            return
+        for name, by_status in stats.items():
+            for status, row in by_status.items():
+                avg = row['avg_duration_ms']
+                wait = row['avg_wait_ms']
+                self.stdout.write(
+                    f"{name:<24} {status:<8} {row['count']:>7}  "
+                    f"avg {avg or 0:>9.1f} ms  max {row['max_duration_ms'] or 0:>9.1f} ms  "
+                    f"wait {wait or 0:>9.1f} ms"
+                )
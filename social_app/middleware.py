@@ -0,0 +1,59 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .routers import has_written, pin_to_primary, reset_pinning, restore_pinning
+
+PRIMARY_PIN_COOKIE = 'db_primary_pin'
+
+
+class ReplicaPinningMiddleware:
+    """
+    Gives each request read-your-writes consistency with ReplicaRouter.
+
+    A request that writes sets a short-lived cookie; while it is present,
+    follow-up requests from the same client read from the primary so
+    replication lag never hides a like, comment or follow they just made.
+    Runs natively in both sync (WSGI) and async (ASGI) stacks.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        tokens = self.process_request(request)
+        try:
+            return self.process_response(request, self.get_response(request))
+        finally:
+            restore_pinning(tokens)
+
+    async def __acall__(self, request):
+        tokens = self.process_request(request)
+        try:
+            return self.process_response(request, await self.get_response(request))
+        finally:
+            restore_pinning(tokens)
+
+    def process_request(self, request):
+        tokens = reset_pinning()
+        if request.COOKIES.get(PRIMARY_PIN_COOKIE):
+            pin_to_primary()
+        return tokens
+
+    def process_response(self, request, response):
+        if has_written() and getattr(settings, 'DATABASE_REPLICAS', []):
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE,
+                '1',
+                max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 5),
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_app", "0006_notification_aggregation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="notifications_seen_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
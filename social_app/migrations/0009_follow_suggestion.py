@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_app", "0008_archived_notification"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FollowSuggestion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("score", models.FloatField()),
+                ("mutual_count", models.PositiveIntegerField(default=0)),
+                ("shared_hashtags", models.PositiveIntegerField(default=0)),
+                ("computed_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "suggested",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="follow_suggestions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["user", "rank"],
+                "indexes": [
+                    models.Index(
+                        fields=["user", "rank"], name="social_app__user_id_e84435_idx"
+                    )
+                ],
+                "unique_together": {("user", "suggested")},
+            },
+        ),
+    ]
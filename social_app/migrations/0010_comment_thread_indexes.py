@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_app", "0009_follow_suggestion"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="comment",
+            name="social_app__parent__1d8001_idx",
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "parent", "created_at", "id"],
+                name="social_app__post_id_7737fd_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["parent", "created_at", "id"],
+                name="social_app__parent__5687c9_idx",
+            ),
+        ),
+    ]
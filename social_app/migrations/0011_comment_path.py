@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+PATH_STEP = 10
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def path_segment(pk):
+    segment = ""
+    while pk:
+        pk, remainder = divmod(pk, 36)
+        segment = DIGITS[remainder] + segment
+    return segment.rjust(PATH_STEP, "0")
+
+
+def backfill_paths(apps, schema_editor):
+    """Give existing comments their path, one thread level at a time."""
+    Comment = apps.get_model("social_app", "Comment")
+    level = Comment.objects.filter(parent__isnull=True)
+    depth = 0
+    while level.filter(path="").exists():
+        # Updated rows drop out of the filter, so each batch is the next 1000
+        while True:
+            batch = list(level.filter(path="").select_related("parent").order_by("pk")[:1000])
+            if not batch:
+                break
+            for comment in batch:
+                parent_path = comment.parent.path if comment.parent_id else ""
+                comment.path = parent_path + path_segment(comment.pk)
+                comment.depth = depth
+            Comment.objects.bulk_update(batch, ["path", "depth"])
+        depth += 1
+        level = Comment.objects.filter(parent__depth=depth - 1, parent__path__gt="")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_app", "0010_comment_thread_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="depth",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="comment",
+            name="path",
+            field=models.CharField(blank=True, editable=False, max_length=500),
+        ),
+        migrations.RunPython(backfill_paths, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="comment",
+            index=models.Index(
+                fields=["post", "path"], name="social_app__post_id_b8a69d_idx"
+            ),
+        ),
+    ]
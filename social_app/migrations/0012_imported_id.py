@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_app", "0011_comment_path"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportedId",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("source", models.CharField(max_length=50)),
+                ("kind", models.CharField(max_length=20)),
+                ("source_id", models.CharField(max_length=100)),
+                ("local_id", models.BigIntegerField()),
+                ("imported_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "unique_together": {("source", "kind", "source_id")},
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("social_app", "0012_imported_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="comment",
+            name="deleted_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="post",
+            name="deleted_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name="Deletion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("post", "Post"), ("user", "Account")], max_length=10
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                ("label", models.CharField(blank=True, max_length=150)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                    ),
+                ),
+                ("step", models.CharField(blank=True, max_length=100)),
+                ("progress", models.JSONField(blank=True, default=dict)),
+                ("checkpoint", models.JSONField(blank=True, default=dict)),
+                ("rows_deleted", models.PositiveBigIntegerField(default=0)),
+                ("files_deleted", models.PositiveIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("started_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["kind", "object_id"], name="social_app__kind_69d562_idx"
+                    ),
+                    models.Index(
+                        fields=["status", "created_at"],
+                        name="social_app__status_da2f39_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
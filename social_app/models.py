@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -16,6 +16,8 @@ class Profile(models.Model):
     website = models.URLField(max_length=200, blank=True)
     is_verified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Notifications created up to this point count as read ("mark all read" watermark)
+    notifications_seen_at = models.DateTimeField(null=True, blank=True)
 
     # Many-to-Many for following (A follows B, B doesn't auto-follow A)
     follows = models.ManyToManyField(
@@ -55,11 +57,19 @@ class Profile(models.Model):
 
     @property
     def followers_count(self):
-        return self.followers.count()
+        from .tiered_cache import tiered_cache
+        from .versions import user_scope
+        return tiered_cache.get_or_set(
+            f"followers_count:{self.pk}", self.followers.count, namespace=user_scope(self.user_id)
+        )
 
     @property
     def following_count(self):
-        return self.follows.count()
+        from .tiered_cache import tiered_cache
+        from .versions import user_scope
+        return tiered_cache.get_or_set(
+            f"following_count:{self.pk}", self.follows.count, namespace=user_scope(self.user_id)
+        )
 
 
 # --- Signals to manage Profile object lifecycle ---
@@ -75,6 +85,14 @@ def save_user_profile(sender, instance, **kwargs):
         instance.profile.save()
 
 
+# --- Soft deletion ---
+class LiveManager(models.Manager):
+    """Default manager that leaves out rows soft-deleted and waiting to be purged."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 # --- 2. Posts ---
 class Post(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
@@ -84,6 +102,11 @@ class Post(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_pinned = models.BooleanField(default=False)
+    # Set when the post (or its author's account) is deleted; see social_app/deletion.py
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
     
     def is_liked_by(self, user):
         """Checks if a given user has liked this post."""
@@ -91,36 +114,48 @@ class Post(models.Model):
 
     @property
     def content_html(self):
-        from django.utils.html import urlize
-        from django.template.defaultfilters import linebreaks
         from django.utils.safestring import mark_safe
-        return mark_safe(linebreaks(urlize(self.content)))
+        from .text import render
+        return mark_safe(render(self.content))
 
     @property
     def likes_count(self):
-        return self.likes.count()
+        from .likes import like_count
+        from .tiered_cache import tiered_cache
+        from .versions import post_scope
+        return tiered_cache.get_or_set(
+            'likes_count', lambda: like_count(self.pk), namespace=post_scope(self.pk)
+        )
 
     @property
     def comments_count(self):
-        return self.comments.count()
+        from .tiered_cache import tiered_cache
+        from .versions import post_scope
+        return tiered_cache.get_or_set('comments_count', self.comments.count, namespace=post_scope(self.pk))
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
         
-        # Resize post image if it exists and is too large
+        # Resize post image off the request path (inline when TASKS_ALWAYS_EAGER)
         if self.image:
-            try:
-                img = Image.open(self.image.path)
-                if img.height > 800 or img.width > 800:
-                    output_size = (800, 800)
-                    img.thumbnail(output_size)
-                    img.save(self.image.path)
-            except (IOError, ValueError, AttributeError) as e:
-                # Log the error but don't fail the save operation
-                import logging
-                logger = logging.getLogger(__name__)
-                logger.warning(f"Failed to resize post image for post {self.id}: {e}")
-                pass
+            from .tasks import resize_post_image
+            resize_post_image.delay(post_id=self.id)
+
+    def resize_image(self):
+        """Shrink the post image in place if it is larger than 800x800."""
+        if not self.image:
+            return
+        try:
+            img = Image.open(self.image.path)
+            if img.height > 800 or img.width > 800:
+                output_size = (800, 800)
+                img.thumbnail(output_size)
+                img.save(self.image.path)
+        except (IOError, ValueError, AttributeError) as e:
+            # Log the error but don't fail the save operation
+            import logging
+            logger = logging.getLogger(__name__)
+            logger.warning(f"Failed to resize post image for post {self.id}: {e}")
 
     class Meta:
         ordering = ['-created_at']
@@ -135,19 +170,45 @@ class Post(models.Model):
 
 
 # --- 3. Comments ---
+COMMENT_PATH_STEP = 10  # base36 digits per level of Comment.path
+COMMENT_MAX_DEPTH = 50
+
+
+def comment_path_segment(pk):
+    """Fixed-width base36 ``pk``, so string order of paths matches id order."""
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    segment = ''
+    while pk:
+        pk, remainder = divmod(pk, 36)
+        segment = digits[remainder] + segment
+    return segment.rjust(COMMENT_PATH_STEP, '0')
+
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
     text = models.TextField(max_length=500)
     created_at = models.DateTimeField(auto_now_add=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # Materialized path: the ids of every ancestor and then this comment, as
+    # fixed-width segments. Ordering by path lists a thread depth-first.
+    path = models.CharField(max_length=COMMENT_PATH_STEP * COMMENT_MAX_DEPTH, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = LiveManager()
+    all_objects = models.Manager()
 
     class Meta:
         ordering = ['created_at']
         indexes = [
             models.Index(fields=['post', 'created_at']),
             models.Index(fields=['user', 'created_at']),
-            models.Index(fields=['parent']),
+            # Keyset pages of top-level comments and of replies (social_app/threads.py)
+            models.Index(fields=['post', 'parent', 'created_at', 'id']),
+            models.Index(fields=['parent', 'created_at', 'id']),
+            # Subtree range scans
+            models.Index(fields=['post', 'path']),
         ]
 
     def __str__(self):
@@ -157,6 +218,26 @@ class Comment(models.Model):
     def is_reply(self):
         return self.parent is not None
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        parent = self.parent
+        if parent is not None and parent.depth >= COMMENT_MAX_DEPTH - 1:
+            # The path cannot hold another level; answer alongside the parent instead
+            parent = self.parent = parent.parent
+        self.depth = parent.depth + 1 if parent is not None else 0
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.path = (parent.path if parent is not None else '') + comment_path_segment(self.pk)
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
+    @property
+    def subtree_bounds(self):
+        """``(lower, upper)`` such that this comment's subtree is ``lower <= path < upper``."""
+        return self.path, self.path[:-COMMENT_PATH_STEP] + comment_path_segment(self.pk + 1)
+
 
 # --- 4. Likes ---
 class Like(models.Model):
@@ -176,21 +257,74 @@ class Like(models.Model):
 
 
 # --- 5. Notifications ---
-class Notification(models.Model):
+class NotificationBase(models.Model):
+    """Fields and display helpers shared by live and archived notifications."""
     NOTIFICATION_TYPES = [
         ('like', 'Like'),
         ('comment', 'Comment'),
         ('follow', 'Follow'),
         ('mention', 'Mention'),
     ]
-    
+
+    notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES)
+    message = models.CharField(max_length=255)
+    is_read = models.BooleanField(default=False)
+    # Aggregated notifications: total actors and the most recent usernames (newest first)
+    actor_count = models.PositiveIntegerField(default=1)
+    recent_actors = models.JSONField(default=list, blank=True)
+
+    VERBS = {
+        'like': 'liked your post',
+        'comment': 'commented on your post',
+        'follow': 'started following you',
+        'mention': 'mentioned you in a post',
+    }
+
+    is_archived = False
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return f"Notification for {self.recipient.username}: {self.message}"
+
+    @property
+    def verb(self):
+        return self.VERBS.get(self.notification_type, '')
+
+    @property
+    def other_actors(self):
+        """Recent actors other than the sender, for "A, B and N others"."""
+        return [name for name in self.recent_actors if name != self.sender.username]
+
+    @property
+    def others_count(self):
+        """Actors not named in the summary."""
+        return max(self.actor_count - 1 - len(self.other_actors), 0)
+
+    @property
+    def others_display(self):
+        """Text following the sender's name, e.g. ", bob and 312 others"."""
+        names = self.other_actors
+        if self.others_count:
+            others = f"{self.others_count} other" + ('s' if self.others_count != 1 else '')
+            names = names + [others]
+        if not names:
+            return ''
+        if len(names) == 1:
+            return f" and {names[0]}"
+        return ', ' + ', '.join(names[:-1]) + f" and {names[-1]}"
+
+    def build_message(self):
+        return f"{self.sender.username}{self.others_display} {self.verb}"[:255]
+
+
+class Notification(NotificationBase):
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_notifications')
-    notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True)
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True)
-    message = models.CharField(max_length=255)
-    is_read = models.BooleanField(default=False)
+    # For aggregated notifications this is the time of the latest activity
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -200,10 +334,32 @@ class Notification(models.Model):
             models.Index(fields=['recipient', 'is_read']),
             models.Index(fields=['sender', '-created_at']),
             models.Index(fields=['notification_type']),
+            models.Index(fields=['recipient', 'notification_type', 'post']),
         ]
 
-    def __str__(self):
-        return f"Notification for {self.recipient.username}: {self.message}"
+
+class ArchivedNotification(NotificationBase):
+    """
+    Cold storage for notifications older than NOTIFICATION_HOT_DAYS.
+
+    Rows are moved here in batches by ``archive_notifications`` so the hot
+    table and its indexes stay bounded; only the recipient timeline index
+    is kept since the archive is read a page at a time.
+    """
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications')
+    sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at']),
+        ]
 
 
 # --- 6. Hashtags ---
@@ -217,11 +373,133 @@ class Hashtag(models.Model):
 
     @property
     def posts_count(self):
-        return self.posts.count()
+        from .tiered_cache import tiered_cache
+        from .versions import hashtag_scope
+        return tiered_cache.get_or_set('posts_count', self.posts.count, namespace=hashtag_scope(self.pk))
 
     class Meta:
         ordering = ['name']
         indexes = [
             models.Index(fields=['name']),
             models.Index(fields=['created_at']),
-        ]
\ No newline at end of file
+        ]
+
+# --- 7. Background Tasks ---
+class Task(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    wait_ms = models.FloatField(null=True, blank=True)
+    duration_ms = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+            models.Index(fields=['name', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+# --- 8. Follow Suggestions ---
+class FollowSuggestion(models.Model):
+    """Precomputed "who to follow" candidates, rebuilt by ``manage.py compute_suggestions``."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follow_suggestions')
+    suggested = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    mutual_count = models.PositiveIntegerField(default=0)
+    shared_hashtags = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['user', 'rank']
+        unique_together = ('user', 'suggested')
+        indexes = [
+            models.Index(fields=['user', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.suggested.username} for {self.user.username} ({self.score:.2f})"
+
+
+# --- 9. Import Mappings ---
+class ImportedId(models.Model):
+    """Local primary key of a row created by ``manage.py import_network`` for an id in the dump."""
+    source = models.CharField(max_length=50)
+    kind = models.CharField(max_length=20)
+    source_id = models.CharField(max_length=100)
+    local_id = models.BigIntegerField()
+    imported_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('source', 'kind', 'source_id')
+
+    def __str__(self):
+        return f"{self.source} {self.kind} {self.source_id} -> {self.local_id}"
+
+
+# --- 10. Background Deletions ---
+class Deletion(models.Model):
+    """A soft-deleted post or account whose rows and files are purged in the background."""
+    KIND_POST = 'post'
+    KIND_USER = 'user'
+    KIND_CHOICES = [(KIND_POST, 'Post'), (KIND_USER, 'Account')]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    label = models.CharField(max_length=150, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    step = models.CharField(max_length=100, blank=True)
+    # Rows deleted per step, and the last primary key reached in the current one
+    progress = models.JSONField(default=dict, blank=True)
+    checkpoint = models.JSONField(default=dict, blank=True)
+    rows_deleted = models.PositiveBigIntegerField(default=0)
+    files_deleted = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['kind', 'object_id']),
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.label or self.object_id} ({self.status})"
@@ -0,0 +1,48 @@
+"""
+Paginator for tables too large to ``COUNT(*)`` on every page view.
+
+On PostgreSQL an unfiltered queryset's count is taken from the planner's row
+estimate in ``pg_class.reltuples``, kept current by autovacuum/ANALYZE,
+instead of scanning the table. A default manager's filter (``Post`` and
+``Comment`` leave out soft-deleted rows) does not count as filtering: the few
+rows waiting to be purged are within the estimate's error. Filtered
+querysets, small tables (below ``ESTIMATED_COUNT_THRESHOLD`` rows) and other
+databases are counted exactly.
+The estimate can be off by a few percent, so the last page number shown may
+be slightly wrong; every page that exists can still be opened.
+"""
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+def estimated_count(queryset):
+    """The planner's row estimate for ``queryset``'s table, or None if it has none to give."""
+    query = queryset.query
+    if query.distinct or query.is_sliced or query.combinator:
+        return None
+    # The default manager's own filter, such as leaving out soft-deleted rows, still counts as unfiltered
+    if query.where and query.where != queryset.model._default_manager.get_queryset().query.where:
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [connection.ops.quote_name(queryset.model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    # -1 (PostgreSQL 14+) or 0 means the table was never analyzed
+    return row[0] if row and row[0] > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list) if hasattr(self.object_list, 'query') else None
+        if estimate is not None and estimate >= getattr(settings, 'ESTIMATED_COUNT_THRESHOLD', 10000):
+            return estimate
+        return super().count
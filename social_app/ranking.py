@@ -0,0 +1,184 @@
+"""
+Ranked "for you" feed.
+
+Instead of sorting the whole ``Post`` table, a bounded candidate set is
+gathered from three sources (recent posts, posts by followed authors and
+posts under trending hashtags) and scored on:
+
+* recency: exponential decay with a half-life of RANKING_HALF_LIFE_HOURS,
+* velocity: recent likes and comments per hour of age,
+* author affinity: how often the viewer liked or commented on the author,
+* hashtag affinity: overlap with tags the viewer liked or posted,
+* whether the viewer follows the author.
+
+Feature columns are scored together with NumPy when it is installed (a plain
+Python pass otherwise). The ranked id list is cached per user for
+RANKING_CACHE_SECONDS so paging through it is stable and cheap.
+"""
+
+import logging
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .graph import follow_graph
+from .models import Comment, Hashtag, Like, Post
+
+try:
+    import numpy as np
+except ImportError:  # optional: pip install numpy
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEIGHTS = {
+    'recency': 1.0,
+    'velocity': 1.0,
+    'author': 0.8,
+    'hashtags': 0.5,
+    'following': 0.5,
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _weights():
+    return {**DEFAULT_WEIGHTS, **_setting('RANKING_WEIGHTS', {})}
+
+
+def cache_key(user_id):
+    return f"for_you:{user_id}"
+
+
+def candidate_ids(user, now):
+    """Post ids from the bounded candidate sources, excluding the viewer's own."""
+    since = now - timedelta(hours=_setting('RANKING_WINDOW_HOURS', 72))
+    limit = _setting('RANKING_CANDIDATES_PER_SOURCE', 200)
+    window = Post.objects.filter(created_at__gte=since).exclude(user=user)
+
+    ids = set(window.order_by('-created_at').values_list('pk', flat=True)[:limit])
+
+    followed = follow_graph.following_ids(user.id)
+    if followed:
+        ids.update(
+            window.filter(user_id__in=followed).order_by('-created_at')
+            .values_list('pk', flat=True)[:limit]
+        )
+
+    # The through table has no live-only manager; leave out posts waiting to be purged
+    tags = Hashtag.posts.through.objects.filter(post__created_at__gte=since, post__deleted_at__isnull=True)
+    trending = list(
+        tags.values('hashtag_id').annotate(uses=Count('pk'))
+        .order_by('-uses').values_list('hashtag_id', flat=True)[:10]
+    )
+    if trending:
+        ids.update(
+            tags.filter(hashtag_id__in=trending).exclude(post__user=user)
+            .order_by('-post__created_at').values_list('post_id', flat=True)[:limit]
+        )
+    return ids
+
+
+def load_features(user, ids, now):
+    """Per-candidate feature columns, in a stable order."""
+    velocity_since = now - timedelta(hours=_setting('RANKING_VELOCITY_HOURS', 24))
+    affinity_since = now - timedelta(days=_setting('RANKING_AFFINITY_DAYS', 30))
+
+    rows = list(Post.objects.filter(pk__in=ids).annotate(
+        recent_likes=Count('likes', filter=Q(likes__created_at__gte=velocity_since), distinct=True),
+        recent_comments=Count('comments', filter=Q(comments__created_at__gte=velocity_since), distinct=True),
+    ).order_by('pk').values_list('pk', 'user_id', 'created_at', 'recent_likes', 'recent_comments'))
+
+    author_affinity = Counter()
+    for author_id, count in Like.objects.filter(user=user, created_at__gte=affinity_since).values(
+        'post__user_id'
+    ).annotate(n=Count('pk')).values_list('post__user_id', 'n'):
+        author_affinity[author_id] += count
+    for author_id, count in Comment.objects.filter(user=user, created_at__gte=affinity_since).values(
+        'post__user_id'
+    ).annotate(n=Count('pk')).values_list('post__user_id', 'n'):
+        author_affinity[author_id] += 2 * count
+
+    tag_affinity = Counter(dict(
+        Hashtag.posts.through.objects.filter(
+            Q(post__likes__user=user, post__likes__created_at__gte=affinity_since)
+            | Q(post__user=user, post__created_at__gte=affinity_since)
+        # Distinct: the OR joins every like on the viewer's own posts
+        ).values('hashtag_id').annotate(n=Count('pk', distinct=True)).values_list('hashtag_id', 'n')
+    ))
+    post_tags = defaultdict(list)
+    for post_id, tag_id in Hashtag.posts.through.objects.filter(post_id__in=ids).values_list(
+        'post_id', 'hashtag_id'
+    ):
+        post_tags[post_id].append(tag_id)
+
+    followed = follow_graph.relationships(user.id, {row[1] for row in rows})
+    return {
+        'ids': [row[0] for row in rows],
+        'age_hours': [max((now - row[2]).total_seconds() / 3600, 0.0) for row in rows],
+        'engagement': [row[3] + 2 * row[4] for row in rows],
+        'author': [author_affinity[row[1]] for row in rows],
+        'hashtags': [sum(tag_affinity[t] for t in post_tags[row[0]]) for row in rows],
+        'following': [1.0 if followed[row[1]]['following'] else 0.0 for row in rows],
+    }
+
+
+def score(features, weights=None):
+    """Score every candidate; returns a list aligned with ``features['ids']``."""
+    weights = weights or _weights()
+    half_life = _setting('RANKING_HALF_LIFE_HOURS', 12)
+    gravity = _setting('RANKING_GRAVITY', 1.5)
+
+    if np is not None:
+        age = np.asarray(features['age_hours'], dtype=np.float64)
+        velocity = np.asarray(features['engagement'], dtype=np.float64) / (age + 2) ** gravity
+        scores = (
+            weights['recency'] * 0.5 ** (age / half_life)
+            + weights['velocity'] * np.log1p(velocity)
+            + weights['author'] * np.log1p(np.asarray(features['author'], dtype=np.float64))
+            + weights['hashtags'] * np.log1p(np.asarray(features['hashtags'], dtype=np.float64))
+            + weights['following'] * np.asarray(features['following'], dtype=np.float64)
+        )
+        return scores.tolist()
+
+    return [
+        weights['recency'] * 0.5 ** (age / half_life)
+        + weights['velocity'] * math.log1p(engagement / (age + 2) ** gravity)
+        + weights['author'] * math.log1p(author)
+        + weights['hashtags'] * math.log1p(tags)
+        + weights['following'] * following
+        for age, engagement, author, tags, following in zip(
+            features['age_hours'], features['engagement'], features['author'],
+            features['hashtags'], features['following'],
+        )
+    ]
+
+
+def rank_posts(user, now=None):
+    """Candidate post ids for ``user``, best first."""
+    now = now or timezone.now()
+    ids = candidate_ids(user, now)
+    if not ids:
+        return []
+    features = load_features(user, ids, now)
+    scores = score(features)
+    ranked = sorted(zip(scores, features['ids']), key=lambda item: (-item[0], -item[1]))
+    logger.debug(f"Ranked {len(ranked)} candidates for user {user.id}")
+    return [post_id for _, post_id in ranked]
+
+
+def ranked_post_ids(user, refresh=False):
+    """The cached ranking for ``user``, recomputed when missing or stale."""
+    key = cache_key(user.id)
+    ids = None if refresh else cache.get(key)
+    if ids is None:
+        ids = rank_posts(user)
+        cache.set(key, ids, _setting('RANKING_CACHE_SECONDS', 120))
+    return ids
@@ -0,0 +1,134 @@
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import ConnectionDoesNotExist, DatabaseError
+
+logger = logging.getLogger(__name__)
+
+# Set for the rest of the request once it writes (or explicitly asks for the primary)
+_pinned = contextvars.ContextVar('replica_router_pinned', default=False)
+_wrote = contextvars.ContextVar('replica_router_wrote', default=False)
+# True inside a request (reset_pinning); writes elsewhere, such as in workers and
+# management commands, would otherwise pin the rest of the process
+_scoped = contextvars.ContextVar('replica_router_scoped', default=False)
+# Writes that change nothing a page shows, like session saves and last_login
+_bookkeeping = contextvars.ContextVar('replica_router_bookkeeping', default=False)
+
+# alias -> monotonic timestamp until which the replica is considered down
+_unavailable = {}
+
+
+def pin_to_primary():
+    """Route all remaining reads in the current request/context to the primary."""
+    _pinned.set(True)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def has_written():
+    return _wrote.get()
+
+
+def reset_pinning():
+    """Start the per-request routing state. Returns tokens for ``restore_pinning``."""
+    return _pinned.set(False), _wrote.set(False), _scoped.set(True)
+
+
+def restore_pinning(tokens):
+    pinned_token, wrote_token, scoped_token = tokens
+    _pinned.reset(pinned_token)
+    _wrote.reset(wrote_token)
+    _scoped.reset(scoped_token)
+
+
+@contextmanager
+def use_primary():
+    """Context manager forcing reads inside the block onto the primary."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+@contextmanager
+def bookkeeping():
+    """Context manager for writes that should not pin later reads to the primary."""
+    token = _bookkeeping.set(True)
+    try:
+        yield
+    finally:
+        _bookkeeping.reset(token)
+
+
+def update_last_login(sender, user, **kwargs):
+    """``django.contrib.auth``'s ``user_logged_in`` receiver, as a bookkeeping write."""
+    from django.contrib.auth.models import update_last_login
+    with bookkeeping():
+        update_last_login(sender, user, **kwargs)
+
+
+def mark_replica_unavailable(alias):
+    retry = getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+    _unavailable[alias] = time.monotonic() + retry
+    logger.warning(f"Read replica '{alias}' unavailable, falling back to primary for {retry}s")
+
+
+def replica_is_available(alias):
+    """Check a replica can be reached, caching failures for REPLICA_RETRY_SECONDS."""
+    retry_at = _unavailable.get(alias)
+    if retry_at is not None:
+        if time.monotonic() < retry_at:
+            return False
+        del _unavailable[alias]
+
+    try:
+        connections[alias].ensure_connection()
+    except (ConnectionDoesNotExist, DatabaseError):
+        mark_replica_unavailable(alias)
+        return False
+    return True
+
+
+class ReplicaRouter:
+    """
+    Sends writes to the primary and spreads reads across DATABASE_REPLICAS.
+
+    Reads stay on the primary once the current request has written, and for
+    REPLICA_STICKY_SECONDS afterwards via ReplicaPinningMiddleware, so a user
+    always sees their own likes, comments and follows. Only writes inside a
+    request pin, and session saves and other bookkeeping writes do not.
+    Replicas that fail to connect are skipped until REPLICA_RETRY_SECONDS have
+    passed.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', [])
+        if not replicas or _pinned.get():
+            return DEFAULT_DB_ALIAS
+
+        candidates = list(replicas)
+        random.shuffle(candidates)
+        for alias in candidates:
+            if replica_is_available(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if _scoped.get() and not _bookkeeping.get() and model._meta.app_label != 'sessions':
+            _wrote.set(True)
+            _pinned.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas mirror the primary, so objects from any of them can be related
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in getattr(settings, 'DATABASE_REPLICAS', [])
@@ -0,0 +1,143 @@
+"""
+Stampede-safe caching for expensive computed results.
+
+``cache_compute`` wraps the shared cache with three protections:
+
+* single flight: on a miss only the request that wins ``cache.add(lock)``
+  computes; the others wait briefly for its result instead of piling onto the
+  database with the same query;
+* probabilistic early expiry (XFetch): as an entry nears its expiry, each
+  read has a growing chance of refreshing it early, weighted by how long the
+  value took to compute, so refreshes spread out instead of all landing the
+  moment it expires;
+* stale-while-revalidate: for ``stale`` seconds after expiry (or once its
+  ``version`` is outdated) the old value is still served to everyone except
+  the single request that refreshes it.
+
+``cached_page`` applies this to paginated querysets, caching only the page's
+primary keys and total count so per-viewer annotations are added afterwards.
+"""
+
+import logging
+import math
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _lock_timeout():
+    return getattr(settings, 'STAMPEDE_LOCK_TIMEOUT', 10)
+
+
+def _store(key, value, delta, timeout, stale, version):
+    entry = {'value': value, 'delta': delta, 'expires': time.time() + timeout, 'version': version}
+    cache.set(key, entry, timeout + stale)
+    return entry
+
+
+def _compute_and_store(key, compute, timeout, stale, version):
+    start = time.perf_counter()
+    value = compute()
+    _store(key, value, time.perf_counter() - start, timeout, stale, version)
+    return value
+
+
+def _should_refresh(entry, now, beta, version):
+    if entry['version'] != version or now >= entry['expires']:
+        return True
+    # XFetch: refresh early with probability rising as expiry approaches
+    return now - entry['delta'] * beta * math.log(1.0 - random.random()) >= entry['expires']
+
+
+def cache_compute(key, compute, timeout, stale=0, version=None, beta=1.0, wait=None):
+    """
+    Return the cached result of ``compute()`` under ``key``.
+
+    ``timeout`` is the fresh lifetime in seconds. ``stale`` extra seconds keep
+    an expired value around to serve while one request recomputes it. A
+    change of ``version`` makes the cached value stale immediately. ``beta``
+    tunes early expiry (0 disables it). ``wait`` is how long a request that
+    lost the lock on a cold key waits for the winner before computing itself.
+    """
+    lock_key = f"{key}:lock"
+    lock_timeout = _lock_timeout()
+    entry = cache.get(key)
+    now = time.time()
+
+    if entry is not None:
+        if not _should_refresh(entry, now, beta, version):
+            return entry['value']
+        usable = entry['version'] == version and now < entry['expires']
+        if stale or usable:
+            # One request refreshes; everyone else keeps the current value
+            if not cache.add(lock_key, 1, lock_timeout):
+                return entry['value']
+            try:
+                return _compute_and_store(key, compute, timeout, stale, version)
+            finally:
+                cache.delete(lock_key)
+
+    # Cold (or expired without a stale window): single flight
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            return _compute_and_store(key, compute, timeout, stale, version)
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + (lock_timeout if wait is None else wait)
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version:
+            return entry['value']
+    logger.warning(f"Gave up waiting for {key} to be computed; computing it here")
+    return _compute_and_store(key, compute, timeout, stale, version)
+
+
+def cached_page(key, queryset, per_page, page_number, version=None, timeout=None, stale=None):
+    """
+    ``Paginator(queryset, per_page).get_page(page_number)`` with the page's ids
+    and the total count cached through ``cache_compute``.
+
+    Returns a ``Page`` whose ``object_list`` is the list of primary keys; the
+    caller loads and annotates those rows for the current viewer.
+    """
+    timeout = getattr(settings, 'PAGE_CACHE_SECONDS', 30) if timeout is None else timeout
+    stale = getattr(settings, 'PAGE_CACHE_STALE_SECONDS', 60) if stale is None else stale
+    try:
+        number = max(int(page_number), 1)
+    except (TypeError, ValueError):
+        number = 1
+
+    def compute():
+        page = Paginator(queryset.values_list('pk', flat=True), per_page).get_page(number)
+        return {'count': page.paginator.count, 'number': page.number, 'ids': list(page.object_list)}
+
+    result = cache_compute(f"page:{key}:{per_page}:{number}", compute, timeout, stale, version)
+    paginator = Paginator([], per_page)
+    paginator.count = result['count']
+    return Page(result['ids'], result['number'], paginator)
+
+
+acached_page = sync_to_async(cached_page)
+
+
+def load_page_objects(page, queryset):
+    """Replace ``page.object_list`` ids with rows from ``queryset``, keeping their order."""
+    by_id = {obj.pk: obj for obj in queryset.filter(pk__in=page.object_list)}
+    page.object_list = [by_id[pk] for pk in page.object_list if pk in by_id]
+    return page
+
+
+async def aload_page_objects(page, queryset):
+    by_id = {obj.pk: obj async for obj in queryset.filter(pk__in=page.object_list)}
+    page.object_list = [by_id[pk] for pk in page.object_list if pk in by_id]
+    return page
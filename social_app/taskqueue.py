@@ -0,0 +1,247 @@
+"""
+Lightweight database-backed task queue.
+
+Tasks are rows in the ``Task`` table. Workers (``manage.py runworker``) claim
+them with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the database supports it
+(PostgreSQL) and with a single conditional UPDATE elsewhere (SQLite), so a task
+is only ever handed to one worker. With ``TASKS_ALWAYS_EAGER`` enabled tasks run
+inline, which keeps development and tests free of a worker process.
+
+A claimed task holds a lease: its ``locked_at`` is refreshed every
+``TASK_HEARTBEAT_INTERVAL`` seconds until it finishes, including while it waits
+behind the rest of its batch, and only a task whose lease is older than
+``TASK_LOCK_TIMEOUT`` (its worker died) can be claimed again. A task that died
+on its last attempt is marked failed instead. The outcome is recorded only by
+the worker still holding the lease.
+"""
+
+import logging
+import random
+import threading
+import time
+import traceback
+import uuid
+from contextlib import nullcontext
+from datetime import timedelta
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Avg, Count, F, Max, Q
+from django.utils import timezone
+
+from .models import Task
+from .routers import use_primary
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def task(func=None, *, name=None, max_attempts=None):
+    """
+    Register a function as a background task.
+
+    The function must accept only JSON-serializable keyword arguments (pass
+    ids, not model instances). ``func.delay(**kwargs)`` enqueues it.
+    """
+    def decorator(func):
+        task_name = name or func.__name__
+        _registry[task_name] = func
+        func.task_name = task_name
+        func.delay = lambda **kwargs: enqueue(task_name, kwargs, max_attempts=max_attempts)
+        return func
+
+    return decorator(func) if func is not None else decorator
+
+
+def get_task(name):
+    return _registry[name]
+
+
+def enqueue(name, kwargs=None, countdown=0, max_attempts=None):
+    """Queue the task ``name``, or run it immediately when TASKS_ALWAYS_EAGER is set."""
+    kwargs = kwargs or {}
+    if name not in _registry:
+        raise KeyError(f"Unknown task '{name}'")
+
+    if getattr(settings, 'TASKS_ALWAYS_EAGER', False):
+        _registry[name](**kwargs)
+        return None
+
+    return Task.objects.using(DEFAULT_DB_ALIAS).create(
+        name=name,
+        kwargs=kwargs,
+        run_at=timezone.now() + timedelta(seconds=countdown),
+        max_attempts=max_attempts or getattr(settings, 'TASK_MAX_ATTEMPTS', 3),
+    )
+
+
+def _abandoned(now):
+    # Running tasks whose worker died mid-task
+    stale = now - timedelta(seconds=getattr(settings, 'TASK_LOCK_TIMEOUT', 300))
+    return Q(status=Task.STATUS_RUNNING, locked_at__lt=stale)
+
+
+def _claimable(now):
+    # Queued tasks that are due, plus abandoned ones with attempts left
+    return Q(status=Task.STATUS_QUEUED, run_at__lte=now) | (
+        _abandoned(now) & Q(attempts__lt=F('max_attempts'))
+    )
+
+
+def _fail_abandoned(now):
+    """Mark tasks abandoned on their last attempt as failed rather than running them again."""
+    failed = Task.objects.using(DEFAULT_DB_ALIAS).filter(
+        _abandoned(now), attempts__gte=F('max_attempts')
+    ).update(
+        status=Task.STATUS_FAILED, finished_at=now, locked_by='', locked_at=None,
+        last_error='Worker stopped responding during the last attempt',
+    )
+    if failed:
+        logger.error(f"{failed} task(s) abandoned on their last attempt marked failed")
+
+
+def claim_tasks(worker_id, limit=1):
+    """Atomically claim up to ``limit`` due tasks for ``worker_id``."""
+    now = timezone.now()
+    _fail_abandoned(now)
+    tasks = Task.objects.using(DEFAULT_DB_ALIAS)
+    claim = {
+        'status': Task.STATUS_RUNNING,
+        'locked_at': now,
+        'started_at': now,
+        'attempts': F('attempts') + 1,
+    }
+
+    if connections[DEFAULT_DB_ALIAS].features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            ids = list(
+                tasks.select_for_update(skip_locked=True)
+                .filter(_claimable(now))
+                .order_by('run_at')
+                .values_list('pk', flat=True)[:limit]
+            )
+            tasks.filter(pk__in=ids).update(locked_by=worker_id, **claim)
+    else:
+        # SQLite serializes writers, so one UPDATE with a re-checked condition is atomic
+        token = f"{worker_id}:{uuid.uuid4().hex[:12]}"
+        due = tasks.filter(_claimable(now)).order_by('run_at').values('pk')[:limit]
+        tasks.filter(_claimable(now), pk__in=due).update(locked_by=token, **claim)
+        ids = list(tasks.filter(locked_by=token).values_list('pk', flat=True))
+
+    return list(tasks.filter(pk__in=ids).order_by('run_at'))
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, in seconds."""
+    base = getattr(settings, 'TASK_RETRY_BACKOFF', 5)
+    cap = getattr(settings, 'TASK_RETRY_BACKOFF_MAX', 3600)
+    delay = min(base * 2 ** max(attempts - 1, 0), cap)
+    return delay + random.uniform(0, delay * 0.1)
+
+
+class _Heartbeat:
+    """Refreshes the leases of claimed tasks from a side thread until they finish."""
+
+    def __init__(self, tasks):
+        self.leases = [(task_obj.pk, task_obj.locked_by) for task_obj in tasks]
+        self.label = ', '.join(f"{task_obj.name} #{task_obj.pk}" for task_obj in tasks)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+    def beat(self):
+        """Move ``locked_at`` forward for the tasks still held; False once none is."""
+        held = Q()
+        for pk, locked_by in self.leases:
+            held |= Q(pk=pk, locked_by=locked_by)
+        return bool(Task.objects.using(DEFAULT_DB_ALIAS).filter(
+            held, status=Task.STATUS_RUNNING,
+        ).update(locked_at=timezone.now()))
+
+    def _run(self):
+        interval = getattr(settings, 'TASK_HEARTBEAT_INTERVAL', 60)
+        beaten = False
+        try:
+            while not self._stopped.wait(interval):
+                beaten = True
+                if not self.beat():
+                    logger.warning(f"Tasks {self.label} are no longer held")
+                    break
+        except Exception as e:
+            logger.error(f"Heartbeat of tasks {self.label} failed: {e}")
+        finally:
+            if beaten:
+                connections[DEFAULT_DB_ALIAS].close()
+
+
+def run_tasks(tasks):
+    """Run a claimed batch in order; tasks waiting their turn keep their leases too."""
+    with _Heartbeat(tasks):
+        return [run_task(task_obj, heartbeat=False) for task_obj in tasks]
+
+
+def run_task(task_obj, heartbeat=True):
+    """Execute a claimed task and record its outcome and timings."""
+    started_at = task_obj.started_at or timezone.now()
+    task_obj.wait_ms = max((started_at - task_obj.run_at).total_seconds() * 1000, 0)
+    lock_token = task_obj.locked_by
+    start = time.perf_counter()
+    try:
+        # Tasks usually read rows written just before they were queued
+        with use_primary(), _Heartbeat([task_obj]) if heartbeat else nullcontext():
+            get_task(task_obj.name)(**task_obj.kwargs)
+    except Exception as e:
+        task_obj.last_error = traceback.format_exc()
+        if task_obj.attempts < task_obj.max_attempts:
+            task_obj.status = Task.STATUS_QUEUED
+            task_obj.run_at = timezone.now() + timedelta(seconds=retry_delay(task_obj.attempts))
+            logger.warning(f"Task {task_obj.name} #{task_obj.pk} failed (attempt {task_obj.attempts}), retrying: {e}")
+        else:
+            task_obj.status = Task.STATUS_FAILED
+            logger.error(f"Task {task_obj.name} #{task_obj.pk} failed permanently: {e}")
+    else:
+        task_obj.status = Task.STATUS_DONE
+        task_obj.last_error = ''
+
+    task_obj.duration_ms = (time.perf_counter() - start) * 1000
+    task_obj.finished_at = timezone.now()
+    task_obj.locked_by = ''
+    task_obj.locked_at = None
+    fields = ['status', 'run_at', 'last_error', 'wait_ms', 'duration_ms', 'finished_at', 'locked_by', 'locked_at']
+    # A worker whose lease expired must not overwrite the one that took over
+    owned = Task.objects.using(DEFAULT_DB_ALIAS).filter(pk=task_obj.pk, locked_by=lock_token).update(
+        **{field: getattr(task_obj, field) for field in fields}
+    )
+    if not owned:
+        logger.warning(f"Task {task_obj.name} #{task_obj.pk} was taken over by another worker; outcome not recorded")
+    return task_obj
+
+
+def task_stats(since=None):
+    """Per-task counts by status with average/max run time and queue wait."""
+    tasks = Task.objects.using(DEFAULT_DB_ALIAS)
+    if since is not None:
+        tasks = tasks.filter(created_at__gte=since)
+    rows = tasks.values('name', 'status').annotate(
+        count=Count('pk'),
+        avg_duration_ms=Avg('duration_ms'),
+        max_duration_ms=Max('duration_ms'),
+        avg_wait_ms=Avg('wait_ms'),
+    ).order_by('name', 'status')
+
+    stats = {}
+    for row in rows:
+        stats.setdefault(row['name'], {})[row['status']] = {
+            'count': row['count'],
+            'avg_duration_ms': row['avg_duration_ms'],
+            'max_duration_ms': row['max_duration_ms'],
+            'avg_wait_ms': row['avg_wait_ms'],
+        }
+    return stats
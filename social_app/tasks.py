@@ -0,0 +1,48 @@
+"""
+Background tasks. Run them with ``manage.py runworker``, or inline by setting
+TASKS_ALWAYS_EAGER (the development default).
+"""
+
+from django.core.management import call_command
+
+from .deletion import purge
+from .models import Post
+from .taskqueue import task
+from .utils import process_post_content
+
+
+@task(name='process_post_content')
+def process_post_content_task(post_id):
+    """Extract hashtags and fan out mention notifications for a new post."""
+    post = Post.objects.select_related('user').filter(pk=post_id).first()
+    if post is not None:
+        process_post_content(post)
+
+
+@task
+def resize_post_image(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        post.resize_image()
+
+
+@task(max_attempts=1)
+def cleanup_data(days=90):
+    call_command('cleanup_data', days=days)
+
+
+@task(max_attempts=1)
+def archive_notifications(days=None):
+    options = {'days': days} if days is not None else {}
+    call_command('archive_notifications', **options)
+
+
+@task(max_attempts=1)
+def compute_suggestions():
+    call_command('compute_suggestions')
+
+
+@task(max_attempts=5)
+def purge_deletion(deletion_id):
+    """Purge a soft-deleted post or account; a retry resumes where the last attempt stopped."""
+    purge(deletion_id)
@@ -2,6 +2,9 @@
 
 from django import template
 
+from social_app.tiered_cache import tiered_cache
+from social_app.versions import post_scope
+
 # Register the new tag library
 register = template.Library()
 
@@ -11,5 +14,9 @@ def is_liked_by_user(post, user):
     Checks if a post is liked by a specific user.
     Usage: {% with liked_status=post|is_liked_by_user:request.user %}
     """
-    # This calls the correct Python model method!
-    return post.is_liked_by(user)
\ No newline at end of file
+    if not user.is_authenticated:
+        return False
+    # Cached per post/user; the post's namespace is bumped on every like and unlike
+    return tiered_cache.get_or_set(
+        f"liked_by:{user.pk}", lambda: post.is_liked_by(user), namespace=post_scope(post.pk)
+    )
\ No newline at end of file
@@ -1,27 +1,13 @@
 from django import template
 from django.utils.safestring import mark_safe
-import re
+from social_app.text import render
 
 register = template.Library()
 
 @register.filter
 def format_content(content):
     """Format post content to make hashtags and mentions clickable."""
-    # Make hashtags clickable
-    content = re.sub(
-        r'#(\w+)',
-        r'<a href="/hashtag/\1/" class="hashtag-link" style="color: var(--secondary); font-weight: 500;">#\1</a>',
-        content
-    )
-    
-    # Make mentions clickable
-    content = re.sub(
-        r'@(\w+)',
-        r'<a href="/profile/\1/" class="mention-link" style="color: var(--accent); font-weight: 500;">@\1</a>',
-        content
-    )
-    
-    return mark_safe(content)
+    return mark_safe(render(content))
 
 @register.filter
 def truncate_words_html(value, arg):
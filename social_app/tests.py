@@ -1,12 +1,16 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.urls import path
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
-from social_app.models import Profile, Post, Comment, Like, Notification, Hashtag
+from social_app.models import Profile, Post, Comment, Like, Notification, Hashtag, Task
 from social_app.forms import PostCreateForm, CommentForm, ProfileUpdateForm
 import tempfile
 from PIL import Image
 import io
+import os
+from unittest import skipUnless
+from social_app import suggestions
 
 
 class ModelTestCase(TestCase):
@@ -218,3 +222,1908 @@ class UtilsTestCase(TestCase):
                 notification_type='mention'
             ).exists()
         )
+
+
+class DatabaseProfileTestCase(TestCase):
+    def test_sqlite_profile_options(self):
+        """Test the SQLite profile sets pragmas and immediate transactions."""
+        from social_project.database import apply_sqlite_profile
+        database = apply_sqlite_profile({
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': 'db.sqlite3',
+        })
+        options = database['OPTIONS']
+        self.assertEqual(options['transaction_mode'], 'IMMEDIATE')
+        self.assertIn('PRAGMA journal_mode=WAL', options['init_command'])
+        self.assertIn('PRAGMA busy_timeout=5000', options['init_command'])
+        self.assertEqual(options['timeout'], 5)
+
+    def test_sqlite_profile_ignores_other_engines(self):
+        """Test the SQLite profile leaves other backends untouched."""
+        from social_project.database import apply_sqlite_profile
+        database = {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'social_db'}
+        self.assertEqual(apply_sqlite_profile(database), database)
+
+    def test_persistent_connections_configured_per_database(self):
+        """Test CONN_MAX_AGE and health checks land on the database entry."""
+        from social_project.database import configure_connections
+        database = configure_connections(
+            {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'social_db'},
+            conn_max_age=60,
+        )
+        self.assertEqual(database['CONN_MAX_AGE'], 60)
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('OPTIONS', database)
+
+    def test_pool_replaces_persistent_connections(self):
+        """Test enabling the psycopg pool disables CONN_MAX_AGE."""
+        from social_project.database import configure_connections
+        database = configure_connections(
+            {'ENGINE': 'django.db.backends.postgresql', 'NAME': 'social_db'},
+            pool={'min_size': 2, 'max_size': 10},
+        )
+        self.assertEqual(database['CONN_MAX_AGE'], 0)
+        self.assertEqual(database['OPTIONS']['pool'], {'min_size': 2, 'max_size': 10})
+
+    def test_connection_stats_staff_only(self):
+        """Test the connection metrics endpoint is restricted to staff."""
+        User.objects.create_user(username='member', password='testpass123')
+        User.objects.create_user(username='staff', password='testpass123', is_staff=True)
+
+        self.client.login(username='member', password='testpass123')
+        response = self.client.get(reverse('db_connection_stats'))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.login(username='staff', password='testpass123')
+        response = self.client.get(reverse('db_connection_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('default', response.json()['databases'])
+
+
+class ReplicaRouterTestCase(TestCase):
+    def setUp(self):
+        from social_app import routers
+        self.routers = routers
+        self.router = routers.ReplicaRouter()
+        self.tokens = routers.reset_pinning()
+        self.addCleanup(routers.restore_pinning, self.tokens)
+        self.addCleanup(routers._unavailable.clear)
+
+    def test_reads_use_primary_without_replicas(self):
+        """Test reads go to the primary when no replicas are configured."""
+        self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_reads_stick_to_primary_after_write(self):
+        """Test read-your-writes pinning once the request has written."""
+        from unittest import mock
+        from django.test import override_settings
+        with override_settings(DATABASE_REPLICAS=['replica_0']), \
+                mock.patch.object(self.routers, 'replica_is_available', return_value=True):
+            self.assertEqual(self.router.db_for_read(Post), 'replica_0')
+            self.assertEqual(self.router.db_for_write(Like), 'default')
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+
+    def test_writes_outside_a_request_do_not_pin(self):
+        """Test a write in a worker or command leaves later reads on the replicas."""
+        import contextvars
+        from unittest import mock
+        from django.test import override_settings
+
+        def write_then_read():
+            self.router.db_for_write(Like)
+            return self.router.db_for_read(Post)
+
+        with override_settings(DATABASE_REPLICAS=['replica_0']), \
+                mock.patch.object(self.routers, 'replica_is_available', return_value=True):
+            self.assertEqual(contextvars.Context().run(write_then_read), 'replica_0')
+
+    def test_login_does_not_pin(self):
+        """Test the session save and last_login update of a login set no pinning cookie."""
+        from django.test import override_settings
+        from social_app.middleware import PRIMARY_PIN_COOKIE
+        User.objects.create_user(username='reader', password='testpass123')
+        with override_settings(DATABASE_REPLICAS=['missing_replica']):
+            response = self.client.post(reverse('login'), {'username': 'reader', 'password': 'testpass123'})
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn(PRIMARY_PIN_COOKIE, response.cookies)
+        self.assertIsNotNone(User.objects.get(username='reader').last_login)
+
+    def test_unavailable_replica_falls_back_to_primary(self):
+        """Test a replica that cannot connect is skipped."""
+        from django.test import override_settings
+        with override_settings(DATABASE_REPLICAS=['missing_replica']):
+            self.assertEqual(self.router.db_for_read(Post), 'default')
+            self.assertIn('missing_replica', self.routers._unavailable)
+
+    def test_middleware_sets_pin_cookie_after_write(self):
+        """Test the pinning cookie is set on responses to writing requests."""
+        from django.test import override_settings
+        from social_app.middleware import PRIMARY_PIN_COOKIE
+        user = User.objects.create_user(username='writer', password='testpass123')
+        post = Post.objects.create(user=user, content="Pinned read")
+        self.client.login(username='writer', password='testpass123')
+        with override_settings(DATABASE_REPLICAS=['missing_replica']):
+            response = self.client.post(reverse('like_post_toggle', kwargs={'post_id': post.id}))
+            self.assertIn(PRIMARY_PIN_COOKIE, response.cookies)
+
+
+# URLconf serving the native async views, as urls.py does when ASYNC_VIEWS is on
+def async_urlpatterns():
+    from social_app import async_views
+    from social_project.urls import urlpatterns
+    return [
+        path('', async_views.feed_view, name='feed'),
+        path('post/<int:post_id>/like/', async_views.like_post_toggle, name='like_post_toggle'),
+        path('notifications/', async_views.notifications_view, name='notifications'),
+        path('api/notifications/unread-count/', async_views.unread_notifications_count,
+             name='unread_notifications_count'),
+    ] + urlpatterns
+
+
+urlpatterns = async_urlpatterns()
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.user2 = User.objects.create_user(username='testuser2', password='testpass123')
+        self.post = Post.objects.create(user=self.user2, content="Async post")
+
+    async def test_async_feed_view(self):
+        """Test the async feed renders posts."""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('feed'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Async post')
+
+    async def test_async_feed_conditional_get(self):
+        """Test the async feed sends an ETag and answers 304 to a matching request."""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('feed'))
+        response = await self.async_client.get(
+            reverse('feed'), headers={'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_async_feed_requires_login(self):
+        """Test the async feed redirects anonymous users."""
+        response = await self.async_client.get(reverse('feed'))
+        self.assertEqual(response.status_code, 302)
+
+    async def test_async_like_toggle_and_unread_count(self):
+        """Test async like toggle notifies the author and updates counts."""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(
+            reverse('like_post_toggle', kwargs={'post_id': self.post.id}),
+            headers={'X-Requested-With': 'XMLHttpRequest'}
+        )
+        self.assertEqual(response.json(), {'liked': True, 'likes_count': 1})
+
+        await self.async_client.aforce_login(self.user2)
+        response = await self.async_client.get(reverse('unread_notifications_count'))
+        self.assertEqual(response.json(), {'count': 1})
+
+        response = await self.async_client.get(reverse('notifications'))
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(reverse('unread_notifications_count'))
+        self.assertEqual(response.json(), {'count': 0})
+
+
+    def cache_calls_on_loop(self):
+        """Record the cache methods called from the event loop thread (blocking round trips)."""
+        import contextlib
+        import threading
+        from unittest import mock
+        from django.core.cache.backends.locmem import LocMemCache
+        loop_thread, calls = threading.get_ident(), []
+
+        def recording(name):
+            original = getattr(LocMemCache, name)
+
+            def method(cache, *args, **kwargs):
+                if threading.get_ident() == loop_thread:
+                    calls.append(name)
+                return original(cache, *args, **kwargs)
+            return method
+
+        stack = contextlib.ExitStack()
+        for name in ('get', 'get_many', 'add', 'set', 'incr'):
+            stack.enter_context(mock.patch.object(LocMemCache, name, recording(name)))
+        return stack, calls
+
+    async def test_async_feed_does_not_block_loop(self):
+        """Test the async feed reads its version counters off the event loop."""
+        await self.async_client.aforce_login(self.user)
+        stack, calls = self.cache_calls_on_loop()
+        with stack:
+            response = await self.async_client.get(reverse('feed'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(calls, [])
+
+    async def test_async_etag_and_seen_watermark_do_not_block_loop(self):
+        """Test ETag checks and the seen watermark reach the cache off the event loop."""
+        await self.async_client.aforce_login(self.user2)
+        stack, calls = self.cache_calls_on_loop()
+        with stack:
+            response = await self.async_client.get(reverse('unread_notifications_count'))
+            await self.async_client.get(reverse('unread_notifications_count'),
+                                        headers={'If-None-Match': response['ETag']})
+            await self.async_client.get(reverse('notifications'))
+        self.assertEqual(calls, [])
+
+@override_settings(TASKS_ALWAYS_EAGER=False)
+class TaskQueueTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.mentioned = User.objects.create_user(username='mentioned', password='testpass123')
+
+    def test_claim_is_exclusive(self):
+        """Test a claimed task is not handed to a second worker."""
+        from social_app.taskqueue import claim_tasks, enqueue
+        enqueue('resize_post_image', {'post_id': 0})
+        self.assertEqual(len(claim_tasks('worker-1', limit=5)), 1)
+        self.assertEqual(claim_tasks('worker-2', limit=5), [])
+
+    def test_failed_task_retries_with_backoff(self):
+        """Test a failing task is requeued into the future, then marked failed."""
+        from django.utils import timezone
+        from social_app.taskqueue import claim_tasks, enqueue, run_task
+        task = enqueue('process_post_content', {'missing_argument': 1}, max_attempts=2)
+
+        run_task(claim_tasks('worker')[0])
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS_QUEUED)
+        self.assertGreater(task.run_at, timezone.now())
+        self.assertIn('TypeError', task.last_error)
+
+        Task.objects.filter(pk=task.pk).update(run_at=timezone.now())
+        run_task(claim_tasks('worker')[0])
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS_FAILED)
+        self.assertEqual(task.attempts, 2)
+
+
+    def test_heartbeat_keeps_lease(self):
+        """Test a running task's heartbeat stops it being reclaimed as abandoned."""
+        from datetime import timedelta
+        from django.utils import timezone
+        from social_app.taskqueue import _Heartbeat, claim_tasks, enqueue
+        enqueue('resize_post_image', {'post_id': 0})
+        task = claim_tasks('worker-1')[0]
+        Task.objects.filter(pk=task.pk).update(locked_at=timezone.now() - timedelta(seconds=240))
+
+        self.assertTrue(_Heartbeat([task]).beat())
+        with override_settings(TASK_LOCK_TIMEOUT=120):
+            self.assertEqual(claim_tasks('worker-2'), [])
+
+    def test_batch_heartbeat_keeps_waiting_tasks(self):
+        """Test tasks waiting behind the running one in a batch keep their leases."""
+        from datetime import timedelta
+        from django.utils import timezone
+        from social_app.taskqueue import _Heartbeat, claim_tasks, enqueue
+        for _ in range(2):
+            enqueue('resize_post_image', {'post_id': 0})
+        batch = claim_tasks('worker-1', limit=2)
+        self.assertEqual(len(batch), 2)
+        Task.objects.update(locked_at=timezone.now() - timedelta(seconds=240))
+
+        self.assertTrue(_Heartbeat(batch).beat())
+        with override_settings(TASK_LOCK_TIMEOUT=120):
+            self.assertEqual(claim_tasks('worker-2', limit=2), [])
+
+    def test_abandoned_last_attempt_is_failed(self):
+        """Test a task abandoned on its last attempt is marked failed, not claimed again."""
+        from datetime import timedelta
+        from django.utils import timezone
+        from social_app.taskqueue import claim_tasks, enqueue
+        enqueue('resize_post_image', {'post_id': 0}, max_attempts=1)
+        task = claim_tasks('worker-1')[0]
+        Task.objects.filter(pk=task.pk).update(locked_at=timezone.now() - timedelta(seconds=600))
+
+        self.assertEqual(claim_tasks('worker-2'), [])
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, task.locked_by), (Task.STATUS_FAILED, 1, ''))
+
+    def test_expired_lease_does_not_record_outcome(self):
+        """Test a worker that lost its lease leaves the task to the worker that took it over."""
+        from datetime import timedelta
+        from django.utils import timezone
+        from social_app.taskqueue import _Heartbeat, claim_tasks, enqueue, run_task
+        enqueue('resize_post_image', {'post_id': 0})
+        first = claim_tasks('worker-1')[0]
+        Task.objects.filter(pk=first.pk).update(locked_at=timezone.now() - timedelta(seconds=600))
+        second = claim_tasks('worker-2')[0]
+
+        self.assertFalse(_Heartbeat([first]).beat())
+        run_task(first)
+        second.refresh_from_db()
+        self.assertEqual(second.status, Task.STATUS_RUNNING)
+        self.assertTrue(second.locked_by.startswith('worker-2'))
+        run_task(second)
+        second.refresh_from_db()
+        self.assertEqual(second.status, Task.STATUS_DONE)
+
+@override_settings(TASKS_ALWAYS_EAGER=False)
+class RunWorkerTestCase(TransactionTestCase):
+    # Worker threads use their own connections, so data must be committed
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.mentioned = User.objects.create_user(username='mentioned', password='testpass123')
+
+    def test_post_processing_is_queued(self):
+        """Test hashtag and mention processing runs in the worker, not the request."""
+        from django.core.management import call_command
+        self.client.login(username='testuser', password='testpass123')
+        self.client.post(reverse('post_create'), {'content': 'Queued #later @mentioned'})
+
+        self.assertFalse(Hashtag.objects.filter(name='later').exists())
+        task = Task.objects.get(name='process_post_content')
+        self.assertEqual(task.status, Task.STATUS_QUEUED)
+
+        call_command('runworker', '--once', '--concurrency=1', stdout=io.StringIO())
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS_DONE)
+        self.assertEqual(task.attempts, 1)
+        self.assertIsNotNone(task.duration_ms)
+        self.assertTrue(Hashtag.objects.filter(name='later').exists())
+        self.assertTrue(Notification.objects.filter(recipient=self.mentioned).exists())
+
+
+class NotificationAggregationTestCase(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.post = Post.objects.create(user=self.author, content="Viral post")
+        self.fans = [
+            User.objects.create_user(username=f'fan{i}', password='testpass123')
+            for i in range(5)
+        ]
+
+    def like(self, user):
+        from social_app.utils import create_notification
+        return create_notification(
+            recipient=self.author, sender=user, notification_type='like',
+            message=f"{user.username} liked your post", post=self.post
+        )
+
+    def test_likes_collapse_into_one_row(self):
+        """Test likes on one post update a single notification in place."""
+        for fan in self.fans:
+            self.like(fan)
+
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual(notification.actor_count, 5)
+        self.assertEqual(notification.sender, self.fans[-1])
+        self.assertEqual(notification.recent_actors, ['fan4', 'fan3', 'fan2'])
+        self.assertEqual(notification.message, 'fan4, fan3, fan2 and 2 others liked your post')
+
+        self.client.login(username='author', password='testpass123')
+        response = self.client.get(reverse('notifications'))
+        self.assertContains(response, ', fan3, fan2 and 2 others liked your post')
+
+    def test_unlike_removes_actor(self):
+        """Test retracting a like updates the aggregate and deletes it when empty."""
+        from social_app.utils import retract_notification
+        self.like(self.fans[0])
+        self.like(self.fans[1])
+
+        retract_notification(self.author, self.fans[1], 'like', post=self.post)
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual(notification.actor_count, 1)
+        self.assertEqual(notification.sender, self.fans[0])
+        self.assertEqual(notification.message, 'fan0 liked your post')
+
+        retract_notification(self.author, self.fans[0], 'like', post=self.post)
+        self.assertFalse(Notification.objects.filter(recipient=self.author).exists())
+
+    def unlike(self, user):
+        from social_app.utils import retract_notification
+        Like.objects.filter(user=user, post=self.post).delete()
+        retract_notification(self.author, user, 'like', post=self.post)
+
+    def test_unlike_by_unnamed_actor_lowers_count(self):
+        """Test an unlike from an actor past the named few still lowers the aggregate's count."""
+        for fan in self.fans:
+            Like.objects.create(user=fan, post=self.post)
+            self.like(fan)
+
+        self.unlike(self.fans[0])
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual(notification.actor_count, 4)
+        self.assertEqual(notification.recent_actors, ['fan4', 'fan3', 'fan2'])
+        self.assertEqual(notification.message, 'fan4, fan3, fan2 and 1 other liked your post')
+
+    def test_named_actors_are_refilled_from_likes(self):
+        """Test the aggregate survives its named actors leaving and names the remaining likers."""
+        for fan in self.fans:
+            Like.objects.create(user=fan, post=self.post)
+            self.like(fan)
+
+        for fan in reversed(self.fans[2:]):
+            self.unlike(fan)
+        notification = Notification.objects.get(recipient=self.author)
+        self.assertEqual(notification.actor_count, 2)
+        self.assertEqual(notification.sender, self.fans[1])
+        self.assertEqual(notification.recent_actors, ['fan1', 'fan0'])
+        self.assertEqual(notification.message, 'fan1 and fan0 liked your post')
+
+        self.unlike(self.fans[1])
+        self.unlike(self.fans[0])
+        self.assertFalse(Notification.objects.filter(recipient=self.author).exists())
+
+    def test_comments_are_not_aggregated(self):
+        """Test non-aggregated types still create one row per event."""
+        from social_app.utils import create_notification
+        for fan in self.fans[:2]:
+            create_notification(
+                recipient=self.author, sender=fan, notification_type='comment',
+                message=f"{fan.username} commented on your post", post=self.post
+            )
+        self.assertEqual(Notification.objects.filter(recipient=self.author).count(), 2)
+
+
+class NotificationWatermarkTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.sender = User.objects.create_user(username='sender', password='testpass123')
+        self.post = Post.objects.create(user=self.user, content="Watermarked")
+        self.notifications = [
+            Notification.objects.create(
+                recipient=self.user, sender=self.sender, notification_type='comment',
+                post=self.post, message='sender commented on your post'
+            )
+            for _ in range(3)
+        ]
+        self.client.login(username='testuser', password='testpass123')
+
+    def unread_count(self):
+        return self.client.get(reverse('unread_notifications_count')).json()['count']
+
+    def test_viewing_notifications_moves_watermark(self):
+        """Test marking all read writes the watermark instead of every row."""
+        self.assertEqual(self.unread_count(), 3)
+        self.client.get(reverse('notifications'))
+
+        self.user.profile.refresh_from_db()
+        self.assertIsNotNone(self.user.profile.notifications_seen_at)
+        self.assertEqual(Notification.objects.filter(is_read=True).count(), 0)
+        self.assertEqual(self.unread_count(), 0)
+
+        Notification.objects.create(
+            recipient=self.user, sender=self.sender, notification_type='follow',
+            message='sender started following you'
+        )
+        self.assertEqual(self.unread_count(), 1)
+
+    def test_open_single_notification(self):
+        """Test opening one notification marks only that item read."""
+        notification = self.notifications[0]
+        response = self.client.get(reverse('open_notification', kwargs={'notification_id': notification.id}))
+        self.assertRedirects(response, reverse('post_detail', kwargs={'post_id': self.post.id}))
+
+        notification.refresh_from_db()
+        self.assertTrue(notification.is_read)
+        self.assertEqual(self.unread_count(), 2)
+
+
+class CleanupDataTestCase(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.sender = User.objects.create_user(username='sender', password='testpass123')
+        old = timezone.now() - timedelta(days=120)
+        for is_read in (True, True, True, True, True, False):
+            notification = Notification.objects.create(
+                recipient=self.user, sender=self.sender, notification_type='comment',
+                message='sender commented on your post', is_read=is_read
+            )
+            Notification.objects.filter(pk=notification.pk).update(created_at=old)
+        Hashtag.objects.create(name='unused')
+        self.state_file = tempfile.NamedTemporaryFile(suffix='.json', delete=False).name
+        self.addCleanup(lambda: os.path.exists(self.state_file) and os.remove(self.state_file))
+
+    def run_cleanup(self, *args):
+        from django.core.management import call_command
+        out = io.StringIO()
+        call_command('cleanup_data', '--state-file', self.state_file, *args, stdout=out)
+        return out.getvalue()
+
+    def test_batched_cleanup(self):
+        """Test old read notifications and unused hashtags are deleted in batches."""
+        output = self.run_cleanup('--batch-size=2')
+        self.assertIn('Deleted 5 old read notifications', output)
+        self.assertIn('notifications: 5 in 3 batch(es)', output)
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertFalse(Hashtag.objects.exists())
+
+    def test_resume_from_checkpoint(self):
+        """Test --resume skips rows before the saved checkpoint."""
+        from social_app.batching import Checkpoint
+        ids = list(Notification.objects.order_by('pk').values_list('pk', flat=True))
+        Checkpoint(self.state_file).set('notifications', ids[2])
+
+        self.run_cleanup('--resume')
+        self.assertEqual(Notification.objects.filter(pk__lte=ids[2]).count(), 3)
+        self.assertEqual(Notification.objects.filter(pk__gt=ids[2]).count(), 1)
+        self.assertIsNone(Checkpoint(self.state_file).get('notifications'))
+
+    def test_rows_matching_again_are_kept(self):
+        """Test a row that stops matching between a batch's SELECT and its DELETE is kept."""
+        from unittest import mock
+        from django.db.models.deletion import Collector
+        from social_app.batching import delete_in_batches
+        hashtag = Hashtag.objects.get(name='unused')
+        post = Post.objects.create(user=self.user, content='#unused')
+        can_fast_delete = Collector.can_fast_delete
+
+        def tag_then_check(collector, objs, *args, **kwargs):
+            hashtag.posts.add(post)  # a post is tagged after the orphan was picked
+            return can_fast_delete(collector, objs, *args, **kwargs)
+
+        with mock.patch.object(Collector, 'can_fast_delete', tag_then_check):
+            stats = delete_in_batches(Hashtag.objects.filter(posts__isnull=True), 'hashtags')
+        self.assertEqual(stats.rows, 0)
+        self.assertTrue(Hashtag.objects.filter(pk=hashtag.pk).exists())
+
+    def test_prune_orphaned_media(self):
+        """Test unreferenced media files are removed and referenced ones kept, soft-deleted posts' too."""
+        from datetime import timedelta
+        from django.utils import timezone
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            os.makedirs(os.path.join(media_root, 'posts', 'images'))
+            old = (timezone.now() - timedelta(days=2)).timestamp()
+            for name in ('kept.png', 'deleted.png', 'orphan.png'):
+                path = os.path.join(media_root, 'posts', 'images', name)
+                open(path, 'wb').close()
+                os.utime(path, (old, old))
+            Post.objects.bulk_create([
+                Post(user=self.user, content='x', image='posts/images/kept.png'),
+                # Waiting to be purged, which removes the file itself
+                Post(user=self.user, content='y', image='posts/images/deleted.png', deleted_at=timezone.now()),
+            ])
+
+            output = self.run_cleanup('--prune-media', '--concurrency=1')
+            self.assertIn('Deleted 1 orphaned media files', output)
+            self.assertTrue(os.path.exists(os.path.join(media_root, 'posts', 'images', 'kept.png')))
+            self.assertTrue(os.path.exists(os.path.join(media_root, 'posts', 'images', 'deleted.png')))
+            self.assertFalse(os.path.exists(os.path.join(media_root, 'posts', 'images', 'orphan.png')))
+
+
+class NotificationArchiveTestCase(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.sender = User.objects.create_user(username='sender', password='testpass123')
+        self.post = Post.objects.create(user=self.user, content='Archived post')
+        now = timezone.now()
+        # 25 notifications, one per day, the newest first
+        for day in range(25):
+            notification = Notification.objects.create(
+                recipient=self.user, sender=self.sender, notification_type='comment',
+                message=f'comment {day}', post=self.post
+            )
+            Notification.objects.filter(pk=notification.pk).update(
+                created_at=now - timedelta(days=day * 3)
+            )
+        self.state_file = tempfile.NamedTemporaryFile(suffix='.json', delete=False).name
+        self.addCleanup(lambda: os.path.exists(self.state_file) and os.remove(self.state_file))
+
+    def archive(self, *args):
+        from django.core.management import call_command
+        out = io.StringIO()
+        call_command('archive_notifications', '--state-file', self.state_file, *args, stdout=out)
+        return out.getvalue()
+
+    def test_archive_moves_old_rows(self):
+        """Test notifications past the hot window move to the archive in batches."""
+        from social_app.models import ArchivedNotification
+        output = self.archive('--days=30', '--batch-size=4')
+        # Days 0..30 stay hot (0, 3, ..., 27), the remaining 15 are archived
+        self.assertIn('Archived 15 notifications', output)
+        self.assertEqual(Notification.objects.count(), 10)
+        self.assertEqual(ArchivedNotification.objects.count(), 15)
+        archived = ArchivedNotification.objects.order_by('-created_at').first()
+        self.assertEqual(archived.message, 'comment 10')
+        self.assertEqual(archived.post, self.post)
+        self.assertTrue(archived.is_archived)
+
+    def test_notifications_view_pages_into_archive(self):
+        """Test the notifications page continues into the archive past the hot rows."""
+        self.archive('--days=30')
+        self.client.login(username='testuser', password='testpass123')
+
+        first = self.client.get(reverse('notifications'))
+        messages = [n.message for n in first.context['notifications']]
+        self.assertEqual(messages, [f'comment {day}' for day in range(20)])
+        self.assertEqual(first.context['page_obj'].paginator.count, 25)
+
+        second = self.client.get(reverse('notifications'), {'page': 2})
+        messages = [n.message for n in second.context['notifications']]
+        self.assertEqual(messages, [f'comment {day}' for day in range(20, 25)])
+        self.assertContains(second, reverse('post_detail', args=[self.post.id]))
+
+    def test_archiving_invalidates_notification_etags(self):
+        """Test moving rows to the archive bumps the recipient's notification version."""
+        from social_app.versions import get_versions, notifications_scope
+        before, other = get_versions(notifications_scope(self.user.pk), notifications_scope(self.sender.pk))
+        self.archive('--days=30', '--batch-size=4')
+        after, other_after = get_versions(notifications_scope(self.user.pk), notifications_scope(self.sender.pk))
+        self.assertNotEqual(after, before)
+        self.assertEqual(other_after, other)
+
+    def test_pages_within_hot_rows_do_not_count_archive(self):
+        """Test the archive is only counted once a page reaches past the hot rows."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from social_app.models import ArchivedNotification
+        # Days 0..63 stay hot (22 rows), the last 3 are archived
+        self.archive('--days=66')
+        table = ArchivedNotification._meta.db_table
+        self.client.login(username='testuser', password='testpass123')
+
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get(reverse('notifications'))
+        self.assertFalse([q for q in queries if table in q['sql'] and 'COUNT' in q['sql']])
+        self.assertTrue(first.context['page_obj'].has_next())
+        self.assertEqual(len(first.context['notifications']), 20)
+
+        second = self.client.get(reverse('notifications'), {'page': 2})
+        self.assertEqual(second.context['page_obj'].paginator.count, 25)
+        messages = [n.message for n in second.context['notifications']]
+        self.assertEqual(messages, [f'comment {day}' for day in range(20, 25)])
+
+    def test_tiered_slice_spans_both_tables(self):
+        """Test a slice crossing the boundary reads the tail of hot and head of the archive."""
+        from social_app.archive import TieredNotifications
+        self.archive('--days=30')
+        tiers = TieredNotifications.for_user(self.user)
+        self.assertEqual(len(tiers), 25)
+        page = tiers[8:12]
+        self.assertEqual([n.message for n in page], [f'comment {day}' for day in range(8, 12)])
+        self.assertEqual([n.is_archived for n in page], [False, False, True, True])
+
+
+class FollowGraphTestCase(TestCase):
+    def setUp(self):
+        from social_app.graph import follow_graph
+        self.graph = follow_graph
+        self.graph.reset()
+        self.addCleanup(self.graph.reset)
+        self.alice = User.objects.create_user(username='alice', password='testpass123')
+        self.bob = User.objects.create_user(username='bob', password='testpass123')
+        self.carol = User.objects.create_user(username='carol', password='testpass123')
+        self.alice.profile.follows.add(self.bob.profile, self.carol.profile)
+        self.bob.profile.follows.add(self.alice.profile)
+
+    def test_lookups_without_queries(self):
+        """Test relationship lookups are served from the loaded index."""
+        self.graph.following_ids(self.alice.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(self.graph.is_following(self.alice.id, self.bob.id))
+            self.assertFalse(self.graph.is_following(self.carol.id, self.alice.id))
+            self.assertTrue(self.graph.is_mutual(self.alice.id, self.bob.id))
+            self.assertEqual(self.graph.mutual_ids(self.alice.id), [self.bob.id])
+            self.assertEqual(self.graph.follower_count(self.alice.id), 1)
+            relationships = self.graph.relationships(self.alice.id, [self.bob.id, self.carol.id])
+        self.assertEqual(relationships[self.bob.id], {'following': True, 'followed_by': True})
+        self.assertEqual(relationships[self.carol.id], {'following': True, 'followed_by': False})
+
+    def test_index_follows_m2m_changes(self):
+        """Test follows/unfollows from either side of the relation update the index."""
+        self.graph.following_ids(self.alice.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.profile.follows.remove(self.carol.profile)
+            self.carol.profile.followers.add(self.bob.profile)
+        self.assertFalse(self.graph.is_following(self.alice.id, self.carol.id))
+        self.assertTrue(self.graph.is_following(self.bob.id, self.carol.id))
+        self.assertEqual(self.graph.follower_ids(self.carol.id), (self.bob.id,))
+
+    def test_rolled_back_follow_is_not_indexed(self):
+        """Test the index only changes once the follow commits."""
+        from django.db import transaction
+        self.graph.following_ids(self.alice.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.carol.profile.follows.add(self.alice.profile)
+                    self.assertFalse(self.graph.is_following(self.carol.id, self.alice.id))
+                    raise RuntimeError('rollback')
+            except RuntimeError:
+                pass
+        self.assertFalse(self.graph.is_following(self.carol.id, self.alice.id))
+
+    def test_evicted_version_does_not_repeat(self):
+        """Test a version counter lost from the cache never matches the version a process loaded."""
+        from django.core.cache import cache
+        from social_app.graph import VERSION_KEY, FollowGraph
+        cache.set(VERSION_KEY, 1, timeout=None)
+        self.assertFalse(self.graph.is_following(self.carol.id, self.alice.id))
+
+        # Another process writes an edge after the counter was evicted
+        Profile.follows.through.objects.create(from_profile=self.carol.profile, to_profile=self.alice.profile)
+        cache.delete(VERSION_KEY)
+        FollowGraph()._bump_version()
+        self.assertTrue(self.graph.is_following(self.carol.id, self.alice.id))
+
+    def test_follow_toggle_uses_graph(self):
+        """Test the follow toggle and profile page agree with the index."""
+        self.client.login(username='carol', password='testpass123')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('follow_user_toggle', args=['alice']))
+        self.assertTrue(self.graph.is_following(self.carol.id, self.alice.id))
+        self.assertTrue(self.carol.profile.follows.filter(user=self.alice).exists())
+
+        response = self.client.get(reverse('profile', args=['alice']))
+        self.assertTrue(response.context['is_following'])
+        self.assertTrue(response.context['follows_you'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('follow_user_toggle', args=['alice']))
+        self.assertFalse(self.graph.is_following(self.carol.id, self.alice.id))
+
+
+class FollowSuggestionTestCase(TestCase):
+    def setUp(self):
+        from social_app.graph import follow_graph
+        follow_graph.reset()
+        self.addCleanup(follow_graph.reset)
+        self.users = {
+            name: User.objects.create_user(username=name, password='testpass123')
+            for name in ('alice', 'bob', 'carol', 'dave', 'erin')
+        }
+        profile = {name: user.profile for name, user in self.users.items()}
+        # alice -> bob, carol; both follow dave, carol also follows erin
+        profile['alice'].follows.add(profile['bob'], profile['carol'])
+        profile['bob'].follows.add(profile['dave'])
+        profile['carol'].follows.add(profile['dave'], profile['erin'])
+        # alice and erin share a hashtag
+        tag = Hashtag.objects.create(name='django')
+        for name in ('alice', 'erin'):
+            tag.posts.add(Post.objects.create(user=self.users[name], content='#django'))
+
+    def test_second_degree_and_hashtags_scored(self):
+        """Test mutual connections outrank a shared hashtag and followed users are skipped."""
+        from social_app.models import FollowSuggestion
+        from social_app.suggestions import compute_suggestions
+        stats = compute_suggestions(top_k=3, use_sparse=False)
+        self.assertEqual(stats['users'], 5)
+
+        rows = list(FollowSuggestion.objects.filter(user=self.users['alice']).order_by('rank'))
+        self.assertEqual([row.suggested.username for row in rows], ['dave', 'erin'])
+        self.assertEqual(rows[0].mutual_count, 2)
+        self.assertEqual((rows[1].mutual_count, rows[1].shared_hashtags), (1, 1))
+
+    def test_cold_start_padded_with_popular_accounts(self):
+        """Test users without connections get the most followed accounts."""
+        from social_app.models import FollowSuggestion
+        from social_app.suggestions import compute_suggestions
+        compute_suggestions(top_k=2, use_sparse=False)
+        names = list(FollowSuggestion.objects.filter(
+            user=self.users['dave']
+        ).order_by('rank').values_list('suggested__username', flat=True))
+        # dave has the most followers but is never suggested to themselves; ties go by id
+        self.assertEqual(names, ['bob', 'carol'])
+
+    def test_deactivated_accounts_not_suggested(self):
+        """Test accounts deactivated after the batch run are not served as suggestions."""
+        suggestions.compute_suggestions(top_k=3, use_sparse=False)
+        dave = self.users['dave']
+        dave.is_active = False
+        dave.save()
+        names = [row.suggested.username for row in suggestions.suggestions_for(self.users['alice'])]
+        self.assertEqual(names, ['erin'])
+
+    def test_soft_deleted_posts_share_no_hashtags(self):
+        """Test hashtags of posts waiting to be purged do not link their authors."""
+        from django.utils import timezone
+        Post.all_objects.filter(user=self.users['erin']).update(deleted_at=timezone.now())
+        _, _, tags = suggestions.load_graph()
+        self.assertEqual([user_id for user_id, _ in tags], [self.users['alice'].pk])
+
+    @skipUnless(suggestions.sparse is not None, 'needs numpy and scipy')
+    def test_sparse_scorer_matches_python(self):
+        """Test the sparse scorer ranks the same candidates with the same scores as the pure-Python one."""
+        user_ids, edges, tags = suggestions.load_graph()
+        weights = suggestions._weights()
+        expected = dict(suggestions.score_python(user_ids, edges, tags, 3, weights))
+        # A small batch size so the fixture spans several matrix slices
+        actual = dict(suggestions.score_sparse(user_ids, edges, tags, 3, weights, batch_size=2))
+        self.assertEqual(actual.keys(), expected.keys())
+        for user_id, rows in expected.items():
+            self.assertEqual(
+                [(row[0], row[2], row[3]) for row in actual[user_id]],
+                [(row[0], row[2], row[3]) for row in rows],
+            )
+            for got, want in zip(actual[user_id], rows):
+                self.assertAlmostEqual(got[1], want[1])
+
+    def test_feed_serves_precomputed_suggestions(self):
+        """Test the feed shows stored suggestions, hiding accounts followed since."""
+        from social_app.suggestions import compute_suggestions
+        compute_suggestions(top_k=3, use_sparse=False)
+        self.users['alice'].profile.follows.add(self.users['dave'].profile)
+        self.client.login(username='alice', password='testpass123')
+        response = self.client.get(reverse('feed'))
+        names = [row.suggested.username for row in response.context['suggestions']]
+        self.assertEqual(names, ['erin'])
+        self.assertContains(response, 'Who to follow')
+
+
+class RankedFeedTestCase(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.core.cache import cache
+        from django.utils import timezone
+        from social_app.graph import follow_graph
+        cache.clear()
+        follow_graph.reset()
+        self.addCleanup(follow_graph.reset)
+        self.viewer = User.objects.create_user(username='viewer', password='testpass123')
+        self.friend = User.objects.create_user(username='friend', password='testpass123')
+        self.stranger = User.objects.create_user(username='stranger', password='testpass123')
+        self.viewer.profile.follows.add(self.friend.profile)
+
+        now = timezone.now()
+        self.fresh = Post.objects.create(user=self.stranger, content='Fresh but unknown')
+        self.friend_post = Post.objects.create(user=self.friend, content='From a friend')
+        self.old = Post.objects.create(user=self.stranger, content='Too old to rank')
+        self.own = Post.objects.create(user=self.viewer, content='My own post')
+        Post.objects.filter(pk=self.friend_post.pk).update(created_at=now - timedelta(hours=6))
+        Post.objects.filter(pk=self.old.pk).update(created_at=now - timedelta(days=10))
+        # The viewer has engaged with friend before
+        earlier = Post.objects.create(user=self.friend, content='Earlier')
+        Post.objects.filter(pk=earlier.pk).update(created_at=now - timedelta(days=5))
+        Like.objects.create(user=self.viewer, post=earlier)
+
+    def test_affinity_outranks_recency(self):
+        """Test a followed, liked author beats a fresher post and old/own posts are skipped."""
+        from social_app.ranking import rank_posts
+        self.assertEqual(rank_posts(self.viewer), [self.friend_post.pk, self.fresh.pk])
+
+    def test_own_post_tags_count_once(self):
+        """Test a tag on the viewer's own post counts once however many likes that post has."""
+        from django.utils import timezone
+        from social_app.ranking import load_features
+        tag = Hashtag.objects.create(name='x')
+        tag.posts.add(self.own, self.fresh)
+        for i in range(5):
+            fan = User.objects.create_user(username=f'fan{i}', password='testpass123')
+            Like.objects.create(user=fan, post=self.own)
+        features = load_features(self.viewer, [self.fresh.pk], timezone.now())
+        self.assertEqual(features['hashtags'], [1])
+
+    def test_soft_deleted_posts_not_trending_candidates(self):
+        """Test tagged posts waiting to be purged are not picked up through trending hashtags."""
+        from django.utils import timezone
+        from social_app.ranking import candidate_ids
+        tag = Hashtag.objects.create(name='x')
+        deleted = Post.objects.create(user=self.stranger, content='#x')
+        tag.posts.add(deleted)
+        Post.all_objects.filter(pk=deleted.pk).update(deleted_at=timezone.now())
+        self.assertNotIn(deleted.pk, candidate_ids(self.viewer, timezone.now()))
+
+    def test_velocity_scores_engagement(self):
+        """Test recent likes and comments lift a post."""
+        from social_app.ranking import rank_posts
+        for i in range(5):
+            fan = User.objects.create_user(username=f'fan{i}', password='testpass123')
+            Like.objects.create(user=fan, post=self.fresh)
+            Comment.objects.create(user=fan, post=self.fresh, text='Nice')
+        self.assertEqual(rank_posts(self.viewer)[0], self.fresh.pk)
+
+    def test_for_you_view_uses_cached_ranking(self):
+        """Test the feed pages through the cached ranking without re-ranking."""
+        from django.core.cache import cache
+        from social_app.ranking import cache_key
+        self.client.login(username='viewer', password='testpass123')
+        response = self.client.get(reverse('for_you_feed'))
+        self.assertEqual([p.pk for p in response.context['posts']], [self.friend_post.pk, self.fresh.pk])
+        self.assertEqual(response.context['feed_type'], 'for_you')
+
+        cache.set(cache_key(self.viewer.id), [self.fresh.pk, 999999])
+        response = self.client.get(reverse('for_you_feed'))
+        self.assertEqual([p.pk for p in response.context['posts']], [self.fresh.pk])
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.post = Post.objects.create(user=self.author, content='Hello')
+        self.client.login(username='testuser', password='testpass123')
+
+    def revalidate(self, url, etag, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+
+    def test_feed_not_modified_until_post_changes(self):
+        """Test the feed answers 304 until a like or new post bumps its version."""
+        url = reverse('feed')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+        self.assertEqual(self.revalidate(url, etag, page=2).status_code, 200)
+
+        Like.objects.create(user=self.author, post=self.post)
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_new_session_gets_fresh_page(self):
+        """Test logging in again revalidates to a new page, as the old one holds a stale CSRF token."""
+        url = reverse('feed')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('Cookie', response['Vary'])
+
+        self.client.logout()
+        self.client.login(username='testuser', password='testpass123')
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_profile_etag_tracks_follows(self):
+        """Test following the profile owner invalidates the profile ETag."""
+        url = reverse('profile', args=['author'])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+        self.user.profile.follows.add(self.author.profile)
+        self.assertEqual(self.revalidate(url, etag).status_code, 200)
+
+    def test_clearing_relations_bumps_other_side(self):
+        """Test clearing follows or a post's hashtags bumps the users and tags that were linked."""
+        from social_app.versions import get_versions, hashtag_scope, user_scope
+        tag = Hashtag.objects.create(name='django')
+        tag.posts.add(self.post)
+        self.user.profile.follows.add(self.author.profile)
+        scopes = (user_scope(self.author.pk), hashtag_scope(tag.pk))
+        before = get_versions(*scopes)
+
+        self.user.profile.follows.clear()
+        self.post.hashtags.clear()
+        after = get_versions(*scopes)
+        self.assertNotEqual(after[0], before[0])
+        self.assertNotEqual(after[1], before[1])
+
+    def test_unread_count_etag(self):
+        """Test the unread count endpoint revalidates against new notifications."""
+        url = reverse('unread_notifications_count')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.revalidate(url, etag).status_code, 304)
+        Notification.objects.create(
+            recipient=self.user, sender=self.author, notification_type='comment', message='hi'
+        )
+        response = self.revalidate(url, etag)
+        self.assertEqual(response.json()['count'], 1)
+
+    def test_no_etag_with_pending_messages(self):
+        """Test pages with flash messages waiting are always rendered."""
+        self.client.get(reverse('follow_user_toggle', args=['author']))
+        response = self.client.get(reverse('feed'))
+        self.assertFalse(response.has_header('ETag'))
+
+
+class TieredCacheTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from social_app.tiered_cache import TieredCache
+        cache.clear()
+        self.tiered = TieredCache(max_entries=2, local_timeout=60)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+
+    def test_local_tier_fronts_shared(self):
+        """Test reads are served locally after the first shared hit."""
+        from django.core.cache import cache
+        self.tiered.set('greeting', 'hello')
+        self.tiered.clear_local()
+        self.assertEqual(self.tiered.get('greeting'), 'hello')
+        cache.delete('tiered:greeting')
+        self.assertEqual(self.tiered.get('greeting'), 'hello')
+
+        stats = self.tiered.stats()
+        self.assertEqual(stats['local']['hits'], 1)
+        self.assertEqual(stats['shared']['hits'], 1)
+        self.assertEqual(stats['local']['hit_ratio'], 0.5)
+
+    def test_lru_evicts_least_recently_used(self):
+        """Test the local tier keeps at most max_entries keys."""
+        for key in ('a', 'b', 'c'):
+            self.tiered.set(key, key)
+        self.assertEqual(len(self.tiered.local), 2)
+        for key in ('a', 'b', 'c'):
+            self.tiered.shared.delete(f'tiered:{key}')
+        self.assertIsNone(self.tiered.get('a'))
+        self.assertEqual(self.tiered.get('c'), 'c')
+
+    def test_namespace_bump_invalidates(self):
+        """Test bumping a namespace retires its keys in the local tier too."""
+        from social_app.versions import user_scope
+        namespace = user_scope(self.user.id)
+        self.assertEqual(self.tiered.get_or_set('n', lambda: 1, namespace=namespace), 1)
+        self.assertEqual(self.tiered.get_or_set('n', lambda: 2, namespace=namespace), 1)
+        self.tiered.invalidate(namespace)
+        self.assertEqual(self.tiered.get_or_set('n', lambda: 3, namespace=namespace), 3)
+
+    def test_count_properties_are_cached(self):
+        """Test profile and post counts hit the cache and follow model changes."""
+        other = User.objects.create_user(username='other', password='testpass123')
+        post = Post.objects.create(user=other, content='Counted')
+        self.assertEqual(post.likes_count, 0)
+        with self.assertNumQueries(0):
+            self.assertEqual(post.likes_count, 0)
+        Like.objects.create(user=self.user, post=post)
+        self.assertEqual(post.likes_count, 1)
+
+        self.assertEqual(other.profile.followers_count, 0)
+        self.user.profile.follows.add(other.profile)
+        self.assertEqual(other.profile.followers_count, 1)
+
+    def test_cache_stats_endpoint_is_staff_only(self):
+        """Test hit ratios are exposed to staff only."""
+        self.client.login(username='testuser', password='testpass123')
+        self.assertEqual(self.client.get(reverse('cache_stats')).status_code, 302)
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.get(reverse('cache_stats'))
+        self.assertIn('local', response.json()['tiered_cache'])
+
+
+class StampedeTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value='fresh'):
+        def compute():
+            self.calls += 1
+            return value
+        return compute
+
+    def test_single_flight_on_cold_key(self):
+        """Test concurrent misses compute the value once."""
+        import threading
+        import time as _time
+        from social_app.stampede import cache_compute
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            _time.sleep(0.3)
+            self.calls += 1
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache_compute('k', slow, 60)))]
+        threads[0].start()
+        started.wait()
+        for _ in range(4):
+            thread = threading.Thread(target=lambda: results.append(cache_compute('k', slow, 60)))
+            threads.append(thread)
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_served_while_refreshing(self):
+        """Test a stale entry is returned to requests that lose the refresh lock."""
+        from django.core.cache import cache
+        from social_app.stampede import cache_compute
+        cache_compute('k', self.compute('old'), 60, stale=60, version=1)
+        cache.add('k:lock', 1)  # another worker is refreshing
+        self.assertEqual(cache_compute('k', self.compute('new'), 60, stale=60, version=2), 'old')
+        cache.delete('k:lock')
+        self.assertEqual(cache_compute('k', self.compute('new'), 60, stale=60, version=2), 'new')
+
+    def test_early_expiry_refreshes_before_deadline(self):
+        """Test an entry close to expiry with a slow compute is refreshed early."""
+        import time
+        from django.core.cache import cache
+        from social_app.stampede import cache_compute
+        cache.set('k', {'value': 'old', 'delta': 1000.0, 'expires': time.time() + 1, 'version': None})
+        self.assertEqual(cache_compute('k', self.compute('new'), 60), 'new')
+        self.assertEqual(cache_compute('k', self.compute('newer'), 60, beta=0), 'new')
+
+    def test_feed_page_ids_cached(self):
+        """Test the global feed reuses cached page ids until a post is created."""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        Post.objects.create(user=user, content='First')
+        self.client.login(username='testuser', password='testpass123')
+        self.client.get(reverse('feed'))
+        with self.assertNumQueries(7):
+            # session, user, posts by id, three prefetches and suggestions; no count query
+            response = self.client.get(reverse('feed'))
+        self.assertEqual(len(response.context['posts']), 1)
+        Post.objects.create(user=user, content='Second')
+        response = self.client.get(reverse('feed'))
+        self.assertEqual(response.context['posts'][0].content, 'Second')
+
+
+class LikeToggleTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.fan = User.objects.create_user(username='fan', password='testpass123')
+        self.post = Post.objects.create(user=self.author, content='Like me')
+
+    def toggle(self):
+        return self.client.post(
+            reverse('like_post_toggle', kwargs={'post_id': self.post.id}),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        ).json()
+
+    def test_toggle_returns_counter(self):
+        """Test liking and unliking keep the row, counter and notification in step."""
+        self.client.login(username='fan', password='testpass123')
+        self.assertEqual(self.toggle(), {'liked': True, 'likes_count': 1})
+        self.assertTrue(Like.objects.filter(user=self.fan, post=self.post).exists())
+        self.assertTrue(Notification.objects.filter(recipient=self.author, notification_type='like').exists())
+        self.assertEqual(self.toggle(), {'liked': False, 'likes_count': 0})
+        self.assertFalse(Like.objects.filter(post=self.post).exists())
+        self.assertFalse(Notification.objects.filter(recipient=self.author).exists())
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_toggle_does_not_count_likes(self):
+        """Test a like is one insert and the count comes from the counter."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from social_app.likes import toggle_like
+        self.post.likes_count  # prime the counter
+        post = Post.objects.select_related('user').get(pk=self.post.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(toggle_like(self.fan, post), (True, 1))
+        statements = [q['sql'] for q in queries.captured_queries if 'social_app_like' in q['sql']]
+        self.assertEqual(len(statements), 1)
+        self.assertIn('ON CONFLICT', statements[0])
+
+    def test_existing_like_is_removed(self):
+        """Test toggling a like created elsewhere removes it instead of failing."""
+        from social_app.likes import toggle_like
+        Like.objects.create(user=self.fan, post=self.post)
+        self.assertEqual(toggle_like(self.fan, self.post), (False, 0))
+
+    def test_double_unlike_counts_once(self):
+        """Test an unlike that finds the like already removed leaves the counter alone."""
+        from unittest import mock
+        from social_app import likes
+        Like.objects.create(user=self.fan, post=self.post)
+        self.assertEqual(likes.toggle_like(self.fan, self.post), (False, 0))
+        # The second click's insert lost against the like that the first click removed
+        with mock.patch.object(likes, '_insert_like', return_value=False):
+            self.assertEqual(likes.toggle_like(self.fan, self.post), (False, 0))
+        self.assertEqual(likes.like_count(self.post.pk), 0)
+
+    @override_settings(LIKES_WRITE_BEHIND=True, LIKES_HOT_THRESHOLD=0, LIKES_FLUSH_INTERVAL=3600)
+    def test_write_behind_buffers_until_flush(self):
+        """Test hot-post toggles update the counter now and the rows on flush."""
+        from social_app.likes import flush_likes, toggle_like
+        self.addCleanup(flush_likes)
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.assertEqual(toggle_like(self.fan, self.post), (True, 1))
+        self.assertEqual(toggle_like(other, self.post), (True, 2))
+        self.assertEqual(toggle_like(other, self.post), (False, 1))
+        self.assertFalse(Like.objects.filter(post=self.post).exists())
+
+        self.assertEqual(flush_likes(), 1)
+        self.assertEqual(list(Like.objects.filter(post=self.post).values_list('user__username', flat=True)), ['fan'])
+        self.assertEqual(Notification.objects.get(recipient=self.author).sender, self.fan)
+        self.assertEqual(toggle_like(self.fan, self.post), (False, 0))
+        flush_likes()
+        self.assertFalse(Like.objects.filter(post=self.post).exists())
+
+
+    @override_settings(LIKES_WRITE_BEHIND=True, LIKES_HOT_THRESHOLD=0, LIKES_FLUSH_INTERVAL=3600)
+    def test_flush_skips_states_flushed_by_another_process(self):
+        """Test a process flushing late does not bring back a like another process removed."""
+        from social_app.likes import LikeBuffer
+        first, second = LikeBuffer(), LikeBuffer()
+        self.addCleanup(first.flush)
+        self.addCleanup(second.flush)
+        self.assertEqual(first.toggle(self.fan, self.post), (True, 1))
+        self.assertEqual(second.toggle(self.fan, self.post), (False, 0))
+        second.flush()
+        self.assertEqual(first.flush(), 0)
+        self.assertFalse(Like.objects.filter(post=self.post).exists())
+
+@override_settings(COMMENTS_PER_PAGE=2, REPLIES_PER_PAGE=2)
+class CommentThreadTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.post = Post.objects.create(user=self.user, content='Discuss')
+        self.comments = [
+            Comment.objects.create(user=self.user, post=self.post, text=f'Comment {i}') for i in range(5)
+        ]
+        self.replies = [
+            Comment.objects.create(user=self.user, post=self.post, parent=self.comments[0], text=f'Reply {i}')
+            for i in range(3)
+        ]
+        self.client.login(username='testuser', password='testpass123')
+
+    def test_post_detail_shows_first_page_with_reply_counts(self):
+        """Test the post page loads one page of top-level comments and no replies."""
+        response = self.client.get(reverse('post_detail', kwargs={'post_id': self.post.id}))
+        comments = response.context['comments']
+        self.assertEqual([c.text for c in comments], ['Comment 0', 'Comment 1'])
+        self.assertEqual([c.reply_count for c in comments], [3, 0])
+        self.assertContains(response, 'View 3 replies')
+        self.assertNotContains(response, 'Reply 0')
+        self.assertContains(response, 'Load more comments')
+
+    def test_cursor_walks_all_comments(self):
+        """Test following the next cursor visits every top-level comment once."""
+        url = reverse('post_comments', kwargs={'post_id': self.post.id})
+        seen, cursor = [], None
+        while True:
+            data = self.client.get(url, {'after': cursor} if cursor else {}, HTTP_ACCEPT='application/json').json()
+            seen += [comment['text'] for comment in data['comments']]
+            cursor = data['next']
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f'Comment {i}' for i in range(5)])
+
+    def test_same_timestamp_comments_are_not_skipped(self):
+        """Test the id tie-breaker keeps comments sharing a created_at on later pages."""
+        Comment.objects.filter(pk__in=[c.pk for c in self.comments]).update(created_at=self.comments[0].created_at)
+        from social_app.threads import comment_page
+        first, cursor = comment_page(self.post)
+        second, _ = comment_page(self.post, cursor)
+        self.assertEqual([c.pk for c in first + second], [c.pk for c in self.comments[:4]])
+
+    def test_replies_fragment_pages(self):
+        """Test replies load as an HTML fragment with a link to the next page."""
+        url = reverse('comment_replies', kwargs={'comment_id': self.comments[0].id})
+        response = self.client.get(url)
+        self.assertContains(response, 'Reply 1')
+        self.assertNotContains(response, 'Reply 2')
+        self.assertContains(response, 'More replies')
+        response = self.client.get(url, {'after': response.context['next_cursor']})
+        self.assertContains(response, 'Reply 2')
+        self.assertNotContains(response, 'More replies')
+
+    def test_malformed_cursor_starts_over(self):
+        """Test an invalid cursor falls back to the first page."""
+        response = self.client.get(
+            reverse('post_comments', kwargs={'post_id': self.post.id}), {'after': 'garbage!'},
+            HTTP_ACCEPT='application/json'
+        )
+        self.assertEqual(response.json()['comments'][0]['text'], 'Comment 0')
+
+
+class CommentPathTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.post = Post.objects.create(user=self.user, content='Thread')
+        self.client.login(username='testuser', password='testpass123')
+
+    def reply(self, parent, text):
+        self.client.post(reverse('add_reply_to_comment', kwargs={'comment_id': parent.id}), {'text': text})
+        return Comment.objects.get(text=text)
+
+    def test_replies_extend_parent_path(self):
+        """Test replies posted through the view get their parent's path plus their own id."""
+        from social_app.models import comment_path_segment
+        root = Comment.objects.create(user=self.user, post=self.post, text='root')
+        child = self.reply(root, 'child')
+        grandchild = self.reply(child, 'grandchild')
+        self.assertEqual(root.path, comment_path_segment(root.pk))
+        self.assertEqual(grandchild.path, root.path + comment_path_segment(child.pk) + comment_path_segment(grandchild.pk))
+        self.assertEqual(grandchild.depth, 2)
+
+    def test_subtree_is_one_ordered_query(self):
+        """Test a thread loads depth-first in a single query, excluding sibling threads."""
+        from social_app.threads import thread
+        root = Comment.objects.create(user=self.user, post=self.post, text='root')
+        a = Comment.objects.create(user=self.user, post=self.post, parent=root, text='a')
+        b = Comment.objects.create(user=self.user, post=self.post, parent=root, text='b')
+        Comment.objects.create(user=self.user, post=self.post, parent=a, text='a1')
+        Comment.objects.create(user=self.user, post=self.post, text='other root')
+        with self.assertNumQueries(1):
+            rows, cursor = thread(root)
+        self.assertEqual([row.text for row in rows], ['root', 'a', 'a1', 'b'])
+        self.assertIsNone(cursor)
+        self.assertEqual([row.text for row in thread(b)[0]], ['b'])
+
+    def test_depth_cut_continues_thread(self):
+        """Test comments below the depth limit are replaced by a continue link."""
+        from social_app.threads import thread
+        parent = root = Comment.objects.create(user=self.user, post=self.post, text='level 0')
+        for level in range(1, 5):
+            parent = Comment.objects.create(user=self.user, post=self.post, parent=parent, text=f'level {level}')
+        rows, _ = thread(root, max_depth=2)
+        self.assertEqual([row.text for row in rows], ['level 0', 'level 1', 'level 2'])
+        self.assertTrue(rows[-1].continue_thread)
+
+        with self.settings(COMMENT_THREAD_DEPTH=2):
+            response = self.client.get(reverse('comment_thread', kwargs={'comment_id': root.id}))
+        self.assertContains(response, 'Continue this thread')
+        self.assertNotContains(response, 'level 3')
+
+    def test_thread_pages_by_path(self):
+        """Test long threads page with the last path as the cursor."""
+        from social_app.threads import thread
+        root = Comment.objects.create(user=self.user, post=self.post, text='root')
+        for i in range(4):
+            Comment.objects.create(user=self.user, post=self.post, parent=root, text=f'r{i}')
+        first, cursor = thread(root, limit=3)
+        second, last = thread(root, after=cursor, limit=3)
+        self.assertEqual([row.text for row in first + second], ['root', 'r0', 'r1', 'r2', 'r3'])
+        self.assertIsNone(last)
+
+    def test_max_depth_attaches_to_grandparent(self):
+        """Test a reply beyond the deepest storable level answers alongside its parent."""
+        from social_app.models import COMMENT_MAX_DEPTH
+        parent = Comment.objects.create(user=self.user, post=self.post, text='0')
+        for level in range(1, COMMENT_MAX_DEPTH):
+            parent = Comment.objects.create(user=self.user, post=self.post, parent=parent, text=str(level))
+        deepest = Comment.objects.create(user=self.user, post=self.post, parent=parent, text='too deep')
+        self.assertEqual(deepest.depth, COMMENT_MAX_DEPTH - 1)
+        self.assertEqual(deepest.parent_id, parent.parent_id)
+
+
+class JsonApiTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from social_app.graph import follow_graph
+        cache.clear()
+        follow_graph.reset()
+        self.addCleanup(follow_graph.reset)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.author = User.objects.create_user(username='author', password='testpass123')
+        self.posts = [Post.objects.create(user=self.author, content=f'Post {i} #news') for i in range(3)]
+        Hashtag.objects.create(name='news').posts.add(*self.posts)
+        Like.objects.create(user=self.user, post=self.posts[2])
+        self.client.login(username='testuser', password='testpass123')
+
+    def test_feed_pages_with_cursor(self):
+        """Test the feed API walks every post newest first via the next cursor."""
+        url = reverse('api_feed')
+        first = self.client.get(url, {'limit': 2}).json()
+        self.assertEqual([row['content'] for row in first['results']], ['Post 2 #news', 'Post 1 #news'])
+        second = self.client.get(url, {'limit': 2, 'cursor': first['next']}).json()
+        self.assertEqual([row['content'] for row in second['results']], ['Post 0 #news'])
+        self.assertIsNone(second['next'])
+
+        post = first['results'][0]
+        self.assertEqual(post['author'], 'author')
+        self.assertTrue(post['liked'])
+        self.assertEqual(post['likes_count'], 1)
+        self.assertEqual(post['hashtags'], ['news'])
+
+    def test_sparse_fieldsets(self):
+        """Test fields= limits the keys returned and skips unrequested lookups."""
+        with self.assertNumQueries(3):  # session, user, posts
+            response = self.client.get(reverse('api_feed'), {'fields': 'id,content'})
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'content'})
+        response = self.client.get(reverse('api_feed'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_payload_smaller_than_html(self):
+        """Test the JSON feed is a fraction of the HTML feed's size."""
+        html = self.client.get(reverse('feed'))
+        api = self.client.get(reverse('api_feed'), {'limit': 10})
+        self.assertLess(len(api.content) * 3, len(html.content))
+
+    def test_post_user_and_hashtag_endpoints(self):
+        """Test the detail and per-user/hashtag list endpoints."""
+        post = self.client.get(reverse('api_post', kwargs={'post_id': self.posts[0].id})).json()
+        self.assertEqual(post['content'], 'Post 0 #news')
+        self.assertEqual(self.client.get(reverse('api_post', kwargs={'post_id': 999})).status_code, 404)
+
+        self.user.profile.follows.add(self.author.profile)
+        profile = self.client.get(reverse('api_user', kwargs={'username': 'author'})).json()
+        self.assertEqual(profile['followers_count'], 1)
+        self.assertEqual(profile['posts_count'], 3)
+        self.assertTrue(profile['is_following'])
+        self.assertFalse(profile['follows_you'])
+
+        posts = self.client.get(reverse('api_user_posts', kwargs={'username': 'author'})).json()
+        self.assertEqual(len(posts['results']), 3)
+        tagged = self.client.get(reverse('api_hashtag_posts', kwargs={'hashtag_name': 'News'})).json()
+        self.assertEqual(len(tagged['results']), 3)
+        following = self.client.get(reverse('api_following_feed')).json()
+        self.assertEqual(len(following['results']), 3)
+
+    def test_notifications_continue_into_archive(self):
+        """Test notification pages run from live rows into archived ones."""
+        from datetime import timedelta
+        from django.utils import timezone
+        from social_app.models import ArchivedNotification
+        now = timezone.now()
+        Notification.objects.create(recipient=self.user, sender=self.author, notification_type='follow', message='live')
+        ArchivedNotification.objects.create(
+            recipient=self.user, sender=self.author, notification_type='follow', message='old',
+            created_at=now - timedelta(days=60)
+        )
+        url = reverse('api_notifications')
+        first = self.client.get(url, {'limit': 1}).json()
+        self.assertEqual([(n['message'], n['archived'], n['unread']) for n in first['results']], [('live', False, True)])
+        second = self.client.get(url, {'limit': 1, 'cursor': first['next']}).json()
+        self.assertEqual([(n['message'], n['archived']) for n in second['results']], [('old', True)])
+        self.assertIsNone(second['next'])
+
+    def test_requires_login(self):
+        """Test anonymous requests get a JSON 401 instead of a login redirect."""
+        self.client.logout()
+        response = self.client.get(reverse('api_feed'))
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'error': 'Authentication required'})
+
+    def test_batch_returns_posts_and_users_in_order(self):
+        """Test one batch request returns posts and profiles in the order asked, with misses listed."""
+        self.user.profile.follows.add(self.author.profile)
+        ids = f"{self.posts[2].id},999,{self.posts[0].id}"
+        data = self.client.get(reverse('api_batch'), {'posts': ids, 'users': 'author,ghost'}).json()
+        self.assertEqual([post['content'] for post in data['posts']], ['Post 2 #news', 'Post 0 #news'])
+        self.assertTrue(data['posts'][0]['liked'])
+        self.assertFalse(data['posts'][1]['liked'])
+        self.assertEqual(data['posts'][0]['likes_count'], 1)
+        self.assertEqual(data['posts'][0]['hashtags'], ['news'])
+        self.assertEqual(data['users'][0]['username'], 'author')
+        self.assertEqual(data['users'][0]['posts_count'], 3)
+        self.assertTrue(data['users'][0]['is_following'])
+        self.assertEqual(data['missing'], {'posts': [999], 'users': ['ghost']})
+
+    def test_batch_served_from_item_cache(self):
+        """Test a repeated batch reads no rows but the viewer's likes, and edits are picked up."""
+        params = {'posts': ','.join(str(post.id) for post in self.posts), 'users': 'author'}
+        self.client.get(reverse('api_batch'), params)
+        with self.assertNumQueries(3):  # session, user, viewer's likes
+            self.client.get(reverse('api_batch'), params)
+
+        self.posts[1].content = 'Edited'
+        self.posts[1].save()
+        self.author.profile.bio = 'New bio'
+        self.author.profile.save()
+        data = self.client.get(reverse('api_batch'), params).json()
+        self.assertEqual(data['posts'][1]['content'], 'Edited')
+        self.assertEqual(data['users'][0]['bio'], 'New bio')
+
+    def test_batch_post_items_follow_author_changes(self):
+        """Test cached post items pick up a renamed author."""
+        params = {'posts': str(self.posts[0].id)}
+        self.client.get(reverse('api_batch'), params)
+        self.author.username = 'renamed'
+        self.author.save()
+        data = self.client.get(reverse('api_batch'), params).json()
+        self.assertEqual(data['posts'][0]['author'], 'renamed')
+
+    def test_batch_limits(self):
+        """Test oversized batches and malformed ids are rejected."""
+        with self.settings(API_BATCH_MAX_ITEMS=2):
+            response = self.client.get(reverse('api_batch'), {'posts': '1,2', 'users': 'author'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('api_batch'), {'posts': '1,abc'})
+        self.assertEqual(response.status_code, 400)
+
+
+class DataExportTestCase(TestCase):
+    def setUp(self):
+        from social_app.graph import follow_graph
+        follow_graph.reset()
+        self.addCleanup(follow_graph.reset)
+        self.user = User.objects.create_user(username='testuser', password='testpass123', email='t@example.com')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.post = Post.objects.create(user=self.user, content='Mine')
+        other_post = Post.objects.create(user=self.other, content='Theirs')
+        Comment.objects.create(user=self.user, post=other_post, text='Nice')
+        Like.objects.create(user=self.user, post=other_post)
+        self.user.profile.follows.add(self.other.profile)
+        self.other.profile.follows.add(self.user.profile)
+        Notification.objects.create(
+            recipient=self.user, sender=self.other, notification_type='follow', message='other followed you'
+        )
+        self.client.login(username='testuser', password='testpass123')
+
+    def read_lines(self, response):
+        import json
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_json_lines_export(self):
+        """Test the export streams one typed JSON object per row of the account."""
+        response = self.client.get(reverse('export_data'))
+        self.assertTrue(response.streaming)
+        self.assertIn('testuser-export.jsonl', response['Content-Disposition'])
+        records = self.read_lines(response)
+        by_type = {}
+        for record in records:
+            by_type.setdefault(record['type'], []).append(record)
+        self.assertEqual(by_type['profile'][0]['email'], 't@example.com')
+        self.assertEqual([post['content'] for post in by_type['post']], ['Mine'])
+        self.assertEqual([comment['text'] for comment in by_type['comment']], ['Nice'])
+        self.assertEqual(len(by_type['like']), 1)
+        self.assertEqual(by_type['following'][0]['username'], 'other')
+        self.assertEqual(by_type['follower'][0]['username'], 'other')
+        self.assertEqual(by_type['notification'][0]['sender'], 'other')
+
+    async def test_export_streams_under_asgi(self):
+        """Test the export reaches ASGI clients as an async stream, chunk by chunk."""
+        import json
+        await self.async_client.aforce_login(self.user)
+        with override_settings(EXPORT_CHUNK_SIZE=64):
+            response = await self.async_client.get(reverse('export_data'))
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+        self.assertGreater(len(chunks), 1)
+        records = [json.loads(line) for line in b''.join(chunks).splitlines()]
+        self.assertEqual(records[0]['type'], 'profile')
+        self.assertIn('Mine', [record.get('content') for record in records])
+
+    def test_zip_export_includes_media(self):
+        """Test the zip export holds a file per section and the uploaded media, read in chunks."""
+        import zipfile
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root, EXPORT_CHUNK_SIZE=1024
+        ):
+            os.makedirs(os.path.join(media_root, 'posts', 'images'))
+            payload = os.urandom(5000)
+            with open(os.path.join(media_root, 'posts', 'images', 'photo.png'), 'wb') as f:
+                f.write(payload)
+            Post.objects.filter(pk=self.post.pk).update(image='posts/images/photo.png')
+
+            response = self.client.get(reverse('export_data'), {'format': 'zip'})
+            chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 5)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertIn('post.jsonl', archive.namelist())
+        self.assertEqual(archive.read('media/posts/images/photo.png'), payload)
+        self.assertIn(b'"Mine"', archive.read('post.jsonl'))
+
+    def test_export_of_other_accounts_is_staff_only(self):
+        """Test only staff can export another user's data."""
+        response = self.client.get(reverse('export_data'), {'username': 'other'})
+        self.assertEqual(response.status_code, 404)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('export_data'), {'username': 'other'})
+        records = self.read_lines(response)
+        self.assertEqual(records[0]['username'], 'other')
+
+
+class ImportNetworkTestCase(TestCase):
+    def setUp(self):
+        import json
+        from social_app.graph import follow_graph
+        follow_graph.reset()
+        self.addCleanup(follow_graph.reset)
+        self.existing = User.objects.create_user(username='taken', password='testpass123')
+        rows = [
+            {'type': 'user', 'id': 'u1', 'username': 'ada', 'bio': 'Hi', 'date_joined': '2020-01-01T00:00:00Z'},
+            {'type': 'user', 'id': 'u2', 'username': 'bob'},
+            {'type': 'user', 'id': 'u3', 'username': 'taken'},
+            {'type': 'follow', 'follower': 'u1', 'followed': 'u2'},
+            {'type': 'post', 'id': 'p1', 'user': 'u1', 'content': 'Hello #Intro @bob @taken',
+             'created_at': '2021-05-01T12:00:00Z'},
+            {'type': 'comment', 'id': 'c1', 'post': 'p1', 'user': 'u2', 'text': 'Welcome'},
+            {'type': 'comment', 'id': 'c2', 'post': 'p1', 'user': 'u1', 'text': 'Thanks', 'parent': 'c1'},
+            {'type': 'comment', 'id': 'c3', 'post': 'p1', 'user': 'u1', 'text': 'Lost', 'parent': 'c9'},
+            {'type': 'like', 'user': 'u2', 'post': 'p1', 'created_at': '2021-05-02T00:00:00Z'},
+            {'type': 'like', 'user': 'u2', 'post': 'p1'},
+            {'type': 'post', 'id': 'p2', 'user': 'u3', 'content': 'Orphan'},
+        ]
+        dump = tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False)
+        dump.write('\n'.join(json.dumps(row) for row in rows) + '\nnot json\n')
+        dump.close()
+        self.dump = dump.name
+        self.state_file = dump.name + '.state'
+        self.addCleanup(os.remove, self.dump)
+        self.addCleanup(lambda: os.path.exists(self.state_file) and os.remove(self.state_file))
+
+    def run_import(self, *args):
+        from django.core.management import call_command
+        out = io.StringIO()
+        call_command('import_network', self.dump, '--source=oldnet', '--state-file', self.state_file, *args, stdout=out)
+        return out.getvalue()
+
+    def test_bulk_import(self):
+        """Test users, follows, posts, threaded comments and likes are imported with their timestamps."""
+        from social_app.graph import follow_graph
+        output = self.run_import('--batch-size=3')
+        self.assertIn('rows/s', output)
+        self.assertIn('Skipped', output)
+
+        ada, bob = User.objects.get(username='ada'), User.objects.get(username='bob')
+        self.assertEqual(ada.profile.bio, 'Hi')
+        self.assertFalse(ada.has_usable_password())
+        self.assertEqual(User.objects.filter(username='taken').count(), 1)
+        self.assertTrue(follow_graph.is_following(ada.id, bob.id))
+
+        post = Post.objects.get(user=ada)
+        self.assertEqual(post.created_at.year, 2021)
+        self.assertEqual(list(post.hashtags.values_list('name', flat=True)), ['intro'])
+        self.assertEqual(Notification.objects.filter(notification_type='mention').count(), 2)
+        self.assertFalse(Post.objects.filter(content='Orphan').exists())
+
+        welcome = Comment.objects.get(text='Welcome')
+        reply = Comment.objects.get(text='Thanks')
+        self.assertEqual(reply.parent_id, welcome.id)
+        self.assertEqual(reply.depth, 1)
+        lower, upper = welcome.subtree_bounds
+        self.assertTrue(lower <= reply.path < upper)
+        self.assertFalse(Comment.objects.filter(text='Lost').exists())
+
+        like = Like.objects.get(post=post)
+        self.assertEqual(like.created_at.year, 2021)
+        self.assertEqual(post.likes_count, 1)
+
+    def test_engagement_on_existing_posts_refreshes_cached_counts(self):
+        """Test likes and comments imported onto existing posts retire their cached counts."""
+        import json
+        from django.core.cache import cache
+        from social_app.models import ImportedId
+        cache.clear()
+        post = Post.objects.create(user=self.existing, content='Already here')
+        ImportedId.objects.create(source='oldnet', kind='post', source_id='p9', local_id=post.pk)
+        self.assertEqual((post.likes_count, post.comments_count), (0, 0))
+        with open(self.dump, 'a') as f:
+            f.write(json.dumps({'type': 'like', 'user': 'u1', 'post': 'p9'}) + '\n')
+            f.write(json.dumps({'type': 'comment', 'id': 'c8', 'post': 'p9', 'user': 'u1', 'text': 'Hi'}) + '\n')
+
+        self.run_import()
+        post = Post.objects.get(pk=post.pk)
+        self.assertEqual((post.likes_count, post.comments_count), (1, 1))
+
+    def test_bulk_insert_leaves_model_fields_alone(self):
+        """Test imported timestamps are kept without switching off auto_now_add for the process."""
+        from datetime import datetime, timezone as dt_timezone
+        from unittest import mock
+        from django.db.models.query import QuerySet
+        from social_app.importer import _bulk_insert
+        field, flags = Like._meta.get_field('created_at'), []
+        insert = QuerySet._insert
+
+        def checked_insert(queryset, *args, **kwargs):
+            flags.append(field.auto_now_add)
+            return insert(queryset, *args, **kwargs)
+
+        post = Post.objects.create(user=self.existing, content='Old')
+        then = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+        with mock.patch.object(QuerySet, '_insert', checked_insert):
+            [like] = _bulk_insert(Like, [Like(user=self.existing, post=post, created_at=then)], keep=('created_at',))
+        self.assertEqual(flags, [True])
+        self.assertEqual(Like.objects.get(pk=like.pk).created_at, then)
+
+    def test_resume_after_failure_creates_no_duplicates(self):
+        """Test a run that fails midway resumes from its checkpoint without duplicating rows."""
+        from unittest import mock
+        from social_app.importer import Importer
+        with mock.patch.object(Importer, '_import_comments', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.run_import('--batch-size=5')
+        # The first batch (users, follow, post) was committed, the comments' batch rolled back
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertFalse(Comment.objects.exists())
+
+        self.assertTrue(os.path.exists(self.state_file))
+        self.run_import('--batch-size=5', '--resume')
+        self.run_import('--batch-size=5')  # a full rerun skips everything already imported
+        self.assertEqual(User.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(Like.objects.count(), 1)
+
+
+class AdminQueryCountTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='admin', password='testpass123', email='a@example.com')
+        self.client.login(username='admin', password='testpass123')
+
+    def add_rows(self, count):
+        users = [User.objects.create_user(username=f'user{User.objects.count()}') for _ in range(count)]
+        for user in users:
+            post = Post.objects.create(user=user, content='Hello #admin')
+            Like.objects.create(user=self.admin, post=post)
+            Comment.objects.create(user=self.admin, post=post, text='Nice')
+            self.admin.profile.follows.add(user.profile)
+            Hashtag.objects.get_or_create(name=f'tag{user.pk}')[0].posts.add(post)
+
+    def changelist_queries(self, model_name):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f'admin:social_app_{model_name}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        """Test counts and related names on admin changelists are fetched per page, not per row."""
+        self.add_rows(2)
+        before = {name: self.changelist_queries(name)
+                  for name in ('post', 'profile', 'hashtag', 'comment', 'like', 'notification')}
+        self.add_rows(5)
+        after = {name: self.changelist_queries(name) for name in before}
+        self.assertEqual(before, after)
+
+    def test_annotated_counts(self):
+        """Test the annotated counts shown match the related rows."""
+        self.add_rows(1)
+        response = self.client.get(reverse('admin:social_app_profile_changelist'))
+        profile = next(p for p in response.context['cl'].result_list if p.user_id == self.admin.pk)
+        self.assertEqual(profile.following_total, 1)
+        response = self.client.get(reverse('admin:social_app_post_changelist'))
+        post = response.context['cl'].result_list[0]
+        self.assertEqual((post.likes_total, post.comments_total), (1, 1))
+
+    def test_estimated_count_paginator(self):
+        """Test large unfiltered tables use the estimate and everything else an exact count."""
+        from unittest import mock
+        from social_app import pagination
+        self.add_rows(3)
+        queryset = Post.objects.order_by('pk')
+        self.assertIsNone(pagination.estimated_count(queryset))  # not PostgreSQL
+        self.assertEqual(pagination.EstimatedCountPaginator(queryset, 2).count, 3)
+        with mock.patch.object(pagination, 'estimated_count', return_value=50000):
+            self.assertEqual(pagination.EstimatedCountPaginator(queryset, 2).count, 50000)
+        with mock.patch.object(pagination, 'estimated_count', return_value=100):
+            self.assertEqual(pagination.EstimatedCountPaginator(queryset, 2).count, 3)
+
+    def test_changelist_of_soft_deletable_table_is_estimated(self):
+        """Test the live-only default manager does not stop Post changelists from using the estimate."""
+        from unittest import mock
+        from django.db import connection
+        from social_app import pagination
+        self.add_rows(3)
+        queryset = self.client.get(reverse('admin:social_app_post_changelist')).context['cl'].queryset
+        cursor = mock.MagicMock()
+        cursor.__enter__.return_value.fetchone.return_value = (50000,)
+        with mock.patch.object(connection, 'vendor', 'postgresql'), \
+                mock.patch.object(connection, 'cursor', return_value=cursor):
+            self.assertEqual(pagination.estimated_count(queryset), 50000)
+            self.assertIsNone(pagination.estimated_count(queryset.filter(is_pinned=True)))
+
+
+class DeletionTestCase(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+        from social_app.graph import follow_graph
+        cache.clear()
+        follow_graph.reset()
+        self.addCleanup(follow_graph.reset)
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.other = User.objects.create_user(username='other', password='testpass123')
+        self.post = Post.objects.create(user=self.user, content='Going away')
+        self.other_post = Post.objects.create(user=self.other, content='Staying')
+        self.comment = Comment.objects.create(user=self.other, post=self.post, text='Top')
+        Comment.objects.create(user=self.user, post=self.post, text='Reply', parent=self.comment)
+        self.on_other = Comment.objects.create(user=self.user, post=self.other_post, text='Hi')
+        Comment.objects.create(user=self.other, post=self.other_post, text='Answer', parent=self.on_other)
+        Like.objects.create(user=self.other, post=self.post)
+        Like.objects.create(user=self.user, post=self.other_post)
+        Notification.objects.create(
+            recipient=self.user, sender=self.other, notification_type='like', message='liked', post=self.post
+        )
+        self.user.profile.follows.add(self.other.profile)
+        self.other.profile.follows.add(self.user.profile)
+        self.client.login(username='testuser', password='testpass123')
+
+    def test_post_hidden_at_once_and_purged(self):
+        """Test a deleted post disappears immediately and its rows are purged by the task."""
+        from social_app.models import Deletion
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(reverse('delete_post', kwargs={'post_id': self.post.id}))
+        self.assertFalse(Post.objects.filter(pk=self.post.pk).exists())
+        self.assertFalse(Comment.objects.filter(post=self.post).exists())
+        self.assertTrue(Post.all_objects.filter(pk=self.post.pk).exists())
+        feed = self.client.get(reverse('api_feed')).json()
+        self.assertEqual([post['content'] for post in feed['results']], ['Staying'])
+
+        for callback in callbacks:  # the purge task runs inline with TASKS_ALWAYS_EAGER
+            callback()
+        deletion = Deletion.objects.get()
+        self.assertEqual(deletion.status, Deletion.STATUS_DONE)
+        self.assertFalse(Post.all_objects.filter(pk=self.post.pk).exists())
+        self.assertFalse(Comment.all_objects.filter(post_id=self.post.pk).exists())
+        self.assertEqual(Like.objects.filter(post_id=self.post.pk).count(), 0)
+        self.assertEqual(deletion.progress['comments at depth 1'], 1)
+        self.assertEqual(deletion.progress['posts'], 1)
+        self.assertTrue(Post.objects.filter(pk=self.other_post.pk).exists())
+
+    def test_account_deleted_in_batches(self):
+        """Test account deletion deactivates at once, then purges every related row in batches."""
+        from social_app.models import Deletion
+        with self.settings(DELETION_BATCH_SIZE=1), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_account'))
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(self.client.login(username='testuser', password='testpass123'))
+
+        deletion = Deletion.objects.get(kind=Deletion.KIND_USER)
+        self.assertEqual(deletion.status, Deletion.STATUS_DONE)
+        self.assertEqual(deletion.progress['following'], 1)
+        self.assertEqual(deletion.progress['followers'], 1)
+        self.assertFalse(Post.all_objects.filter(user_id=self.user.pk).exists())
+        # Others keep their posts; replies under the deleted account's comments go with them
+        self.assertEqual(list(Comment.all_objects.values_list('text', flat=True)), [])
+        self.assertTrue(Post.objects.filter(pk=self.other_post.pk).exists())
+        self.assertEqual(Like.objects.count(), 0)
+        self.assertFalse(self.other.profile.follows.exists())
+
+    def test_soft_deleted_account_is_hidden_before_purge(self):
+        """Test a deactivated account's profile, posts and comments are hidden while the purge is pending."""
+        from social_app.deletion import delete_account
+        delete_account(self.user)  # on_commit never fires inside the test transaction
+        self.client.login(username='other', password='testpass123')
+        self.assertEqual(self.client.get(reverse('profile', kwargs={'username': 'testuser'})).status_code, 404)
+        self.assertFalse(Post.objects.filter(user=self.user).exists())
+        self.assertEqual(list(self.other_post.comments.values_list('text', flat=True)), ['Answer'])
+
+    def test_soft_deleted_account_leaves_no_cached_reads(self):
+        """Test batch API entries and cached counts drop a deactivated account's posts and comments."""
+        from social_app.deletion import delete_account
+        self.client.login(username='other', password='testpass123')
+        url = f"{reverse('api_batch')}?posts={self.post.pk},{self.other_post.pk}"
+        self.assertEqual(len(self.client.get(url).json()['posts']), 2)
+        self.assertEqual(Post.objects.get(pk=self.other_post.pk).comments_count, 2)
+
+        delete_account(self.user)
+        data = self.client.get(url).json()
+        self.assertEqual([post['id'] for post in data['posts']], [self.other_post.pk])
+        self.assertEqual(data['missing']['posts'], [self.post.pk])
+        self.assertEqual(Post.objects.get(pk=self.other_post.pk).comments_count, 1)
+
+    def test_failed_purge_resumes(self):
+        """Test a purge that fails midway is marked failed and finishes when retried."""
+        from unittest import mock
+        from social_app import deletion as deletion_module
+        from social_app.models import Deletion
+        deletion = deletion_module.delete_account(self.user)
+        original = deletion_module.delete_in_batches
+
+        def fail_on_posts(queryset, name, *args, **kwargs):
+            if name == 'posts':
+                raise RuntimeError('connection lost')
+            return original(queryset, name, *args, **kwargs)
+
+        with mock.patch.object(deletion_module, 'delete_in_batches', side_effect=fail_on_posts):
+            with self.assertRaises(RuntimeError):
+                deletion_module.purge(deletion.pk)
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.status, Deletion.STATUS_FAILED)
+        self.assertEqual(deletion.progress['likes given'], 1)
+
+        deletion_module.purge(deletion.pk)
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.status, Deletion.STATUS_DONE)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+
+
+class TextTokenizerTestCase(TestCase):
+    def test_one_pass_finds_everything(self):
+        """Test hashtags, mentions and URLs come out of one scan, lowercased and listed once."""
+        from social_app.text import tokenize
+        tokens = tokenize("#Django and #django with @Alice, see https://example.com/a. #Tips @alice")
+        self.assertEqual(tokens.hashtags, ['django', 'tips'])
+        self.assertEqual(tokens.mentions, ['alice'])
+        self.assertEqual(tokens.urls, ['https://example.com/a'])
+
+    def test_addresses_and_fragments_are_not_tags(self):
+        """Test e-mail addresses and URL fragments are not taken for mentions or hashtags."""
+        from social_app.utils import extract_hashtags, extract_mentions
+        text = "Write to bob@example.com or read https://example.com/#intro"
+        self.assertEqual(extract_mentions(text), [])
+        self.assertEqual(extract_hashtags(text), [])
+
+    def test_rendered_html_is_escaped_and_linked(self):
+        """Test rendering escapes the text and links hashtags, mentions, URLs and line breaks."""
+        from social_app.text import render
+        html = render("<b>hi</b> #Tag @bob\nwww.example.com\n\nbye")
+        self.assertEqual(
+            html,
+            '<p>&lt;b&gt;hi&lt;/b&gt; '
+            f'<a href="{reverse("hashtag_view", args=["Tag"])}" class="hashtag-link">#Tag</a> '
+            f'<a href="{reverse("profile", args=["bob"])}" class="mention-link">@bob</a><br>'
+            '<a href="http://www.example.com" class="content-link" rel="nofollow">www.example.com</a>'
+            '</p>\n\n<p>bye</p>'
+        )
+
+    def test_post_page_uses_tokenizer(self):
+        """Test post pages render content through the shared tokenizer."""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        post = Post.objects.create(user=user, content='Hello #world <script>')
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get(reverse('post_detail', kwargs={'post_id': post.id}))
+        self.assertContains(response, 'class="hashtag-link">#world</a> &lt;script&gt;')
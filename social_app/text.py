@@ -0,0 +1,108 @@
+"""
+One-pass tokenizer for post text.
+
+``tokenize`` scans the content once with a single precompiled pattern. It
+returns the hashtags, mentions and URLs in the text together with the
+rendered HTML: text escaped, hashtags linked to their page, mentions to the
+profile, URLs made clickable and line breaks kept as ``linebreaks`` keeps
+them. Hashtag and mention extraction, ``Post.content_html`` and the
+``format_content`` filter all go through it, so what counts as a tag is
+defined here only. ``manage.py benchmark text`` compares it with the
+separate regex passes it replaced.
+"""
+
+import re
+from functools import lru_cache
+from html import escape
+
+from django.urls import reverse
+
+TOKEN_RE = re.compile(
+    r"(?P<url>\bhttps?://[^\s<>\"']+|\bwww\.[^\s<>\"']+)"
+    # Not inside a word, so e-mail addresses and URL fragments are left alone
+    r"|(?<!\w)#(?P<hashtag>\w+)"
+    r"|(?<![\w@])@(?P<mention>\w+)"
+    r"|(?P<paragraph>\n{2,})"
+    r"|(?P<br>\n)"
+)
+
+# Left out of a URL when it ends with them: "see https://example.com."
+URL_TRAILING = '.,:;!?'
+
+
+def _trim_url(url):
+    while True:
+        trimmed = url.rstrip(URL_TRAILING)
+        if trimmed.endswith(')') and trimmed.count(')') > trimmed.count('('):
+            trimmed = trimmed[:-1]
+        if trimmed == url:
+            return url
+        url = trimmed
+
+
+@lru_cache(maxsize=None)
+def _url_template(view_name, kwarg):
+    """The URL of ``view_name`` with a ``%s`` for its argument, reversed once per process."""
+    return reverse(view_name, kwargs={kwarg: 'PLACEHOLDER'}).replace('PLACEHOLDER', '%s')
+
+
+class Tokens:
+    """What ``tokenize`` found in one text. Names are lowercased and listed once, in order."""
+
+    __slots__ = ('hashtags', 'mentions', 'urls', 'html')
+
+    def __init__(self, hashtags, mentions, urls, html):
+        self.hashtags = hashtags
+        self.mentions = mentions
+        self.urls = urls
+        self.html = html
+
+
+def tokenize(text, render=True):
+    """Hashtags, mentions, URLs and (unless ``render`` is False) the HTML of ``text`` in one scan."""
+    hashtags, mentions, urls = {}, {}, []
+    if render:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        hashtag_url = _url_template('hashtag_view', 'hashtag_name')
+        profile_url = _url_template('profile', 'username')
+        parts = ['<p>']
+        append = parts.append
+    position = 0
+    for match in TOKEN_RE.finditer(text):
+        kind = match.lastgroup
+        if kind == 'hashtag':
+            name = match.group('hashtag')
+            hashtags[name.lower()] = None
+            if render:
+                append(escape(text[position:match.start()]))
+                append(f'<a href="{hashtag_url % name}" class="hashtag-link">#{name}</a>')
+        elif kind == 'mention':
+            name = match.group('mention')
+            mentions[name.lower()] = None
+            if render:
+                append(escape(text[position:match.start()]))
+                append(f'<a href="{profile_url % name}" class="mention-link">@{name}</a>')
+        elif kind == 'url':
+            url = _trim_url(match.group('url'))
+            urls.append(url)
+            if render:
+                href = url if url[0] == 'h' else f'http://{url}'
+                append(escape(text[position:match.start()]))
+                append(f'<a href="{escape(href)}" class="content-link" rel="nofollow">{escape(url)}</a>')
+                # Trailing punctuation goes back to the text
+                append(escape(match.group()[len(url):]))
+        elif render:
+            append(escape(text[position:match.start()]))
+            append('</p>\n\n<p>' if kind == 'paragraph' else '<br>')
+        position = match.end()
+    html = None
+    if render:
+        append(escape(text[position:]))
+        append('</p>')
+        html = ''.join(parts)
+    return Tokens(list(hashtags), list(mentions), urls, html)
+
+
+def render(text):
+    """``text`` as HTML with hashtags, mentions and URLs linked. The result is escaped and safe to output."""
+    return tokenize(text).html
@@ -0,0 +1,122 @@
+"""
+Keyset-paginated comment threads.
+
+A post page shows one page of top-level comments with their reply counts.
+Later pages and each comment's replies are fetched on demand. Pages are
+addressed by an opaque cursor holding the last ``(created_at, id)`` shown,
+so fetching page 500 costs the same index range scan as page 1. An
+``OFFSET`` would make the database walk past every earlier row.
+
+Whole subthreads come from ``Comment.path`` instead: one range scan on
+``(post, path)`` returns every descendant already in display order, cut at
+COMMENT_THREAD_DEPTH levels with a "continue this thread" link below.
+"""
+
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment
+
+
+def make_cursor(created_at, pk):
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def encode_cursor(comment):
+    return make_cursor(comment.created_at, comment.pk)
+
+
+def decode_cursor(value):
+    """``(created_at, id)`` from a cursor, or None if it is missing or malformed."""
+    if not value:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode()
+        created_at, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def with_reply_counts(queryset):
+    """Annotate ``reply_count`` with a correlated count, run only for the rows on the page."""
+    replies = Comment.objects.filter(parent=OuterRef('pk')).order_by().values('parent').annotate(
+        n=Count('pk')
+    ).values('n')
+    return queryset.annotate(reply_count=Coalesce(Subquery(replies, output_field=IntegerField()), 0))
+
+
+def keyset_page(queryset, after=None, limit=20):
+    """
+    Up to ``limit`` rows of ``queryset`` after the ``after`` cursor, oldest first.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    position = decode_cursor(after)
+    if position is not None:
+        created_at, pk = position
+        queryset = queryset.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk))
+    rows = list(queryset.order_by('created_at', 'pk')[:limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def comment_page(post, after=None, limit=None):
+    """A page of ``post``'s top-level comments with authors and reply counts."""
+    limit = limit or getattr(settings, 'COMMENTS_PER_PAGE', 20)
+    queryset = post.comments.filter(parent=None).select_related('user', 'user__profile')
+    return keyset_page(with_reply_counts(queryset), after, limit)
+
+
+def reply_page(comment, after=None, limit=None):
+    """A page of replies to ``comment``."""
+    limit = limit or getattr(settings, 'REPLIES_PER_PAGE', 10)
+    queryset = comment.replies.select_related('user', 'user__profile')
+    return keyset_page(with_reply_counts(queryset), after, limit)
+
+
+def thread(comment, after=None, max_depth=None, limit=None):
+    """
+    ``comment`` and its descendants, depth-first, at most ``max_depth`` levels down.
+
+    Each row gets ``level`` (depth below ``comment``) and ``continue_thread``
+    (it has replies beyond the depth cut). Returns ``(rows, next_cursor)``;
+    the cursor is the last path shown.
+    """
+    max_depth = getattr(settings, 'COMMENT_THREAD_DEPTH', 6) if max_depth is None else max_depth
+    limit = limit or getattr(settings, 'COMMENT_THREAD_PAGE', 100)
+    lower, upper = comment.subtree_bounds
+    queryset = Comment.objects.filter(
+        post_id=comment.post_id, path__gte=lower, path__lt=upper, depth__lte=comment.depth + max_depth,
+    ).select_related('user', 'user__profile')
+    if after:
+        queryset = queryset.filter(path__gt=after)
+    rows = list(with_reply_counts(queryset).order_by('path')[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].path
+    for row in rows:
+        row.level = row.depth - comment.depth
+        row.continue_thread = row.level == max_depth and row.reply_count > 0
+    return rows, next_cursor
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.pk,
+        'user': comment.user.username,
+        'text': comment.text,
+        'created_at': comment.created_at.isoformat(),
+        'parent': comment.parent_id,
+        'depth': comment.depth,
+        'reply_count': getattr(comment, 'reply_count', 0),
+    }
@@ -0,0 +1,152 @@
+"""
+Two-tier cache: a bounded per-process LRU in front of the shared cache.
+
+Reads try the in-process LRU first, then the shared backend (Redis in
+production), then compute. Keys can be placed in a namespace ("post:12",
+"user:3", see versions.py); the namespace's version counter is part of the
+stored key, so bumping it retires the old entries in every process at once
+without deleting them one by one. Each process re-reads a namespace counter
+at most every TIERED_CACHE_LOCAL_TIMEOUT seconds, which bounds how long
+another process's bump can go unnoticed.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .versions import bump, get_versions
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Thread-safe LRU of at most ``max_entries`` items, each with its own expiry."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (time.monotonic() + timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache:
+    def __init__(self, alias='default', max_entries=2048, local_timeout=5, timeout=300):
+        self.alias = alias
+        self.local = LocalLRU(max_entries)
+        self.local_timeout = local_timeout
+        self.timeout = timeout
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            alias=getattr(settings, 'TIERED_CACHE_ALIAS', 'default'),
+            max_entries=getattr(settings, 'TIERED_CACHE_LOCAL_MAX_ENTRIES', 2048),
+            local_timeout=getattr(settings, 'TIERED_CACHE_LOCAL_TIMEOUT', 5),
+            timeout=getattr(settings, 'TIERED_CACHE_TIMEOUT', 300),
+        )
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def make_key(self, key, namespace=None):
+        if namespace is None:
+            return f"tiered:{key}"
+        version = get_versions(namespace, max_age=self.local_timeout)[0]
+        return f"tiered:{namespace}:{version}:{key}"
+
+    def _count(self, tier, hit):
+        with self._stats_lock:
+            self._stats[tier]['hits' if hit else 'misses'] += 1
+
+    def get(self, key, default=None, namespace=None):
+        full_key = self.make_key(key, namespace)
+        value = self.local.get(full_key)
+        self._count('local', value is not _MISSING)
+        if value is not _MISSING:
+            return value
+
+        value = self.shared.get(full_key, _MISSING)
+        self._count('shared', value is not _MISSING)
+        if value is _MISSING:
+            return default
+        self.local.set(full_key, value, self.local_timeout)
+        return value
+
+    def set(self, key, value, timeout=None, namespace=None):
+        timeout = self.timeout if timeout is None else timeout
+        full_key = self.make_key(key, namespace)
+        self.shared.set(full_key, value, timeout)
+        self.local.set(full_key, value, min(self.local_timeout, timeout))
+
+    def get_or_set(self, key, default, timeout=None, namespace=None):
+        """Return the cached value, computing ``default()`` and storing it on a miss."""
+        value = self.get(key, _MISSING, namespace=namespace)
+        if value is _MISSING:
+            value = default() if callable(default) else default
+            self.set(key, value, timeout, namespace=namespace)
+        return value
+
+    def delete(self, key, namespace=None):
+        full_key = self.make_key(key, namespace)
+        self.local.delete(full_key)
+        self.shared.delete(full_key)
+
+    def invalidate(self, *namespaces):
+        """Retire every entry stored under ``namespaces``, in every process."""
+        bump(*namespaces)
+
+    def clear_local(self):
+        self.local.clear()
+
+    def _reset_stats(self):
+        with self._stats_lock:
+            self._stats = {tier: {'hits': 0, 'misses': 0} for tier in ('local', 'shared')}
+
+    def stats(self):
+        """Hits, misses and hit ratio per tier for this process."""
+        with self._stats_lock:
+            stats = {tier: dict(counts) for tier, counts in self._stats.items()}
+        for counts in stats.values():
+            lookups = counts['hits'] + counts['misses']
+            counts['hit_ratio'] = counts['hits'] / lookups if lookups else None
+        stats['local']['entries'] = len(self.local)
+        stats['local']['max_entries'] = self.local.max_entries
+        return stats
+
+
+tiered_cache = TieredCache.from_settings()
@@ -2,9 +2,12 @@ from django.urls import path
 from django.contrib.auth import views as auth_views
 from django.conf import settings
 from django.conf.urls.static import static
-from . import views
+from . import api, views, async_views
 from .views import PostCreateView
 
+# Native async implementations of the hottest endpoints for ASGI deployments
+hot_views = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
     # Auth
     path('accounts/login/', auth_views.LoginView.as_view(template_name='social_app/login.html'), name='login'),
@@ -34,13 +37,16 @@ urlpatterns = [
          name='password_change_done'),
 
     # Main Feed
-    path('', views.feed_view, name='feed'), 
+    path('', hot_views.feed_view, name='feed'), 
     path('following/', views.following_feed_view, name='following_feed'), 
+    path('for-you/', views.for_you_feed_view, name='for_you_feed'),
     
     # User Profiles
     path('profile/<str:username>/', views.profile_view, name='profile'),
     path('settings/profile/', views.profile_update_view, name='profile_update'),
     path('profile/update/', views.profile_update_view), # Compatibility redirect
+    path('settings/export/', views.export_data_view, name='export_data'),
+    path('settings/delete-account/', views.delete_account_view, name='delete_account'),
     path('search/', views.search_view, name='search'),
     
     # Posts
@@ -50,17 +56,35 @@ urlpatterns = [
     path('post/<int:post_id>/pin/', views.toggle_pin_post, name='toggle_pin_post'),
     
     # Interactions
-    path('post/<int:post_id>/like/', views.like_post_toggle, name='like_post_toggle'),
+    path('post/<int:post_id>/like/', hot_views.like_post_toggle, name='like_post_toggle'),
     path('post/<int:post_id>/comment/', views.add_comment_to_post, name='add_comment_to_post'),
     path('comment/<int:comment_id>/reply/', views.add_reply_to_comment, name='add_reply_to_comment'),
+    path('post/<int:post_id>/comments/', views.post_comments_view, name='post_comments'),
+    path('comment/<int:comment_id>/replies/', views.comment_replies_view, name='comment_replies'),
+    path('comment/<int:comment_id>/thread/', views.comment_thread_view, name='comment_thread'),
     path('user/<str:username>/follow/', views.follow_user_toggle, name='follow_user_toggle'),
     
     # Hashtags
     path('hashtag/<str:hashtag_name>/', views.hashtag_view, name='hashtag_view'),
     
     # Notifications
-    path('notifications/', views.notifications_view, name='notifications'),
-    path('api/notifications/unread-count/', views.unread_notifications_count, name='unread_notifications_count'),
+    path('notifications/', hot_views.notifications_view, name='notifications'),
+    path('notifications/<int:notification_id>/open/', views.open_notification, name='open_notification'),
+    path('api/notifications/unread-count/', hot_views.unread_notifications_count, name='unread_notifications_count'),
+
+    # JSON API
+    path('api/v1/feed/', api.feed, name='api_feed'),
+    path('api/v1/feed/following/', api.following_feed, name='api_following_feed'),
+    path('api/v1/posts/<int:post_id>/', api.post_detail, name='api_post'),
+    path('api/v1/users/<str:username>/', api.user_detail, name='api_user'),
+    path('api/v1/users/<str:username>/posts/', api.user_posts, name='api_user_posts'),
+    path('api/v1/hashtags/<str:hashtag_name>/posts/', api.hashtag_posts, name='api_hashtag_posts'),
+    path('api/v1/notifications/', api.notifications, name='api_notifications'),
+    path('api/v1/batch/', api.batch, name='api_batch'),
+
+    # Operations
+    path('api/admin/db-stats/', views.db_connection_stats, name='db_connection_stats'),
+    path('api/admin/cache-stats/', views.cache_stats, name='cache_stats'),
 ]
 
 # Serve media files during development
@@ -1,28 +1,31 @@
-import re
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import Hashtag, Notification
+from django.db import transaction
+from django.utils import timezone
+from .models import Hashtag, Like, Notification, Profile
+from .text import render, tokenize
+from .versions import abump, bump, notifications_scope
 
 def extract_hashtags(text):
     """Extract hashtags from text and return a list of hashtag names."""
-    hashtag_pattern = r'#(\w+)'
-    return re.findall(hashtag_pattern, text.lower())
+    return tokenize(text, render=False).hashtags
 
 def extract_mentions(text):
     """Extract @mentions from text and return a list of usernames."""
-    mention_pattern = r'@(\w+)'
-    return re.findall(mention_pattern, text.lower())
+    return tokenize(text, render=False).mentions
 
 def process_post_content(post):
     """Process post content to extract and save hashtags and mentions."""
+    tokens = tokenize(post.content, render=False)
     # Extract hashtags
-    hashtag_names = extract_hashtags(post.content)
-    for hashtag_name in hashtag_names:
+    for hashtag_name in tokens.hashtags:
         hashtag, created = Hashtag.objects.get_or_create(name=hashtag_name)
         hashtag.posts.add(post)
 
     # Extract mentions and create notifications
-    mentioned_usernames = extract_mentions(post.content)
-    for username in mentioned_usernames:
+    for username in tokens.mentions:
         try:
             mentioned_user = User.objects.get(username=username)
             if mentioned_user != post.user:  # Don't notify self
@@ -36,10 +39,15 @@ def process_post_content(post):
         except User.DoesNotExist:
             continue
 
+def is_aggregated(notification_type):
+    return notification_type in getattr(settings, 'AGGREGATED_NOTIFICATION_TYPES', ())
+
 def create_notification(recipient, sender, notification_type, message, post=None, comment=None):
     """Create a notification for a user."""
     if recipient != sender:  # Don't notify self
-        Notification.objects.create(
+        if is_aggregated(notification_type):
+            return aggregate_notification(recipient, sender, notification_type, post=post)
+        return Notification.objects.create(
             recipient=recipient,
             sender=sender,
             notification_type=notification_type,
@@ -48,20 +56,156 @@ def create_notification(recipient, sender, notification_type, message, post=None
             message=message
         )
 
+async def acreate_notification(recipient, sender, notification_type, message, post=None, comment=None):
+    """Async version of create_notification for native async views."""
+    if recipient != sender:  # Don't notify self
+        if is_aggregated(notification_type):
+            return await sync_to_async(aggregate_notification)(
+                recipient, sender, notification_type, post=post
+            )
+        return await Notification.objects.acreate(
+            recipient=recipient,
+            sender=sender,
+            notification_type=notification_type,
+            post=post,
+            comment=comment,
+            message=message
+        )
+
+def aggregate_notification(recipient, sender, notification_type, post=None):
+    """
+    Fold a notification into the recipient's latest row for the same type and post.
+
+    Activity within NOTIFICATION_AGGREGATION_WINDOW updates that row in place
+    (actor count, latest actors, timestamp, unread) instead of inserting one
+    row per actor, so a viral post produces one "A, B and 312 others" row.
+    """
+    now = timezone.now()
+    window = now - timedelta(seconds=getattr(settings, 'NOTIFICATION_AGGREGATION_WINDOW', 86400))
+    limit = getattr(settings, 'NOTIFICATION_RECENT_ACTORS', 3)
+
+    with transaction.atomic():
+        notification = Notification.objects.select_for_update().select_related('sender').filter(
+            recipient=recipient,
+            notification_type=notification_type,
+            post=post,
+            created_at__gte=window,
+        ).order_by('-created_at').first()
+
+        if notification is None:
+            notification = Notification(
+                recipient=recipient,
+                sender=sender,
+                notification_type=notification_type,
+                post=post,
+                recent_actors=[sender.username],
+            )
+            notification.message = notification.build_message()
+            notification.save()
+            return notification
+
+        # Rows created before aggregation existed only know their sender
+        actors = notification.recent_actors or [notification.sender.username]
+        if sender.username not in actors:
+            notification.actor_count += 1
+        notification.recent_actors = [sender.username] + [
+            name for name in actors if name != sender.username
+        ][:limit - 1]
+        notification.sender = sender
+        notification.created_at = now
+        notification.is_read = False
+        notification.message = notification.build_message()
+        notification.save(update_fields=[
+            'actor_count', 'recent_actors', 'sender', 'created_at', 'is_read', 'message'
+        ])
+        return notification
+
+def retract_notification(recipient, sender, notification_type, post=None):
+    """Undo a notification when its action is reversed (unlike, unfollow)."""
+    try:
+        _retract_notification(recipient, sender, notification_type, post)
+    finally:
+        bump(notifications_scope(recipient.id))
+
+def _retract_notification(recipient, sender, notification_type, post):
+    notifications = Notification.objects.filter(
+        recipient=recipient,
+        notification_type=notification_type,
+        post=post,
+    )
+    if not is_aggregated(notification_type):
+        notifications.filter(sender=sender).delete()
+        return
+
+    with transaction.atomic():
+        # The actor's row is the one naming them or, past the named few, one
+        # with unnamed actors left; the latest rows cover any still in the window
+        candidates = list(
+            notifications.select_for_update().select_related('sender').order_by('-created_at')[:5]
+        )
+        named = [n for n in candidates if sender.username in (n.recent_actors or [n.sender.username])]
+        unnamed = [n for n in candidates if n.actor_count > len(n.recent_actors or [n.sender.username])]
+        notification = (named or unnamed or [None])[0]
+        if notification is None:
+            return
+
+        notification.actor_count -= 1
+        actors = [name for name in notification.recent_actors or [notification.sender.username]
+                  if name != sender.username]
+        limit = min(getattr(settings, 'NOTIFICATION_RECENT_ACTORS', 3), notification.actor_count)
+        if len(actors) < limit:
+            actors += [name for name in _remaining_actors(recipient, sender, notification_type, post, limit)
+                       if name not in actors][:limit - len(actors)]
+        # No one left to show means no one is left at all
+        if notification.actor_count <= 0 or not actors:
+            notification.delete()
+            return
+
+        if notification.sender_id == sender.id or notification.sender.username not in actors:
+            next_sender = User.objects.filter(username=actors[0]).first()
+            if next_sender is None:
+                notification.delete()
+                return
+            notification.sender = next_sender
+        notification.recent_actors = actors
+        notification.message = notification.build_message()
+        notification.save(update_fields=['actor_count', 'recent_actors', 'sender', 'message'])
+
+def _remaining_actors(recipient, sender, notification_type, post, limit):
+    """Latest users still behind an aggregated notification, from the likes or follows themselves."""
+    if notification_type == 'like' and post is not None:
+        rows = Like.objects.filter(post=post).order_by('-created_at').values_list('user__username', flat=True)
+        return list(rows.exclude(user=sender)[:limit])
+    if notification_type == 'follow':
+        rows = Profile.follows.through.objects.filter(to_profile__user=recipient).order_by('-pk').values_list(
+            'from_profile__user__username', flat=True
+        )
+        return list(rows.exclude(from_profile__user=sender)[:limit])
+    return []
+
+aretract_notification = sync_to_async(retract_notification)
+
+def unread_notifications(user, seen_at=None):
+    """
+    Notifications the user has not seen: newer than their notifications_seen_at
+    watermark and not opened individually (``is_read``).
+    """
+    notifications = Notification.objects.filter(recipient=user, is_read=False)
+    if seen_at is not None:
+        notifications = notifications.filter(created_at__gt=seen_at)
+    return notifications
+
+def mark_notifications_seen(user):
+    """Mark everything read with a single-row watermark write."""
+    updated = Profile.objects.filter(user=user).update(notifications_seen_at=timezone.now())
+    bump(notifications_scope(user.id))
+    return updated
+
+async def amark_notifications_seen(user):
+    updated = await Profile.objects.filter(user=user).aupdate(notifications_seen_at=timezone.now())
+    await abump(notifications_scope(user.id))
+    return updated
+
 def format_post_content(content):
     """Format post content to make hashtags and mentions clickable."""
-    # Make hashtags clickable
-    content = re.sub(
-        r'#(\w+)',
-        r'<a href="/hashtag/\1/" class="hashtag-link">#\1</a>',
-        content
-    )
-    
-    # Make mentions clickable
-    content = re.sub(
-        r'@(\w+)',
-        r'<a href="/profile/\1/" class="mention-link">@\1</a>',
-        content
-    )
-    
-    return content
\ No newline at end of file
+    return render(content)
@@ -0,0 +1,304 @@
+"""
+Version counters for HTTP conditional GET and cache namespaces.
+
+Each scope ("posts", "user:<id>", "notifications:<id>", ...) has a counter in
+the cache that is bumped whenever something shown under that scope changes.
+Views combine the counters with the viewer and query string into an ETag, so
+``django.views.decorators.http.condition`` can answer ``304 Not Modified``
+before any page query runs.
+
+The same counters namespace ``tiered_cache`` keys, so bumping a scope also
+retires every cached value stored under it, in every process.
+
+Missing counters start from the current time in milliseconds rather than 1,
+so a cache flush can never make an old ETag valid again.
+"""
+
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth.models import User
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers, quote_etag
+
+from .models import Comment, Hashtag, Like, Notification, Post, Profile
+
+POSTS = 'posts'
+TIMELINE = 'timeline'  # which posts exist and their order; not bumped by likes
+SUGGESTIONS = 'suggestions'
+HASHTAGS = 'hashtags'  # hashtag lookups by name; bumped when tags are deleted
+
+# Per-process copies of recently read counters, for get_versions(max_age=...)
+_local = {}
+_local_lock = threading.Lock()
+
+
+def user_scope(user_id):
+    """Profile details and relationships of ``user_id``."""
+    return f"user:{user_id}"
+
+
+def following_scope(user_id):
+    """Who ``user_id`` follows (their following feed)."""
+    return f"following:{user_id}"
+
+
+def notifications_scope(user_id):
+    return f"notifications:{user_id}"
+
+
+def post_scope(post_id):
+    """One post's details, hashtags, like and comment counts."""
+    return f"post:{post_id}"
+
+
+def hashtag_scope(hashtag_id):
+    return f"hashtag:{hashtag_id}"
+
+
+def _key(scope):
+    return f"version:{scope}"
+
+
+def _fresh():
+    return int(time.time() * 1000)
+
+
+def get_versions(*scopes, max_age=0):
+    """
+    Current counters for ``scopes``, in order, initialising missing ones.
+
+    With ``max_age`` a counter read by this process in the last ``max_age``
+    seconds is reused without a cache round trip; bumps made by this process
+    are always seen immediately.
+    """
+    now = time.monotonic()
+    versions = {}
+    if max_age:
+        with _local_lock:
+            for scope in scopes:
+                entry = _local.get(scope)
+                if entry is not None and entry[0] > now:
+                    versions[scope] = entry[1]
+
+    missing = [scope for scope in scopes if scope not in versions]
+    if missing:
+        found = cache.get_many([_key(scope) for scope in missing])
+        for scope in missing:
+            key = _key(scope)
+            if key not in found:
+                cache.add(key, _fresh(), timeout=None)
+                found[key] = cache.get(key)
+            versions[scope] = found[key]
+        if max_age:
+            with _local_lock:
+                for scope in missing:
+                    _local[scope] = (now + max_age, versions[scope])
+
+    return [versions[scope] for scope in scopes]
+
+
+def bump(*scopes):
+    """Invalidate every ETag and tiered cache entry built from ``scopes``."""
+    for scope in scopes:
+        try:
+            cache.incr(_key(scope))
+        except ValueError:
+            cache.set(_key(scope), _fresh(), timeout=None)
+        with _local_lock:
+            _local.pop(scope, None)
+
+
+# For the event loop: cache round trips run in the sync thread. The async
+# cache API would not help, as BaseCache.aincr is a get and a set, not atomic.
+aget_versions = sync_to_async(get_versions)
+abump = sync_to_async(bump)
+
+
+def make_etag(*parts):
+    return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def request_etag(request, user, name, *scopes):
+    """
+    ETag for a page built from ``scopes`` as seen by ``user``.
+
+    Returns None (no ETag, always render) while flash messages are pending so
+    they are never hidden behind a 304. The messages cookie is checked rather
+    than the storage itself, which may need the session in async views.
+
+    Pages carry a CSRF token and depend on the session, so the CSRF secret and
+    session key are part of the ETag: after a new login or a rotated token the
+    browser gets a fresh page instead of one whose forms fail with a 403.
+    """
+    if request.COOKIES.get(CookieStorage.cookie_name):
+        return None
+    get_token(request)  # the secret this page's token is built from, created now if the request had none
+    session = getattr(request, 'session', None)
+    return make_etag(
+        name, user.pk, request.GET.urlencode(),
+        request.META['CSRF_COOKIE'], session.session_key if session is not None else None,
+        *get_versions(*scopes),
+    )
+
+
+def etag_condition(etag_func):
+    """
+    ``condition(etag_func=...)`` for both sync and async views.
+
+    ``etag_func(request, user, *args, **kwargs)`` receives the authenticated
+    user, loaded with ``request.auser()`` under ASGI. For async views it runs
+    in the sync thread, so its cache and database reads never block the event
+    loop.
+    """
+    def decorator(view):
+        def check(request, user, args, kwargs):
+            etag = etag_func(request, user, *args, **kwargs)
+            etag = quote_etag(etag) if etag is not None else None
+            return etag, get_conditional_response(request, etag=etag)
+
+        def finish(request, response, etag):
+            if etag and request.method in ('GET', 'HEAD'):
+                response.headers.setdefault('ETag', etag)
+                # Built for this session only; shared caches must not answer for it
+                patch_cache_control(response, private=True)
+                patch_vary_headers(response, ('Cookie',))
+            return response
+
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def inner(request, *args, **kwargs):
+                etag, response = await sync_to_async(check)(request, await request.auser(), args, kwargs)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return finish(request, response, etag)
+        else:
+            @wraps(view)
+            def inner(request, *args, **kwargs):
+                etag, response = check(request, request.user, args, kwargs)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return finish(request, response, etag)
+        return inner
+
+    return decorator
+
+
+# --- Page validators ---
+
+def feed_etag(request, user):
+    return request_etag(request, user, 'feed', POSTS, SUGGESTIONS, following_scope(user.pk))
+
+
+def following_feed_etag(request, user):
+    return request_etag(request, user, 'following', POSTS, SUGGESTIONS, following_scope(user.pk))
+
+
+def profile_etag(request, user, username):
+    profile_user_id = User.objects.filter(username=username).values_list('pk', flat=True).first()
+    if profile_user_id is None:
+        return None
+    return request_etag(
+        request, user, f"profile:{profile_user_id}", POSTS, SUGGESTIONS,
+        user_scope(profile_user_id), following_scope(user.pk),
+    )
+
+
+def unread_count_etag(request, user):
+    return request_etag(request, user, 'unread', notifications_scope(user.pk))
+
+
+# --- Invalidation ---
+
+@receiver([post_save, post_delete], sender=Post)
+def post_changed(sender, instance, **kwargs):
+    bump(POSTS, TIMELINE, user_scope(instance.user_id), post_scope(instance.pk))
+
+
+# Likes, comments and notifications only listen to post_save: a post_delete
+# receiver would stop Django from fast-deleting them when a post is removed.
+# Code that deletes them directly bumps the scope itself.
+
+@receiver(post_save, sender=Like)
+@receiver(post_save, sender=Comment)
+def engagement_changed(sender, instance, **kwargs):
+    bump(POSTS, post_scope(instance.post_id))
+
+
+@receiver(post_save, sender=Hashtag)
+def hashtag_changed(sender, instance, **kwargs):
+    bump(hashtag_scope(instance.pk))
+
+
+def _changed_ids(sender, instance, action, reverse, pk_set, source, target):
+    """
+    Ids on the other side of an m2m change, or None for actions to ignore.
+
+    ``source`` and ``target`` name the through table's foreign keys for a
+    forward change. ``post_clear`` has no ``pk_set``, so the ids are read at
+    ``pre_clear``, while the rows still exist, and kept on the instance.
+    """
+    if reverse:
+        source, target = target, source
+    if action == 'pre_clear':
+        instance._cleared_ids = set(sender.objects.filter(
+            **{f'{source}_id': instance.pk}
+        ).values_list(f'{target}_id', flat=True))
+        return None
+    if action == 'post_clear':
+        return instance.__dict__.pop('_cleared_ids', set())
+    if action in ('post_add', 'post_remove'):
+        return pk_set or set()
+    return None
+
+
+@receiver(m2m_changed, sender=Hashtag.posts.through)
+def hashtag_posts_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    pk_set = _changed_ids(sender, instance, action, reverse, pk_set, 'hashtag', 'post')
+    if pk_set is None:
+        return
+    hashtag_ids = [instance.pk] if not reverse else list(pk_set)
+    post_ids = list(pk_set) if not reverse else [instance.pk]
+    bump(
+        POSTS,
+        *[hashtag_scope(hashtag_id) for hashtag_id in hashtag_ids],
+        *[post_scope(post_id) for post_id in post_ids],
+    )
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logins save last_login only; that is shown nowhere
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        bump(user_scope(instance.pk))
+
+
+@receiver(post_save, sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    bump(user_scope(instance.user_id))
+
+
+@receiver(m2m_changed, sender=Profile.follows.through)
+def follows_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    pk_set = _changed_ids(sender, instance, action, reverse, pk_set, 'from_profile', 'to_profile')
+    if pk_set is None:
+        return
+    others = list(Profile.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+    followers = others if reverse else [instance.user_id]
+    bump(
+        user_scope(instance.user_id),
+        *[user_scope(user_id) for user_id in others],
+        *[following_scope(user_id) for user_id in followers],
+    )
+
+
+@receiver(post_save, sender=Notification)
+def notification_changed(sender, instance, **kwargs):
+    bump(notifications_scope(instance.recipient_id))
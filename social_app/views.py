@@ -4,14 +4,17 @@ from django.db.models import Q, Exists, OuterRef, Count
 from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_protect
 from django.views.generic import CreateView, UpdateView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.contrib.auth import login
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth import login, logout
 from django.db import IntegrityError
 from django.conf import settings
+import hashlib
 import logging
 
 from .models import Post, Like, Profile, Comment, Notification, Hashtag
@@ -20,7 +23,25 @@ from .forms import (
     UserRegisterForm, CommentForm, ProfileUpdateForm, 
     PostCreateForm, UserUpdateForm, ReplyForm
 )
-from .utils import process_post_content, create_notification
+from .utils import (
+    create_notification, retract_notification, unread_notifications, mark_notifications_seen
+)
+from .tasks import process_post_content_task
+from .db_metrics import connection_stats
+from .archive import TieredNotifications, page_reach
+from .graph import follow_graph
+from .suggestions import suggestions_for
+from .ranking import ranked_post_ids
+from .tiered_cache import tiered_cache
+from .stampede import cache_compute, cached_page, load_page_objects
+from .likes import toggle_like
+from .deletion import delete_account, delete_post as soft_delete_post
+from .export import aiterate, export_lines, export_zip
+from .threads import comment_page, reply_page, serialize_comment, thread
+from .versions import (
+    HASHTAGS, TIMELINE, bump, etag_condition, feed_etag, following_feed_etag,
+    get_versions, hashtag_scope, notifications_scope, profile_etag, unread_count_etag
+)
 
 logger = logging.getLogger(__name__)
 
@@ -48,34 +69,37 @@ def profile_update_view(request):
 
 
 @login_required
+@etag_condition(feed_etag)
 def feed_view(request):
     """Displays a global feed with all posts from all users."""
     
-    # Show ALL posts from ALL users (global feed)
-    posts = Post.objects.all().annotate(
+    # Show ALL posts from ALL users (global feed); the page's ids are cached
+    # for everyone, the per-viewer annotations are added below
+    page_obj = cached_page(
+        'feed', Post.objects.order_by('-is_pinned', '-created_at'),
+        getattr(settings, 'POSTS_PER_PAGE', 10), request.GET.get('page'),
+        version=get_versions(TIMELINE)[0],
+    )
+    load_page_objects(page_obj, Post.objects.annotate(
         is_liked_by_user=Exists(Like.objects.filter(user=request.user, post=OuterRef('pk')))
     ).select_related('user', 'user__profile').prefetch_related(
         'comments__user', 'likes', 'hashtags'
-    ).order_by('-is_pinned', '-created_at')
-    
-    # Pagination
-    paginator = Paginator(posts, getattr(settings, 'POSTS_PER_PAGE', 10))
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    ))
     
     context = {
         'page_obj': page_obj,
         'posts': page_obj.object_list,
-        'feed_type': 'global'
+        'feed_type': 'global',
+        'suggestions': suggestions_for(request.user),
     }
     return render(request, 'social_app/feed.html', context)
 
 
 @login_required
+@etag_condition(following_feed_etag)
 def following_feed_view(request):
     """Displays a personalized feed with posts from followed users only."""
-    followed_profiles = request.user.profile.follows.all()
-    followed_users = [profile.user.id for profile in followed_profiles]
+    followed_users = list(follow_graph.following_ids(request.user.id))
     followed_users.append(request.user.id)  # Include own posts
     
     posts = Post.objects.filter(user_id__in=followed_users).annotate(
@@ -92,7 +116,33 @@ def following_feed_view(request):
     context = {
         'page_obj': page_obj,
         'posts': page_obj.object_list,
-        'feed_type': 'following'
+        'feed_type': 'following',
+        'suggestions': suggestions_for(request.user),
+    }
+    return render(request, 'social_app/feed.html', context)
+
+
+@login_required
+def for_you_feed_view(request):
+    """Displays posts ranked for the current user (see ranking.py)."""
+    ranked_ids = ranked_post_ids(request.user)
+    paginator = Paginator(ranked_ids, getattr(settings, 'POSTS_PER_PAGE', 10))
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    posts = Post.objects.filter(pk__in=page_obj.object_list).annotate(
+        is_liked_by_user=Exists(Like.objects.filter(user=request.user, post=OuterRef('pk')))
+    ).select_related('user', 'user__profile').prefetch_related(
+        'comments__user', 'likes', 'hashtags'
+    )
+    # Keep the ranked order; posts deleted since the ranking was cached drop out
+    by_id = {post.pk: post for post in posts}
+    page_obj.object_list = [by_id[pk] for pk in page_obj.object_list if pk in by_id]
+
+    context = {
+        'page_obj': page_obj,
+        'posts': page_obj.object_list,
+        'feed_type': 'for_you',
+        'suggestions': suggestions_for(request.user),
     }
     return render(request, 'social_app/feed.html', context)
 
@@ -103,37 +153,13 @@ def following_feed_view(request):
 def like_post_toggle(request, post_id):
     """AJAX endpoint for liking/unliking posts."""
     try:
-        post = get_object_or_404(Post, id=post_id)
-        user = request.user
-        
-        like_query = Like.objects.filter(user=user, post=post)
-        
-        if like_query.exists():
-            like_query.delete()
-            liked = False
-            # Remove like notification if exists
-            Notification.objects.filter(
-                recipient=post.user,
-                sender=user,
-                notification_type='like',
-                post=post
-            ).delete()
-        else:
-            Like.objects.create(user=user, post=post)
-            liked = True
-            # Create like notification
-            create_notification(
-                recipient=post.user,
-                sender=user,
-                notification_type='like',
-                message=f"{user.username} liked your post",
-                post=post
-            )
+        post = get_object_or_404(Post.objects.select_related('user'), id=post_id)
+        liked, likes_count = toggle_like(request.user, post)
         
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return JsonResponse({
                 'liked': liked,
-                'likes_count': post.likes.count()
+                'likes_count': likes_count
             })
         
         return redirect(request.META.get('HTTP_REFERER', 'feed'))
@@ -147,10 +173,11 @@ def like_post_toggle(request, post_id):
 
 
 @login_required
+@etag_condition(profile_etag)
 def profile_view(request, username):
-    profile_user = get_object_or_404(User, username=username)
+    profile_user = get_object_or_404(User, username=username, is_active=True)
     profile = get_object_or_404(Profile, user=profile_user)
-    is_following = request.user.profile.follows.filter(user=profile_user).exists()
+    relationship = follow_graph.relationships(request.user.id, [profile_user.id])[profile_user.id]
     
     posts = profile_user.posts.annotate(
         is_liked_by_user=Exists(Like.objects.filter(user=request.user, post=OuterRef('pk')))
@@ -168,16 +195,42 @@ def profile_view(request, username):
         'profile': profile,
         'posts': page_obj.object_list,
         'page_obj': page_obj,
-        'is_following': is_following,
+        'is_following': relationship['following'],
+        'follows_you': relationship['followed_by'],
+        'suggestions': suggestions_for(request.user) if request.user == profile_user else [],
     }
     return render(request, 'social_app/profile.html', context)
 
 
+def search_matches(query):
+    """Ids of the users, posts and hashtags matching ``query``."""
+    users = User.objects.filter(is_active=True).filter(
+        Q(username__icontains=query) | 
+        Q(first_name__icontains=query) | 
+        Q(last_name__icontains=query) |
+        Q(profile__bio__icontains=query)
+    ).distinct().values_list('pk', flat=True)[:10]
+
+    posts = Post.objects.filter(content__icontains=query).order_by(
+        '-created_at'
+    ).values_list('pk', flat=True)[:20]
+
+    # Search hashtags
+    hashtag_name = query[1:] if query.startswith('#') else query  # Remove the # symbol
+    hashtags = Hashtag.objects.filter(name__icontains=hashtag_name).values_list('pk', flat=True)[:10]
+    return {'users': list(users), 'posts': list(posts), 'hashtags': list(hashtags)}
+
+
+def in_order(queryset, ids):
+    """Rows of ``queryset`` with the given ids, in the order of ``ids``."""
+    by_id = {obj.pk: obj for obj in queryset.filter(pk__in=ids)}
+    return [by_id[pk] for pk in ids if pk in by_id]
+
+
 @login_required
 def search_view(request):
     query = request.GET.get('q', '').strip()
     users = []
-    posts = []
     hashtags = []
     
     # Validate query length to prevent abuse
@@ -185,35 +238,30 @@ def search_view(request):
         messages.error(request, 'Search query is too long. Please use fewer than 100 characters.')
         query = query[:100]
     
+    post_ids = []
     if query and len(query) >= 2:  # Minimum 2 characters for search
-        # Search users
-        users = User.objects.filter(
-            Q(username__icontains=query) | 
-            Q(first_name__icontains=query) | 
-            Q(last_name__icontains=query) |
-            Q(profile__bio__icontains=query)
-        ).select_related('profile').distinct()[:10]
-        
-        # Search posts
-        posts = Post.objects.filter(content__icontains=query).annotate(
-            is_liked_by_user=Exists(Like.objects.filter(user=request.user, post=OuterRef('pk')))
-        ).select_related('user', 'user__profile').prefetch_related(
-            'comments__user', 'likes', 'hashtags'
-        ).order_by('-created_at')[:20]
-
-        # Search hashtags
-        if query.startswith('#'):
-            hashtag_name = query[1:]  # Remove the # symbol
-            hashtags = Hashtag.objects.filter(name__icontains=hashtag_name)[:10]
-        else:
-            hashtags = Hashtag.objects.filter(name__icontains=query)[:10]
+        # The matching (substring scans) is shared by everyone searching the same text
+        matches = cache_compute(
+            f"search:{hashlib.md5(query.lower().encode()).hexdigest()}",
+            lambda: search_matches(query),
+            getattr(settings, 'PAGE_CACHE_SECONDS', 30),
+            stale=getattr(settings, 'PAGE_CACHE_STALE_SECONDS', 60),
+            version=get_versions(TIMELINE)[0],
+        )
+        users = in_order(User.objects.select_related('profile'), matches['users'])
+        post_ids = matches['posts']
+        hashtags = in_order(Hashtag.objects.all(), matches['hashtags'])
     elif query and len(query) < 2:
         messages.info(request, 'Please enter at least 2 characters to search.')
 
     # Paginate search results
-    paginator = Paginator(posts, getattr(settings, 'POSTS_PER_PAGE', 10))
+    paginator = Paginator(post_ids, getattr(settings, 'POSTS_PER_PAGE', 10))
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = load_page_objects(paginator.get_page(page_number), Post.objects.annotate(
+        is_liked_by_user=Exists(Like.objects.filter(user=request.user, post=OuterRef('pk')))
+    ).select_related('user', 'user__profile').prefetch_related(
+        'comments__user', 'likes', 'hashtags'
+    ))
 
     context = {
         'query': query,
@@ -237,15 +285,15 @@ def follow_user_toggle(request, username):
     target_profile = target_user.profile
     current_user_profile = request.user.profile
 
-    if current_user_profile.follows.filter(user=target_user).exists():
+    if follow_graph.is_following(request.user.id, target_user.id):
         current_user_profile.follows.remove(target_profile)
         messages.success(request, f"You unfollowed {target_user.username}")
         # Remove follow notification
-        Notification.objects.filter(
+        retract_notification(
             recipient=target_user,
             sender=request.user,
             notification_type='follow'
-        ).delete()
+        )
     else:
         current_user_profile.follows.add(target_profile)
         messages.success(request, f"You are now following {target_user.username}")
@@ -269,8 +317,8 @@ class PostCreateView(LoginRequiredMixin, CreateView):
         form.instance.user = self.request.user
         response = super().form_valid(form)
         
-        # Process hashtags and mentions
-        process_post_content(self.object)
+        # Process hashtags and mentions (in the background unless TASKS_ALWAYS_EAGER)
+        process_post_content_task.delay(post_id=self.object.id)
         
         messages.success(self.request, 'Your post has been shared!')
         return response
@@ -350,17 +398,15 @@ def add_reply_to_comment(request, comment_id):
 @login_required
 def notifications_view(request):
     """Display user notifications."""
-    notifications = request.user.notifications.select_related(
-        'sender', 'post', 'comment'
-    ).order_by('-created_at')
+    # Recent rows first, then the archive once the user pages past them
+    page_number = request.GET.get('page')
+    notifications = TieredNotifications.for_user(request.user, page_reach(page_number, 20))
     
     # Mark notifications as read
-    unread_notifications = notifications.filter(is_read=False)
-    unread_notifications.update(is_read=True)
+    mark_notifications_seen(request.user)
     
     # Pagination
     paginator = Paginator(notifications, 20)
-    page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
     context = {
@@ -373,18 +419,22 @@ def notifications_view(request):
 @login_required
 def hashtag_view(request, hashtag_name):
     """Display posts for a specific hashtag."""
-    hashtag = get_object_or_404(Hashtag, name=hashtag_name.lower())
+    name = hashtag_name.lower()
+    hashtag = tiered_cache.get(f"hashtag:{name}", namespace=HASHTAGS)
+    if hashtag is None:
+        hashtag = get_object_or_404(Hashtag, name=name)
+        tiered_cache.set(f"hashtag:{name}", hashtag, namespace=HASHTAGS)
     
-    posts = hashtag.posts.annotate(
+    page_obj = cached_page(
+        f"hashtag:{hashtag.pk}", hashtag.posts.order_by('-created_at'),
+        getattr(settings, 'POSTS_PER_PAGE', 10), request.GET.get('page'),
+        version=tuple(get_versions(TIMELINE, hashtag_scope(hashtag.pk))),
+    )
+    load_page_objects(page_obj, Post.objects.annotate(
         is_liked_by_user=Exists(Like.objects.filter(user=request.user, post=OuterRef('pk')))
     ).select_related('user', 'user__profile').prefetch_related(
         'comments__user', 'likes', 'hashtags'
-    ).order_by('-created_at')
-    
-    # Pagination
-    paginator = Paginator(posts, getattr(settings, 'POSTS_PER_PAGE', 10))
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    ))
     
     context = {
         'hashtag': hashtag,
@@ -396,23 +446,77 @@ def hashtag_view(request, hashtag_name):
 
 @login_required
 def post_detail_view(request, post_id):
-    """Display a single post with all comments."""
+    """Display a single post with the first page of its comments."""
     post = get_object_or_404(Post, id=post_id)
-    
-    # Get top-level comments (not replies)
-    comments = post.comments.filter(parent=None).select_related(
-        'user'
-    ).prefetch_related('replies__user').order_by('created_at')
+    after = request.GET.get('after')
+    comments, next_cursor = comment_page(post, after)
     
     context = {
         'post': post,
         'comments': comments,
+        'next_cursor': next_cursor,
+        'after': after,
         'comment_form': CommentForm(),
         'reply_form': ReplyForm(),
     }
     return render(request, 'social_app/post_detail.html', context)
 
 
+def _wants_json(request):
+    return 'application/json' in request.headers.get('Accept', '')
+
+
+@login_required
+def post_comments_view(request, post_id):
+    """Next page of top-level comments, as an HTML fragment or JSON."""
+    post = get_object_or_404(Post, id=post_id)
+    after = request.GET.get('after')
+    comments, next_cursor = comment_page(post, after)
+    
+    if _wants_json(request):
+        return JsonResponse({
+            'comments': [serialize_comment(comment) for comment in comments],
+            'next': next_cursor,
+        })
+    context = {'post': post, 'comments': comments, 'next_cursor': next_cursor, 'after': after}
+    return render(request, 'social_app/comment_page.html', context)
+
+
+@login_required
+def comment_replies_view(request, comment_id):
+    """A page of replies to one comment, as an HTML fragment or JSON."""
+    comment = get_object_or_404(Comment, id=comment_id)
+    replies, next_cursor = reply_page(comment, request.GET.get('after'))
+    
+    if _wants_json(request):
+        return JsonResponse({
+            'replies': [serialize_comment(reply) for reply in replies],
+            'next': next_cursor,
+        })
+    context = {'comment': comment, 'replies': replies, 'next_cursor': next_cursor}
+    return render(request, 'social_app/comment_replies.html', context)
+
+
+@login_required
+def comment_thread_view(request, comment_id):
+    """A comment and its replies at every level, read with one range query on ``Comment.path``."""
+    comment = get_object_or_404(Comment.objects.select_related('post'), id=comment_id)
+    rows, next_cursor = thread(comment, request.GET.get('after'))
+    
+    if _wants_json(request):
+        return JsonResponse({
+            'comments': [serialize_comment(row) for row in rows],
+            'next': next_cursor,
+        })
+    context = {
+        'comment': comment,
+        'post': comment.post,
+        'rows': rows,
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'social_app/comment_thread.html', context)
+
+
 def register_view(request):
     if request.method == 'POST':
         form = UserRegisterForm(request.POST) 
@@ -450,7 +554,7 @@ def delete_post(request, post_id):
     post = get_object_or_404(Post, id=post_id, user=request.user)
     
     if request.method == 'POST':
-        post.delete()
+        soft_delete_post(post)
         messages.success(request, 'Post deleted successfully!')
         return redirect('profile', username=request.user.username)
     
@@ -458,7 +562,77 @@ def delete_post(request, post_id):
 
 
 @login_required
+def delete_account_view(request):
+    """Delete the signed-in account; its data is purged in the background."""
+    if request.method == 'POST':
+        delete_account(request.user)
+        logout(request)
+        messages.success(request, 'Your account has been deleted.')
+        return redirect('login')
+
+    return render(request, 'social_app/confirm_delete.html', {'object': request.user, 'type': 'account'})
+
+
+@login_required
+@etag_condition(unread_count_etag)
 def unread_notifications_count(request):
     """AJAX endpoint to get unread notifications count."""
-    count = request.user.notifications.filter(is_read=False).count()
-    return JsonResponse({'count': count})
\ No newline at end of file
+    count = unread_notifications(
+        request.user, request.user.profile.notifications_seen_at
+    ).count()
+    return JsonResponse({'count': count})
+
+
+@login_required
+def open_notification(request, notification_id):
+    """Mark a single notification read and go to what it refers to."""
+    notification = get_object_or_404(Notification, id=notification_id, recipient=request.user)
+    if not notification.is_read:
+        Notification.objects.filter(id=notification.id).update(is_read=True)
+        bump(notifications_scope(request.user.id))
+
+    if notification.post_id:
+        return redirect('post_detail', post_id=notification.post_id)
+    return redirect('profile', username=notification.sender.username)
+
+
+@login_required
+def export_data_view(request):
+    """
+    Download everything the account holds, streamed as it is read.
+
+    ``?format=zip`` adds the uploaded media; the default is JSON lines. Staff
+    can export another account with ``?username=``.
+    """
+    user = request.user
+    username = request.GET.get('username')
+    if username and username != user.username:
+        if not request.user.is_staff:
+            raise Http404
+        user = get_object_or_404(User, username=username)
+        logger.info(f"Data export of {user.username} by staff member {request.user.username}")
+
+    if request.GET.get('format') == 'zip':
+        content, content_type = export_zip(user), 'application/zip'
+        filename = f"{user.username}-export.zip"
+    else:
+        content, content_type = export_lines(user), 'application/x-ndjson'
+        filename = f"{user.username}-export.jsonl"
+    if isinstance(request, ASGIRequest):
+        # ASGI servers collect a sync iterator into a list before sending it
+        content = aiterate(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@staff_member_required
+def db_connection_stats(request):
+    """Staff-only endpoint exposing per-process connection and pool metrics."""
+    return JsonResponse({'databases': connection_stats()})
+
+
+@staff_member_required
+def cache_stats(request):
+    """Staff-only endpoint exposing per-process tiered cache hit ratios."""
+    return JsonResponse({'tiered_cache': tiered_cache.stats()})
@@ -0,0 +1,63 @@
+"""
+Database configuration helpers shared by the development and production settings.
+"""
+
+# PRAGMAs applied to every new SQLite connection when the performance profile is on.
+# WAL lets readers proceed while a writer holds the lock, NORMAL sync is safe under WAL,
+# and the cache/mmap sizes keep hot pages of the feed tables in memory.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 134217728,  # 128MB
+    'cache_size': -20000,  # ~20MB (negative values are KiB)
+    'busy_timeout': 5000,  # milliseconds
+    'temp_store': 'MEMORY',
+}
+
+
+def sqlite_init_command(pragmas=None):
+    """Build the ``init_command`` string run by Django on connection creation."""
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    return ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items())
+
+
+def apply_sqlite_profile(database, pragmas=None):
+    """
+    Apply the SQLite performance profile to a single DATABASES entry.
+
+    Writes are serialized with ``BEGIN IMMEDIATE`` so a transaction takes the
+    write lock up front instead of failing with "database is locked" when it
+    upgrades from a read lock half way through. Non-SQLite entries are
+    returned unchanged.
+    """
+    if database.get('ENGINE') != 'django.db.backends.sqlite3':
+        return database
+
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+    options = dict(database.get('OPTIONS', {}))
+    options.setdefault('init_command', sqlite_init_command(pragmas))
+    options.setdefault('transaction_mode', 'IMMEDIATE')
+    # sqlite3's own busy handler, in seconds, so Python-level waits match the PRAGMA
+    options.setdefault('timeout', pragmas.get('busy_timeout', 5000) / 1000)
+    return {**database, 'OPTIONS': options}
+
+
+def configure_connections(database, conn_max_age=60, health_checks=True, pool=None):
+    """
+    Apply connection management settings to a single DATABASES entry.
+
+    ``CONN_MAX_AGE`` is only honoured per database, so persistent connections
+    and ``CONN_HEALTH_CHECKS`` are set here. When ``pool`` is given (a dict of
+    psycopg_pool.ConnectionPool options) a PostgreSQL entry uses Django's
+    native pool instead; pooling replaces persistent connections, so
+    ``CONN_MAX_AGE`` is forced to 0 as Django requires.
+    """
+    database = dict(database)
+    if pool is not None and database.get('ENGINE') == 'django.db.backends.postgresql':
+        database['OPTIONS'] = {**database.get('OPTIONS', {}), 'pool': pool}
+        database['CONN_MAX_AGE'] = 0
+        database['CONN_HEALTH_CHECKS'] = False
+    else:
+        database['CONN_MAX_AGE'] = conn_max_age
+        database['CONN_HEALTH_CHECKS'] = health_checks
+    return database
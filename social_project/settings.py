@@ -14,6 +14,8 @@ from pathlib import Path
 from decouple import config
 import os
 
+from .database import apply_sqlite_profile
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,6 +48,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'social_app.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -73,6 +76,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'social_project.wsgi.application'
 
+# Serve native async views for the feed, like toggle and notifications.
+# Enable only when running under ASGI (uvicorn/daphne); under WSGI they would
+# each spin up an event loop per request.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -84,6 +92,17 @@ DATABASES = {
     }
 }
 
+# Opt-in SQLite tuning (WAL, pragmas, BEGIN IMMEDIATE) for concurrent likes/comments
+SQLITE_PERFORMANCE_PROFILE = config('SQLITE_PERFORMANCE_PROFILE', default=False, cast=bool)
+if SQLITE_PERFORMANCE_PROFILE:
+    DATABASES['default'] = apply_sqlite_profile(DATABASES['default'])
+
+# Read replicas (aliases in DATABASES); reads fall back to 'default' when empty or down
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['social_app.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=5, cast=int)
+REPLICA_RETRY_SECONDS = config('REPLICA_RETRY_SECONDS', default=30, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -147,8 +166,79 @@ SECURE_BROWSER_XSS_FILTER = True
 SECURE_CONTENT_TYPE_NOSNIFF = True
 X_FRAME_OPTIONS = 'DENY'
 
+# Cache. Production points 'default' at Redis (settings_production.py).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'socialhub',
+    }
+}
+
+# Per-process LRU in front of the shared cache (social_app/tiered_cache.py)
+TIERED_CACHE_ALIAS = 'default'
+TIERED_CACHE_LOCAL_MAX_ENTRIES = 2048
+TIERED_CACHE_LOCAL_TIMEOUT = 5  # seconds; also how long another process's invalidation can go unseen
+TIERED_CACHE_TIMEOUT = 300
+
+# Cached page ids for the global feed, hashtag and search pages (social_app/stampede.py).
+# Expired pages are served for PAGE_CACHE_STALE_SECONDS while one request refreshes them.
+PAGE_CACHE_SECONDS = 30
+PAGE_CACHE_STALE_SECONDS = 60
+STAMPEDE_LOCK_TIMEOUT = 10
+
+# Like counters live in the cache (social_app/likes.py). With write-behind on,
+# toggles on posts liked more than LIKES_HOT_THRESHOLD times per LIKES_HOT_WINDOW
+# seconds are buffered and written in bulk every LIKES_FLUSH_INTERVAL seconds.
+LIKES_COUNT_TIMEOUT = 600
+LIKES_WRITE_BEHIND = config('LIKES_WRITE_BEHIND', default=False, cast=bool)
+LIKES_HOT_THRESHOLD = 20
+LIKES_HOT_WINDOW = 10
+LIKES_FLUSH_INTERVAL = 2
+
 # Pagination
 POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20  # top-level comments per page on a post
+REPLIES_PER_PAGE = 10  # replies per "View replies" request
+COMMENT_THREAD_DEPTH = 6  # levels shown on a thread page before "Continue this thread"
+COMMENT_THREAD_PAGE = 100  # comments per thread page
+API_PAGE_SIZE = 20  # /api/v1/ list pages; clients may ask for up to API_MAX_PAGE_SIZE
+API_MAX_PAGE_SIZE = 100
+API_BATCH_MAX_ITEMS = 100  # posts plus users per /api/v1/batch/ request
+API_BATCH_CACHE_SECONDS = 300  # per-item batch entries; edits replace them sooner
+EXPORT_ROWS_PER_CHUNK = 500  # rows fetched per round trip by the data export
+EXPORT_CHUNK_SIZE = 64 * 1024  # bytes read per step from exported media files
+# Admin changelists of unfiltered tables with more rows than this show
+# PostgreSQL's row estimate instead of running COUNT(*)
+ESTIMATED_COUNT_THRESHOLD = 10000
+DELETION_BATCH_SIZE = 500  # rows per DELETE when purging deleted posts and accounts
+DELETION_BATCH_SLEEP = 0  # seconds between purge batches, to leave room for live traffic
+
+# Notification aggregation: likes/follows on the same post within the window
+# collapse into one row ("A, B and 312 others liked your post")
+AGGREGATED_NOTIFICATION_TYPES = ['like', 'follow']
+NOTIFICATION_AGGREGATION_WINDOW = 86400  # seconds since the row's latest activity
+NOTIFICATION_RECENT_ACTORS = 3
+# Notifications older than this move to the archive table (manage.py archive_notifications)
+NOTIFICATION_HOT_DAYS = 30
+
+# "Who to follow" (manage.py compute_suggestions)
+SUGGESTIONS_TOP_K = 20
+SUGGESTION_WEIGHTS = {'mutual': 1.0, 'hashtags': 0.5, 'popularity': 0.1}
+
+# Ranked "for you" feed: candidates come from the last RANKING_WINDOW_HOURS
+RANKING_WINDOW_HOURS = 72
+RANKING_CANDIDATES_PER_SOURCE = 200
+RANKING_HALF_LIFE_HOURS = 12
+RANKING_CACHE_SECONDS = 120
+RANKING_WEIGHTS = {'recency': 1.0, 'velocity': 1.0, 'author': 0.8, 'hashtags': 0.5, 'following': 0.5}
+
+# Background tasks (manage.py runworker). Eager mode runs tasks inline instead.
+TASKS_ALWAYS_EAGER = config('TASKS_ALWAYS_EAGER', default=True, cast=bool)
+TASK_MAX_ATTEMPTS = 3
+TASK_RETRY_BACKOFF = 5  # seconds, doubled per attempt
+TASK_RETRY_BACKOFF_MAX = 3600
+TASK_LOCK_TIMEOUT = 300  # seconds without a heartbeat before a running task is considered abandoned
+TASK_HEARTBEAT_INTERVAL = 60  # seconds between lease refreshes of a running task; well below TASK_LOCK_TIMEOUT
 
 # Logging Configuration
 LOGGING = {
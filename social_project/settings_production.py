@@ -6,6 +6,8 @@ from .settings import *
 from decouple import config
 import dj_database_url
 
+from .database import apply_sqlite_profile, configure_connections
+
 # Override development settings for production
 
 DEBUG = False
@@ -18,6 +20,35 @@ DATABASES = {
         default=config('DATABASE_URL', default='sqlite:///db.sqlite3')
     )
 }
+if SQLITE_PERFORMANCE_PROFILE:
+    DATABASES['default'] = apply_sqlite_profile(DATABASES['default'])
+
+# Read replicas, e.g. DATABASE_REPLICA_URLS=postgres://...replica1,postgres://...replica2
+DATABASE_REPLICAS = []
+for index, url in enumerate(config('DATABASE_REPLICA_URLS', default='', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()])):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dj_database_url.parse(url)
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+# Connection management: persistent connections with health checks, or psycopg's
+# native pool (Django 5.1+, requires psycopg[pool]) when DATABASE_POOL is enabled
+DATABASE_CONN_MAX_AGE = config('DATABASE_CONN_MAX_AGE', default=60, cast=int)
+DATABASE_CONN_HEALTH_CHECKS = config('DATABASE_CONN_HEALTH_CHECKS', default=True, cast=bool)
+DATABASE_POOL = None
+if config('DATABASE_POOL', default=False, cast=bool):
+    DATABASE_POOL = {
+        'min_size': config('DATABASE_POOL_MIN_SIZE', default=2, cast=int),
+        'max_size': config('DATABASE_POOL_MAX_SIZE', default=10, cast=int),
+        'timeout': config('DATABASE_POOL_TIMEOUT', default=10, cast=int),
+    }
+for alias in DATABASES:
+    DATABASES[alias] = configure_connections(
+        DATABASES[alias],
+        conn_max_age=DATABASE_CONN_MAX_AGE,
+        health_checks=DATABASE_CONN_HEALTH_CHECKS,
+        pool=DATABASE_POOL,
+    )
 
 # Static files (CSS, JavaScript, Images)
 STATIC_ROOT = BASE_DIR / 'staticfiles'
@@ -105,8 +136,8 @@ ADMINS = [
 ]
 MANAGERS = ADMINS
 
-# Performance optimizations
-CONN_MAX_AGE = 60  # Database connection pooling
+# Background tasks run in `manage.py runworker` processes
+TASKS_ALWAYS_EAGER = config('TASKS_ALWAYS_EAGER', default=False, cast=bool)
 
 # File upload limits
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB